@@ -0,0 +1,398 @@
+import json
+import re
+from typing import Optional, Dict, Iterator, List
+
+from langchain_core.tools import BaseTool
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# 对象内部只需要关心这几个字符
+_SPECIAL_CHARS = re.compile(r'[{}"\\]')
+# 含有嵌套对象的 JSON 对象必然以 "键": 开头，否则开头的 "{" 只是散落在文字中的
+_OBJECT_START = re.compile(r"""\{\s*(?:"(?:[^"\\]|\\.)*"|'[^']*')\s*:""")
+_REPAIR_CHARS = re.compile(r'[{}\[\]"\'\\,]')
+_THINK_BLOCK = re.compile(r"<think>.*?(?:</think>|$)", re.S)
+_BARE_LITERALS = re.compile(r"\b(True|False|None)\b")
+_LITERAL_MAP = {"True": "true", "False": "false", "None": "null"}
+
+# 模型常用的参数字段别名
+_PARAM_KEYS = ("params", "parameters", "arguments", "args", "action_input")
+
+
+def strip_reasoning(text: str) -> str:
+    """去掉 <think> 推理段，只保留给用户看的部分"""
+    if THINK_OPEN not in text:
+        return text.strip()
+    return _THINK_BLOCK.sub("", text).strip()
+
+
+class ReasoningSplitter:
+    """把流式输出拆成推理段和正文，标签被切断在分块边界时暂存尾部"""
+
+    def __init__(self):
+        self.in_think = False
+        self._pending = ""
+
+    def feed(self, chunk: str) -> tuple:
+        """返回本块的 (推理文本, 正文文本)"""
+        text = self._pending + chunk
+        self._pending = ""
+        reasoning, content = [], []
+        while text:
+            tag = THINK_CLOSE if self.in_think else THINK_OPEN
+            target = reasoning if self.in_think else content
+            index = text.find(tag)
+            if index >= 0:
+                target.append(text[:index])
+                text = text[index + len(tag):]
+                self.in_think = not self.in_think
+                continue
+            # 末尾可能是半个标签，留到下一块再判断
+            keep = _partial_suffix(text, tag)
+            target.append(text[:len(text) - keep])
+            self._pending = text[len(text) - keep:]
+            break
+        return "".join(reasoning), "".join(content)
+
+    def flush(self) -> tuple:
+        """输出结束时取出暂存的尾部"""
+        pending, self._pending = self._pending, ""
+        return (pending, "") if self.in_think else ("", pending)
+
+
+def _partial_suffix(text: str, tag: str) -> int:
+    """text 末尾与 tag 开头重合的最大长度"""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:size]):
+            return size
+    return 0
+
+
+class ActionParser:
+    """从模型输出中提取动作，并用已绑定工具的参数模型校验
+
+    依次尝试：去掉推理段后在混合文本中查找配平的 JSON 对象、
+    直接解析、修复常见错误（尾逗号、单引号、Python 字面量、缺失的右括号）后再解析。
+    没有绑定工具时只要求对象包含 action 字段。
+    """
+
+    def __init__(self, tools: Optional[List[BaseTool]] = None, max_actions: int = 1):
+        self.tools = {tool.name: tool for tool in tools or []}
+        # 大于 1 时接受 {"actions": [...]} 形式的多个动作
+        self.max_actions = max_actions
+
+    def parse(self, response: str) -> Optional[Dict]:
+        """返回第一个合法动作，找不到时返回 None"""
+        text = response
+        if THINK_OPEN in text:
+            stripped = _THINK_BLOCK.sub("", text)
+            # 推理段没有闭合时，动作可能混在推理内容里
+            text = stripped if "{" in stripped else text.replace(THINK_OPEN, "")
+        for candidate in iter_json_objects(text):
+            action = self.load(candidate)
+            if action is not None:
+                return action
+        return None
+
+    def load(self, candidate: str) -> Optional[Dict]:
+        """解析单个候选对象，失败时修复后重试"""
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            try:
+                data = json.loads(repair_json(candidate))
+            except ValueError:
+                return None
+        return self.validate(data)
+
+    def validate(self, data) -> Optional[Dict]:
+        """统一字段名并校验参数，不合法时返回 None"""
+        if self.max_actions > 1 and isinstance(data, dict) and isinstance(data.get("actions"), list):
+            return self.validate_plan(data)
+        action = normalize_action(data, self.tools)
+        if action is None or not self.tools:
+            return action
+        if action["action"] == "think":
+            return action
+
+        tool = self.tools.get(action["action"])
+        if tool is None:
+            return None
+        if not isinstance(action["params"], dict):
+            return action
+        if isinstance(tool.args_schema, dict):
+            # JSON schema 形式的工具只检查必填字段
+            required = tool.args_schema.get("required", [])
+            return action if all(key in action["params"] for key in required) else None
+        if not isinstance(tool.args_schema, type):
+            return action
+        try:
+            validated = tool.args_schema(**action["params"])
+        except (TypeError, ValueError):
+            return None
+        if hasattr(validated, "model_dump"):
+            dumped = validated.model_dump(exclude_unset=True)
+        else:
+            dumped = validated.dict(exclude_unset=True)
+        # 只保留模型给出的字段（嵌套模型同样不展开未给出的字段），但采用校验后转换过类型的值
+        action["params"] = {key: dumped.get(key, value) for key, value in action["params"].items()}
+        return action
+
+    def validate_plan(self, data: Dict) -> Optional[Dict]:
+        """逐个校验动作列表，保留第一个不合法动作之前的部分，最多 max_actions 个
+
+        返回第一个动作，完整的动作序列放在 actions 字段中。
+        """
+        actions = []
+        for item in data["actions"][:self.max_actions]:
+            action = self.validate(item)
+            if action is None or action["action"] == "think" or "actions" in action:
+                break
+            actions.append(action)
+        if not actions:
+            return None
+        plan = {**actions[0], "actions": actions}
+        if "thought" in data:
+            plan.setdefault("thought", data["thought"])
+        return plan
+
+
+def normalize_action(data, tools: Optional[Dict[str, BaseTool]] = None) -> Optional[Dict]:
+    """把 {"name", "arguments"}、{"工具名": {...}} 等写法统一成 {"action", "params"}"""
+    if not isinstance(data, dict):
+        return None
+    if "action" in data and isinstance(data["action"], str):
+        action = dict(data)
+    elif isinstance(data.get("name"), str) and (
+        any(key in data for key in _PARAM_KEYS) or (tools and data["name"] in tools)
+    ):
+        action = {key: value for key, value in data.items() if key != "name"}
+        action["action"] = data["name"]
+    elif tools and len(data) == 1 and next(iter(data)) in tools:
+        name, params = next(iter(data.items()))
+        action = {"action": name, "params": params if isinstance(params, dict) else {}}
+    elif tools and len(tools) == 1 and set(data) & _param_names(next(iter(tools.values()))):
+        # 只绑定一个工具（如 with_structured_output）时，字段与其参数重合的对象就是它的参数；
+        # 推理中的 {"thought": ...} 等片段仍算作解析失败
+        action = {"action": next(iter(tools)), "params": data}
+    else:
+        return None
+
+    if "params" not in action:
+        for key in _PARAM_KEYS[1:]:
+            if key in action:
+                action["params"] = action.pop(key)
+                break
+        else:
+            action["params"] = {}
+    return action
+
+
+def _param_names(tool: BaseTool) -> set:
+    """工具参数的字段名，args_schema 可能是 pydantic 模型或 JSON schema 字典"""
+    schema = tool.args_schema
+    if isinstance(schema, dict):
+        return set(schema.get("properties", {}))
+    fields = getattr(schema, "model_fields", None) or getattr(schema, "__fields__", None) or {}
+    return set(fields)
+
+
+def iter_json_objects(text: str) -> Iterator[str]:
+    """单遍扫描混合文本，依次产出配平的 {...} 片段
+
+    支持单双引号字符串，文本结束时仍未闭合的对象会补齐右括号后产出，
+    再从它的下一个字符继续扫描：散落在文字中的 "{" 或撇号不会吞掉后面真正的对象。
+    """
+    i = 0
+    length = len(text)
+    while i < length:
+        start = text.find("{", i)
+        if start < 0:
+            return
+        depth = 0
+        quote = None
+        i = start
+        while i < length:
+            char = text[i]
+            if quote:
+                if char == "\\":
+                    i += 2
+                    continue
+                if char == quote:
+                    quote = None
+            elif char == '"' or char == "'":
+                quote = char
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    yield text[start:i + 1]
+                    break
+            i += 1
+        else:
+            if depth > 0:
+                yield text[start:].rstrip().rstrip("`").rstrip() + "}" * depth
+            i = start
+        i += 1
+
+
+def repair_json(candidate: str) -> str:
+    """修复小模型常见的 JSON 错误：单引号、尾逗号、True/False/None"""
+    out = []
+    i = 0
+    length = len(candidate)
+    while i < length:
+        match = _REPAIR_CHARS.search(candidate, i)
+        if match is None:
+            out.append(_BARE_LITERALS.sub(_literal, candidate[i:]))
+            break
+        out.append(_BARE_LITERALS.sub(_literal, candidate[i:match.start()]))
+        i = match.start()
+        char = candidate[i]
+        if char == '"' or char == "'":
+            end, value = _read_string(candidate, i, char)
+            out.append(json.dumps(value, ensure_ascii=False))
+            i = end
+            continue
+        if char == ",":
+            # 跳过紧跟在 } 或 ] 前面的逗号
+            j = i + 1
+            while j < length and candidate[j].isspace():
+                j += 1
+            if j < length and candidate[j] in "}]":
+                i = j
+                continue
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def _read_string(text: str, start: int, quote: str) -> tuple:
+    """读取从 start 开始的字符串字面量，返回 (结束位置, 字符串值)"""
+    chars = []
+    i = start + 1
+    while i < len(text):
+        char = text[i]
+        if char == "\\" and i + 1 < len(text):
+            chars.append(text[i:i + 2])
+            i += 2
+            continue
+        if char == quote:
+            break
+        if char == '"':
+            chars.append('\\"')
+        else:
+            chars.append(char)
+        i += 1
+    raw = "".join(chars).replace("\\'", "'")
+    try:
+        value = json.loads(f'"{raw}"', strict=False)
+    except ValueError:
+        value = raw
+    return i + 1, value
+
+
+def _literal(match) -> str:
+    return _LITERAL_MAP[match.group(1)]
+
+
+class ActionScanner:
+    """增量扫描模型的流式输出，找到第一个完整的 {"action": ...} 对象
+
+    跳过 <think> 推理段，在对象外部用 str.find 跳到下一个 "{"，
+    对象内部只在括号、引号和转义符处停下，每个字符最多扫描一次。
+    与 iter_json_objects 一样不让散落的 "{" 吞掉后面的对象：遇到嵌套的 "{" 时外层若不以 "键": 开头，
+    就丢弃外层，从这个 "{" 重新开始。
+    传入 parser 时，候选对象经其修复和校验后才算找到。
+    """
+
+    def __init__(self, parser: Optional[ActionParser] = None):
+        self.parser = parser
+        self.text = ""
+        self.action: Optional[Dict] = None
+        self._pos = 0
+        self._depth = 0
+        self._start = 0
+        self._in_string = False
+        self._in_think = False
+
+    def feed(self, chunk: str) -> Optional[Dict]:
+        """追加一段输出，找到动作后返回该动作，否则返回 None"""
+        if self.action is not None:
+            return self.action
+        self.text += chunk
+        text = self.text
+        i = self._pos
+
+        while i < len(text):
+            if self._depth == 0:
+                if self._in_think:
+                    end = text.find(THINK_CLOSE, i)
+                    if end < 0:
+                        # 保留可能被截断的结束标签
+                        self._pos = max(i, len(text) - len(THINK_CLOSE) + 1)
+                        return None
+                    self._in_think = False
+                    i = end + len(THINK_CLOSE)
+                    continue
+
+                brace = text.find("{", i)
+                think = text.find(THINK_OPEN, i)
+                if think >= 0 and (brace < 0 or think < brace):
+                    self._in_think = True
+                    i = think + len(THINK_OPEN)
+                    continue
+                if brace < 0:
+                    self._pos = max(i, len(text) - len(THINK_OPEN) + 1)
+                    return None
+                self._start = brace
+                self._depth = 1
+                i = brace + 1
+                continue
+
+            match = _SPECIAL_CHARS.search(text, i)
+            if match is None:
+                i = len(text)
+                break
+            i = match.start()
+            char = text[i]
+            if char == "\\":
+                if i + 1 >= len(text):
+                    # 转义符后面的字符还没到
+                    self._pos = i
+                    return None
+                i += 2
+                continue
+            if char == '"':
+                self._in_string = not self._in_string
+            elif not self._in_string:
+                if char == "{":
+                    if self._depth == 1 and not _OBJECT_START.match(text, self._start):
+                        self._start = i
+                    else:
+                        self._depth += 1
+                elif char == "}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        action = self._load(text[self._start:i + 1])
+                        if action is not None:
+                            self.action = action
+                            self._pos = i + 1
+                            return action
+            i += 1
+
+        self._pos = i
+        return None
+
+    def _load(self, candidate: str) -> Optional[Dict]:
+        if self.parser is not None:
+            return self.parser.load(candidate)
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            return None
+        if isinstance(data, dict) and "action" in data:
+            return data
+        return None
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from browser_use.agent.message_manager.views import MessageMetadata
+from browser_use.agent.views import ActionResult, AgentHistoryList
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+from trajectory_cache import normalize_task
+
+CHECKPOINT_DIR = Path(os.getenv("AGENT_CHECKPOINT_DIR", ".checkpoints"))
+
+# 恢复 localStorage：每个源在本标签页只写入一次，之后页面自己的修改不会被覆盖
+_LOCAL_STORAGE_SCRIPT = """
+(() => {
+    const origins = %s;
+    try {
+        const items = origins[location.origin];
+        if (!items || sessionStorage.getItem("__checkpoint_restored__")) return;
+        for (const [name, value] of items) localStorage.setItem(name, value);
+        sessionStorage.setItem("__checkpoint_restored__", "1");
+    } catch (e) {}
+})();
+"""
+
+
+def _load_history(data: Dict[str, Any], output_model) -> AgentHistoryList:
+    """与 AgentHistoryList.load_from_file 相同：按 Agent 的自定义动作模型校验模型输出"""
+    for item in data["history"]:
+        if isinstance(item["model_output"], dict):
+            item["model_output"] = output_model.model_validate(item["model_output"])
+        else:
+            item["model_output"] = None
+        item["state"].setdefault("interacted_element", None)
+    return AgentHistoryList.model_validate(data)
+
+
+class AgentCheckpoint:
+    """定期保存 Agent 的运行状态，中途失败或进程退出后从最后一个成功的步骤继续
+
+    attach 包装 agent.step，每 every 个没有出错的步骤写一次检查点：Agent 的历史和消息、
+    上一步的动作结果、当前页面地址、浏览器的 cookies 和 localStorage，以及模型
+    （DeepseekToolWrapper）的对话状态。出错的步骤不保存，检查点始终停在最后一个成功的步骤；
+    任务成功完成后删除检查点。
+
+    resume 在新的 Agent 上恢复这些状态、打开当时的页面，再用剩余的步数继续 agent.run。
+    检查点按任务文本保存在 directory 下，其中包含登录 cookies，只对当前用户可读。
+    """
+
+    def __init__(self, directory: Optional[str] = None, every: int = 1):
+        self.directory = Path(directory) if directory else CHECKPOINT_DIR
+        self.every = max(every, 1)
+        self.stats = {"saved": 0, "resumed": 0, "resumed_from_step": None}
+
+    def path(self, task: str) -> Path:
+        name = hashlib.sha1(normalize_task(task).encode("utf-8")).hexdigest()[:16]
+        return self.directory / f"{name}.json"
+
+    def exists(self, task: str) -> bool:
+        return self.path(task).exists()
+
+    def load(self, task: str) -> Optional[Dict[str, Any]]:
+        try:
+            state = json.loads(self.path(task).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        # 文件名冲突或任务改过时不恢复
+        return state if normalize_task(state.get("task", "")) == normalize_task(task) else None
+
+    def clear(self, task: str):
+        try:
+            self.path(task).unlink()
+        except FileNotFoundError:
+            pass
+
+    def attach(self, agent):
+        """每个成功的步骤之后保存检查点"""
+        step = agent.step
+        succeeded = 0
+
+        async def checkpointed_step(*args, **kwargs):
+            nonlocal succeeded
+            await step(*args, **kwargs)
+            history = agent.history.history
+            if agent.consecutive_failures or not history or any(result.error for result in history[-1].result):
+                return
+            if agent.history.is_done():
+                self.clear(agent.task)
+                return
+            succeeded += 1
+            if succeeded % self.every == 0:
+                await self.save(agent)
+
+        agent.step = checkpointed_step
+        return agent
+
+    async def save(self, agent):
+        messages = agent.message_manager.history.messages
+        page = await agent.browser_context.get_current_page()
+        session = await agent.browser_context.get_session()
+        state = {
+            "task": agent.task,
+            "n_steps": agent.n_steps,
+            "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "url": page.url,
+            "storage_state": await session.context.storage_state(),
+            "history": agent.history.model_dump(),
+            "messages": messages_to_dict([managed.message for managed in messages]),
+            "message_tokens": [managed.metadata.input_tokens for managed in messages],
+            "tool_id": agent.message_manager.tool_id,
+            "last_result": [result.model_dump() for result in agent._last_result or []],
+            "llm_state": agent.llm.export_state() if hasattr(agent.llm, "export_state") else None,
+        }
+        path = self.path(agent.task)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_suffix(".tmp")
+        # 先建好只有自己可读的文件再写入，避免 cookies 短暂对其他用户可见
+        fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp, path)
+        self.stats["saved"] += 1
+
+    async def restore(self, agent, state: Dict[str, Any]):
+        """把检查点中的状态写回 Agent 和它的浏览器"""
+        message_history = agent.message_manager.history
+        message_history.messages.clear()
+        message_history.total_tokens = 0
+        for message, tokens in zip(messages_from_dict(state["messages"]), state["message_tokens"]):
+            message_history.add_message(message, MessageMetadata(input_tokens=tokens))
+        agent.message_manager.tool_id = state["tool_id"]
+        agent.history = _load_history(state["history"], agent.AgentOutput)
+        agent._last_result = [ActionResult(**result) for result in state["last_result"]] or None
+        agent.n_steps = state["n_steps"]
+        agent.consecutive_failures = 0
+        if state.get("llm_state") and hasattr(agent.llm, "load_state"):
+            agent.llm.load_state(state["llm_state"])
+
+        session = await agent.browser_context.get_session()
+        storage = state.get("storage_state") or {}
+        if storage.get("cookies"):
+            await session.context.add_cookies(storage["cookies"])
+        origins = {
+            origin["origin"]: [[item["name"], item["value"]] for item in origin.get("localStorage", [])]
+            for origin in storage.get("origins", [])
+        }
+        if origins:
+            await session.context.add_init_script(_LOCAL_STORAGE_SCRIPT % json.dumps(origins, ensure_ascii=False))
+        if state["url"] and state["url"] != "about:blank":
+            page = await agent.browser_context.get_current_page()
+            await page.goto(state["url"])
+            await page.wait_for_load_state()
+
+    async def resume(self, agent, max_steps: int = 100) -> AgentHistoryList:
+        """有检查点时恢复后继续运行，总步数仍以 max_steps 为上限；没有检查点时等同 agent.run"""
+        state = self.load(agent.task)
+        if state is not None:
+            await self.restore(agent, state)
+            done = state["n_steps"] - 1
+            max_steps = max(max_steps - done, 1)
+            self.stats["resumed"] += 1
+            self.stats["resumed_from_step"] = done
+        return await agent.run(max_steps=max_steps)
+
+    def summary(self) -> str:
+        stats = self.stats
+        resumed = f"，从第 {stats['resumed_from_step']} 步之后恢复" if stats["resumed"] else ""
+        return f"检查点：保存 {stats['saved']} 次{resumed}"
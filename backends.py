@@ -0,0 +1,62 @@
+import os
+from typing import Any, Callable, Dict, Optional
+
+# 各脚本中用到的模型后端，按名称创建；依赖在工厂函数内部导入，只加载选中的后端
+
+# 与各入口脚本一致的 Agent 参数，放在这里使命令行入口不必为它导入 batch_runner
+DEFAULT_AGENT_OPTIONS: Dict[str, Any] = {
+    "use_vision": False,
+    "max_failures": 3,
+    "max_actions_per_step": 4,
+    "generate_gif": False,
+}
+
+
+def _ollama(model: Optional[str] = None, **kwargs: Any):
+    from langchain_ollama import ChatOllama
+
+    # 增加上下文窗口，防止任务过长被截断
+    return ChatOllama(model=model or "qwen2:7b", num_ctx=32000, **kwargs)
+
+
+def _deepseek_r1_tool_calling(model: Optional[str] = None, **kwargs: Any):
+    return _ollama(model=model or "MFDoom/deepseek-r1-tool-calling:7b", **kwargs)
+
+
+def _wrapper(model: Optional[str] = None, **kwargs: Any):
+    from deepseek_wrapper import DeepseekToolWrapper
+
+    return DeepseekToolWrapper(model_name=model or "deepseek-r1:1.5b", **kwargs)
+
+
+def _deepseek_api(model: Optional[str] = None, **kwargs: Any):
+    from dotenv import load_dotenv
+    from langchain_openai import ChatOpenAI
+    from pydantic import SecretStr
+
+    load_dotenv()
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    if not api_key:
+        raise ValueError("请在.env文件中设置DEEPSEEK_API_KEY")
+    kwargs.setdefault("temperature", 0.2)
+    kwargs.setdefault("base_url", "https://api.deepseek.com/v1")
+    return ChatOpenAI(
+        model=model or "deepseek-reasoner",
+        openai_api_key=SecretStr(api_key),
+        **kwargs
+    )
+
+
+BACKENDS: Dict[str, Callable[..., Any]] = {
+    "ollama": _ollama,
+    "deepseek-r1-tool-calling": _deepseek_r1_tool_calling,
+    "wrapper": _wrapper,
+    "deepseek-api": _deepseek_api,
+}
+
+
+def create_llm(backend: str, model: Optional[str] = None, **kwargs: Any):
+    """按后端名称创建聊天模型，model 为空时使用该后端的默认模型"""
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的模型后端 {backend}，可选：{', '.join(BACKENDS)}")
+    return BACKENDS[backend](model=model, **kwargs)
@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from browser_use import Agent, Browser, BrowserConfig
+from browser_use.browser.context import BrowserContext, BrowserContextConfig
+
+from backends import BACKENDS, DEFAULT_AGENT_OPTIONS, create_llm
+from instrumentation import MetricsCallback, RunMetrics, instrument_agent
+from ollama_pool import close_async_pools
+from page_guard import guard_page_changes
+
+class ContextPool:
+    """共享一个浏览器进程，最多同时打开 size 个相互隔离的浏览器上下文
+
+    每个任务拿到一个全新的上下文（独立的 cookie 和存储），用完即关闭，
+    浏览器进程只启动一次。注意需使用 Playwright 标准启动方式：
+    chrome_instance_path 模式下 browser-use 会让所有上下文共用同一个默认上下文。
+    """
+
+    def __init__(self, browser: Browser, size: int, config: Optional[BrowserContextConfig] = None):
+        self.browser = browser
+        self.size = size
+        self.config = config or BrowserContextConfig()
+        self.in_use = 0
+        self.created = 0
+        self._semaphore = asyncio.Semaphore(size)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[BrowserContext]:
+        async with self._semaphore:
+            context = BrowserContext(browser=self.browser, config=self.config)
+            self.in_use += 1
+            self.created += 1
+            try:
+                yield context
+            finally:
+                self.in_use -= 1
+                await context.close()
+
+
+def load_tasks(path: str) -> List[Dict[str, Any]]:
+    """读取任务文件，每行 {"id": ..., "task": ...}，缺少 id 时使用行号"""
+    tasks = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if line.strip():
+                item = json.loads(line)
+                item.setdefault("id", line_no)
+                tasks.append(item)
+    return tasks
+
+
+def completed_ids(output_path: str) -> Set[Any]:
+    """结果文件即检查点：已写入结果（无论成败）的任务在续跑时跳过"""
+    if not os.path.exists(output_path):
+        return set()
+    done = set()
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                # 进程被杀时最后一行可能只写了一半
+                continue
+    return done
+
+
+async def run_task(
+    pool: ContextPool,
+    llm,
+    item: Dict[str, Any],
+    max_steps: int,
+    agent_options: Dict[str, Any],
+    metrics: Optional[RunMetrics] = None,
+) -> Dict[str, Any]:
+    """在池中的一个上下文里运行单个任务，异常也记录为结果而不是中断整个批次"""
+    start = time.perf_counter()
+    record: Dict[str, Any] = {"id": item["id"], "task": item["task"]}
+    try:
+        async with pool.acquire() as context:
+            agent = guard_page_changes(Agent(task=item["task"], llm=llm, browser_context=context, **agent_options))
+            if metrics is not None:
+                instrument_agent(agent, metrics)
+            history = await agent.run(max_steps=item.get("max_steps", max_steps))
+        record.update(
+            success=history.is_done(),
+            result=history.final_result(),
+            errors=[error for error in history.errors() if error],
+            steps=len(history.history),
+        )
+    except Exception as e:
+        record.update(success=False, result=None, errors=[f"{type(e).__name__}: {e}"], steps=0)
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+async def run_batch(
+    tasks: List[Dict[str, Any]],
+    output_path: str,
+    llm,
+    concurrency: int = 4,
+    max_steps: int = 30,
+    browser: Optional[Browser] = None,
+    agent_options: Optional[Dict[str, Any]] = None,
+    metrics: Optional[RunMetrics] = None,
+) -> Dict[str, Any]:
+    """并发运行一批任务，每完成一个就追加一行结果到 output_path，返回吞吐统计"""
+    own_browser = browser is None
+    browser = browser or Browser(config=BrowserConfig(headless=True))
+    pool = ContextPool(browser, concurrency)
+    options = {**DEFAULT_AGENT_OPTIONS, **(agent_options or {})}
+
+    start = time.perf_counter()
+    succeeded = 0
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            pending = [asyncio.create_task(run_task(pool, llm, item, max_steps, options, metrics)) for item in tasks]
+            for finished in asyncio.as_completed(pending):
+                record = await finished
+                succeeded += record["success"]
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        if own_browser:
+            await browser.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "tasks": len(tasks),
+        "succeeded": succeeded,
+        "seconds": round(elapsed, 3),
+        "tasks_per_minute": round(len(tasks) / elapsed * 60, 2) if elapsed else 0.0,
+    }
+
+
+async def _run_shard(
+    shard: int,
+    tasks: List[Dict[str, Any]],
+    backend: str,
+    model: Optional[str],
+    concurrency: int,
+    max_steps: int,
+    agent_options: Dict[str, Any],
+    llm_options: Dict[str, Any],
+    messages,
+):
+    metrics = RunMetrics()
+    llm = create_llm(backend, model=model, callbacks=[MetricsCallback(metrics)], **llm_options)
+    browser = Browser(config=BrowserConfig(headless=True))
+    pool = ContextPool(browser, concurrency)
+    # 拿到上下文之前不上报开始，进程异常退出时只有真正在运行的任务计入重试次数
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run_one(item: Dict[str, Any]):
+        async with limit:
+            messages.put(("start", shard, item["id"]))
+            record = await run_task(pool, llm, item, max_steps, agent_options, metrics)
+            record["worker"] = os.getpid()
+            messages.put(("result", shard, record))
+
+    try:
+        await asyncio.gather(*(run_one(item) for item in tasks))
+    finally:
+        await browser.close()
+        await close_async_pools()
+        messages.put(("metrics", shard, {"events": metrics.events, "counters": dict(metrics.counters)}))
+
+
+def _shard_worker(shard: int, tasks: List[Dict[str, Any]], *args):
+    """工作进程入口：独立的事件循环、浏览器和模型客户端"""
+    asyncio.run(_run_shard(shard, tasks, *args))
+
+
+def run_sharded(
+    tasks: List[Dict[str, Any]],
+    output_path: str,
+    backend: str,
+    model: Optional[str] = None,
+    processes: Optional[int] = None,
+    concurrency: int = 4,
+    max_steps: int = 30,
+    agent_options: Optional[Dict[str, Any]] = None,
+    max_retries: int = 1,
+    metrics: Optional[RunMetrics] = None,
+    llm_options: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """把任务分片到多个工作进程运行，结果由主进程统一追加到 output_path
+
+    页面状态序列化和提示词构建是 CPU 密集的 Python 代码，单进程很快占满一个核，
+    这里每个进程各自运行一个浏览器和 concurrency 个 Agent。工作进程异常退出时，
+    其分片中尚未完成的任务交给新的工作进程；崩溃时正在运行的任务最多重试 max_retries 次，
+    之后记为失败，避免一个总让浏览器崩溃的任务反复拖垮工作进程。
+    模型在各工作进程中按 backend 创建，llm_options（如 base_url）需可序列化。
+    """
+    processes = max(1, min(processes or os.cpu_count() or 1, len(tasks)))
+    # 工作进程中要启动浏览器和事件循环，使用 spawn 而不是 fork
+    context = multiprocessing.get_context("spawn")
+    messages = context.Queue()
+    options = {**DEFAULT_AGENT_OPTIONS, **(agent_options or {})}
+    by_id = {item["id"]: item for item in tasks}
+    attempts: Dict[Any, int] = {}
+    finished: Set[Any] = set()
+    workers: Dict[int, Dict[str, Any]] = {}
+    shards = itertools.count()
+    succeeded = restarts = 0
+
+    def spawn(items: List[Dict[str, Any]]):
+        shard = next(shards)
+        process = context.Process(
+            target=_shard_worker,
+            args=(shard, items, backend, model, concurrency, max_steps, options, llm_options or {}, messages),
+            name=f"batch-shard-{shard}",
+        )
+        process.start()
+        workers[shard] = {"process": process, "ids": [item["id"] for item in items], "started": set()}
+
+    start = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        def write(record: Dict[str, Any]):
+            nonlocal succeeded
+            # 进程崩溃前已发出但未确认的结果可能在重试后再到达一次
+            if record["id"] in finished:
+                return
+            finished.add(record["id"])
+            succeeded += bool(record["success"])
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+        def handle(kind: str, shard: int, payload: Any):
+            if kind == "start":
+                workers[shard]["started"].add(payload)
+            elif kind == "result":
+                write(payload)
+            elif kind == "metrics" and metrics is not None:
+                metrics.merge(payload["events"], payload["counters"])
+
+        for index in range(processes):
+            spawn(tasks[index::processes])
+        try:
+            while workers:
+                try:
+                    handle(*messages.get(timeout=0.5))
+                    continue
+                except queue.Empty:
+                    pass
+
+                dead = [shard for shard, worker in workers.items() if not worker["process"].is_alive()]
+                for shard in dead:
+                    workers[shard]["process"].join()
+                # 进程可能在上面 get 超时之后、is_alive 检查之前发出最后的结果并退出，
+                # 先取完队列中剩余的消息，再计算已退出进程中未完成的任务
+                while dead:
+                    try:
+                        handle(*messages.get_nowait())
+                    except queue.Empty:
+                        break
+                for shard in dead:
+                    worker = workers.pop(shard)
+                    process = worker["process"]
+                    remaining = [task_id for task_id in worker["ids"] if task_id not in finished]
+                    if not remaining:
+                        continue
+                    retry = []
+                    for task_id in remaining:
+                        if task_id in worker["started"]:
+                            attempts[task_id] = attempts.get(task_id, 0) + 1
+                            if attempts[task_id] > max_retries:
+                                write({
+                                    "id": task_id, "task": by_id[task_id]["task"], "success": False, "result": None,
+                                    "errors": [f"工作进程异常退出（exitcode={process.exitcode}）"], "steps": 0, "seconds": 0.0,
+                                })
+                                continue
+                        retry.append(by_id[task_id])
+                    if retry:
+                        restarts += 1
+                        spawn(retry)
+        finally:
+            for worker in workers.values():
+                worker["process"].terminate()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "tasks": len(tasks),
+        "succeeded": succeeded,
+        "seconds": round(elapsed, 3),
+        "tasks_per_minute": round(len(tasks) / elapsed * 60, 2) if elapsed else 0.0,
+        "processes": processes,
+        "restarts": restarts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享浏览器并发运行 JSONL 任务文件")
+    parser.add_argument("tasks", help="任务文件，每行 {\"id\": ..., \"task\": ...}")
+    parser.add_argument("--output", default="results.jsonl", help="结果文件，按完成顺序逐行追加")
+    parser.add_argument("--concurrency", type=int, default=4, help="每个进程中同时运行的 agent 数量")
+    parser.add_argument("--processes", type=int, default=1, help="工作进程数，大于 1 时按进程分片运行，0 表示 CPU 核数")
+    parser.add_argument("--resume", action="store_true", help="跳过结果文件中已有结果的任务")
+    parser.add_argument("--max-retries", type=int, default=1, help="工作进程崩溃时正在运行的任务最多重试次数")
+    parser.add_argument("--metrics", help="把各阶段耗时写入 JSONL，结束时打印汇总")
+    parser.add_argument("--backend", default="ollama", choices=list(BACKENDS))
+    parser.add_argument("--model", help="覆盖后端的默认模型")
+    parser.add_argument("--max-steps", type=int, default=30)
+    args = parser.parse_args()
+
+    tasks = load_tasks(args.tasks)
+    if args.resume:
+        done = completed_ids(args.output)
+        tasks = [item for item in tasks if item["id"] not in done]
+        print(f"续跑：跳过 {len(done)} 个已完成的任务，剩余 {len(tasks)} 个")
+    if not tasks:
+        return
+
+    metrics = RunMetrics(args.metrics) if args.metrics else None
+    if args.processes != 1:
+        summary = run_sharded(
+            tasks, args.output, args.backend, model=args.model, processes=args.processes or None,
+            concurrency=args.concurrency, max_steps=args.max_steps, max_retries=args.max_retries, metrics=metrics,
+        )
+    else:
+        llm = create_llm(args.backend, model=args.model, callbacks=[MetricsCallback(metrics)] if metrics else None)
+
+        async def run():
+            try:
+                return await run_batch(
+                    tasks, args.output, llm, concurrency=args.concurrency, max_steps=args.max_steps, metrics=metrics
+                )
+            finally:
+                # 关闭包装器在本事件循环中共享的 Ollama 连接
+                await close_async_pools()
+
+        summary = asyncio.run(run())
+    print(f"\n批量执行完成：{summary}")
+    if metrics is not None:
+        print(metrics.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import re
+import sys
+
+from deepseek_wrapper import DeepseekToolWrapper
+from fake_ollama import FakeOllama
+from main import create_agent_executor
+
+TASKS = [("23+45", 68), ("12*7", 84), ("2**10", 1024), ("(100-1)/9", 11.0)]
+# 每个任务：一次调用给出计算器的工具调用，一次调用看到结果后给出最终回答
+EXPECTED_CALLS = 2
+
+
+def scripted_model(body: dict) -> str:
+    """模拟本地模型：先调用计算器，看到工具结果后给出最终回答"""
+    prompt = body["prompt"]
+    result = re.findall(r"Tool\(Calculator\): (.+)", prompt)
+    if result:
+        return f"<think>计算器已经给出结果。</think>\n答案是 {result[-1].strip()}。"
+    expression = re.findall(r"Human: 计算(.+?)是多少", prompt)[-1]
+    return (
+        "<think>这是一个算术问题，应该使用计算器。</think>\n"
+        f'{{"action": "Calculator", "params": {{"query": "{expression}"}}, "thought": "调用计算器"}}'
+    )
+
+
+def run_tasks() -> list:
+    """对桩服务依次运行 TASKS，返回每个任务的 (表达式, 模型调用次数, 是否解决, 输出)"""
+    results = []
+    with FakeOllama(responses=[scripted_model]) as server:
+        executor = create_agent_executor(DeepseekToolWrapper(base_url=server.url), verbose=False)
+        for expression, expected in TASKS:
+            calls_before = len(server.requests)
+            result = executor.invoke({"input": f"计算{expression}是多少?"})
+            calls = len(server.requests) - calls_before
+            results.append((expression, calls, str(expected) in result["output"], result["output"].strip()))
+    return results
+
+
+def test_agent_calls():
+    """每个任务恰好调用模型 EXPECTED_CALLS 次（一次给出工具调用、一次给出答案）并得到正确结果，
+    退回到每步两次调用（如先输出文字再解析动作）时失败"""
+    for expression, calls, solved, output in run_tasks():
+        assert solved, f"{expression} 未解决，输出：{output}"
+        assert calls == EXPECTED_CALLS, f"{expression} 调用模型 {calls} 次，应为 {EXPECTED_CALLS} 次"
+
+
+def main():
+    results = run_tasks()
+    for expression, calls, solved, output in results:
+        print(f"{expression:<10} 模型调用 {calls} 次 | {'已解决' if solved else '未解决'} | 输出: {output}")
+    print(f"平均每个任务调用模型 {sum(calls for _, calls, _, _ in results) / len(results):.1f} 次")
+    failures = [
+        f"{expression} {'未解决' if not solved else f'调用模型 {calls} 次，应为 {EXPECTED_CALLS} 次'}"
+        for expression, calls, solved, _ in results
+        if not solved or calls != EXPECTED_CALLS
+    ]
+    for failure in failures:
+        print(f"失败：{failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
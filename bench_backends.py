@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Union
+
+from browser_use import Agent, Browser, BrowserConfig
+
+from backends import create_llm
+from batch_runner import DEFAULT_AGENT_OPTIONS, ContextPool
+from fake_ollama import FakeOllama
+from instrumentation import MetricsCallback, RunMetrics, instrument_agent
+from page_guard import guard_page_changes
+from replay import Cassette, RecordingProxy
+
+# 仿照 localTest2.py 中 bilibili 任务的本地静态站点，运行时不访问外网
+SITE = {
+    "index.html": "<html><head><title>AI-ToolKit 首页</title></head><body><h1>AI-ToolKit</h1><a href='search.html'>搜索</a></body></html>",
+    "search.html": (
+        "<html><head><title>搜索</title></head><body>"
+        "<input id='q' placeholder='搜索视频或用户'>"
+        "<button onclick=\"location.href='results.html?q='+encodeURIComponent(document.getElementById('q').value)\">搜索</button>"
+        "</body></html>"
+    ),
+    "results.html": (
+        "<html><head><title>搜索结果</title></head><body><p>找到 3 个结果</p>"
+        "<a href='video1.html'>AI-ToolKit 入门教程</a><a href='video2.html'>AI-ToolKit 进阶</a><a href='video3.html'>AI-ToolKit 实战</a>"
+        "</body></html>"
+    ),
+    "video1.html": "<html><head><title>AI-ToolKit 入门教程</title></head><body><h1>AI-ToolKit 入门教程</h1><span>时长 12:34</span></body></html>",
+    "video2.html": "<html><head><title>AI-ToolKit 进阶</title></head><body><h1>AI-ToolKit 进阶</h1><span>时长 20:01</span></body></html>",
+    "video3.html": "<html><head><title>AI-ToolKit 实战</title></head><body><h1>AI-ToolKit 实战</h1><span>时长 31:15</span></body></html>",
+}
+
+# 固定任务集，最终结果包含 expect 即视为成功
+TASKS: List[Dict[str, str]] = [
+    {"id": "title", "task": "打开 {base_url}/index.html 并返回页面标题", "expect": "AI-ToolKit 首页"},
+    {"id": "search", "task": "打开 {base_url}/search.html，在搜索框输入 'AI-ToolKit' 并点击搜索，返回结果数量", "expect": "3"},
+    {"id": "video", "task": "打开 {base_url}/results.html，点击第一个视频，返回视频标题和播放时长", "expect": "12:34"},
+]
+
+DEFAULT_BACKENDS = ["ollama", "wrapper", "deepseek-r1-tool-calling"]
+
+# 录制的响应：字符串（/api/generate 文本）或 {"content": ..., "tool_calls": [...]}（/api/chat）
+Recorded = Union[str, Dict[str, Any]]
+
+
+def load_recordings(path: str) -> Dict[str, Dict[str, List[Recorded]]]:
+    """读取录制文件，每行 {"backend", "task", "step", "response"}，返回 {后端: {任务: [按步骤排序的响应]}}"""
+    rows = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                rows[(row["backend"], row["task"])].append(row)
+    recordings: Dict[str, Dict[str, List[Recorded]]] = defaultdict(dict)
+    for (backend, task), items in rows.items():
+        recordings[backend][task] = [item["response"] for item in sorted(items, key=lambda item: item["step"])]
+    return recordings
+
+
+def _substitute(value: Any, base_url: str) -> Any:
+    """把录制时的站点地址占位符 {base_url} 替换为本次运行的地址"""
+    if isinstance(value, str):
+        return value.replace("{base_url}", base_url)
+    if isinstance(value, list):
+        return [_substitute(item, base_url) for item in value]
+    if isinstance(value, dict):
+        return {key: _substitute(item, base_url) for key, item in value.items()}
+    return value
+
+
+class ReplayScript:
+    """FakeOllama 的脚本化响应：根据请求中出现的任务文本，按顺序回放该任务录制的响应
+
+    某个任务的录制用完后一直返回最后一条（通常是 done），避免卡住。
+    """
+
+    def __init__(self, recordings: Dict[str, List[Recorded]], tasks: List[Dict[str, str]], base_url: str):
+        self.recordings = recordings
+        self.tasks = tasks
+        self.base_url = base_url
+        self.served: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __call__(self, body: dict) -> Recorded:
+        text = json.dumps(body, ensure_ascii=False)
+        task_id = next((task["id"] for task in self.tasks if task["task"] in text), None)
+        responses = self.recordings.get(task_id)
+        if not responses:
+            raise KeyError(f"请求中没有找到有录制响应的任务：{task_id}")
+        with self._lock:
+            index = min(self.served[task_id], len(responses) - 1)
+            self.served[task_id] += 1
+        return _substitute(responses[index], self.base_url)
+
+
+def recorded_response(entry: Dict[str, Any]) -> Recorded:
+    """把 RecordingProxy 录制的一次 Ollama 流式响应还原为 load_recordings 的格式"""
+    lines = [json.loads(line) for line in entry["body"].splitlines() if line.strip()]
+    if entry["path"].endswith("/api/chat"):
+        messages = [line.get("message") or {} for line in lines]
+        tool_calls = [call for message in messages for call in message.get("tool_calls") or []]
+        content = "".join(message.get("content", "") for message in messages)
+        return {"content": content, "tool_calls": tool_calls} if tool_calls else content
+    return "".join(line.get("response", "") for line in lines)
+
+
+def write_recordings(path: str, backend: str, recorded: Dict[str, List[Recorded]], base_url: str):
+    """把真实模型的响应写成录制文件，站点地址换回占位符 {base_url}，之后可以离线回放"""
+    with open(path, "w", encoding="utf-8") as f:
+        for task, responses in recorded.items():
+            for step, response in enumerate(responses, 1):
+                response = json.loads(json.dumps(response, ensure_ascii=False).replace(base_url, "{base_url}"))
+                row = {"backend": backend, "task": task, "step": step, "response": response}
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def start_site() -> tuple:
+    """在临时目录写出 SITE 并启动本地服务，返回 (服务, 根地址)"""
+    root = tempfile.mkdtemp(prefix="bench_backends_")
+    for name, html in SITE.items():
+        with open(os.path.join(root, name), "w", encoding="utf-8") as f:
+            f.write(html)
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=root)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def run_backend(
+    backend: str,
+    recordings: Dict[str, List[Recorded]],
+    tasks: List[Dict[str, str]],
+    browser: Browser,
+    base_url: str,
+    max_steps: int,
+    server_options: Dict[str, Any],
+    llm_options: Optional[Dict[str, Any]] = None,
+    agent_options: Optional[Dict[str, Any]] = None,
+    upstream: Optional[str] = None,
+) -> Dict[str, Any]:
+    """依次运行任务集，返回该后端的汇总指标和每个任务的结果
+
+    llm_options 传给 create_llm，agent_options 覆盖 DEFAULT_AGENT_OPTIONS。
+    给出 upstream（真实 Ollama 地址）时不回放录制，经 RecordingProxy 请求真实模型，
+    结果中的 recorded 为各任务实际收到的响应，可用 write_recordings 保存。
+    """
+    metrics = RunMetrics()
+    results = []
+    pool = ContextPool(browser, 1)
+    if upstream:
+        cassette = Cassette(tempfile.mkstemp(prefix="bench_backends_", suffix=".jsonl")[1])
+        server = RecordingProxy(upstream, cassette)
+    else:
+        server = FakeOllama(responses=[ReplayScript(recordings, tasks, base_url)], **server_options).start()
+    recorded: Dict[str, List[Recorded]] = {}
+    try:
+        llm = create_llm(backend, base_url=server.url, callbacks=[MetricsCallback(metrics)], **(llm_options or {}))
+        start = time.perf_counter()
+        for task in tasks:
+            task_start = time.perf_counter()
+            seen = len(cassette.entries["llm"]) if upstream else 0
+            async with pool.acquire() as context:
+                agent = Agent(
+                    task=task["task"], llm=llm, browser_context=context, **{**DEFAULT_AGENT_OPTIONS, **(agent_options or {})}
+                )
+                guard_page_changes(agent)
+                instrument_agent(agent, metrics)
+                history = await agent.run(max_steps=max_steps)
+            if upstream:
+                recorded[task["id"]] = [recorded_response(entry) for entry in cassette.entries["llm"][seen:]]
+            final = history.final_result() or ""
+            results.append({
+                "id": task["id"],
+                "success": history.is_done() and task["expect"] in final,
+                "steps": len(history.history),
+                "seconds": round(time.perf_counter() - task_start, 3),
+                "result": final,
+            })
+        elapsed = time.perf_counter() - start
+    finally:
+        if upstream:
+            server.close()
+        else:
+            server.stop()
+
+    counters = metrics.counters
+    if upstream:
+        entries = cassette.entries["llm"]
+        requests = [entry["request"] for entry in entries]
+        # 真实服务的预填充 token 数取自每次响应最后一行的 prompt_eval_count
+        prompt_tokens = sum(
+            json.loads(entry["body"].strip().splitlines()[-1]).get("prompt_eval_count", 0)
+            for entry in entries if entry["body"].strip()
+        )
+    else:
+        requests = server.requests
+        prompt_tokens = server.prompt_chars_evaluated // 4
+    return {
+        "backend": backend,
+        "success_rate": sum(item["success"] for item in results) / len(results),
+        "steps_per_task": sum(item["steps"] for item in results) / len(results),
+        "seconds": round(elapsed, 3),
+        # 包装器提前返回时只能估算提示词 token，统一改用桩服务实际预填充的字符数折算，KV 缓存命中的前缀不计
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": int(counters.get('tokens_total{type="completion"}', 0)),
+        # browser-use 没能从模型输出中得到合法 AgentOutput 的次数，各后端口径一致
+        "parse_failures": int(counters.get("agent_output_errors_total", 0)),
+        "model_calls": len(requests),
+        # 带 JSON schema 约束（format）的请求数
+        "constrained_calls": sum(1 for body in requests if isinstance(body.get("format"), dict)),
+        "tasks": results,
+        "recorded": recorded,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="用回放的模型响应对比各模型后端在固定任务集上的表现")
+    parser.add_argument("--recordings", default="recordings/backends.jsonl")
+    parser.add_argument("--backends", nargs="+", default=DEFAULT_BACKENDS)
+    parser.add_argument("--max-steps", type=int, default=8)
+    parser.add_argument("--first-token-delay", type=float, default=0.0, help="模拟模型首 token 延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="模拟逐块输出间隔（秒）")
+    parser.add_argument("--output", help="把完整结果写入 JSON 文件，便于比较两次运行")
+    args = parser.parse_args()
+
+    recordings = load_recordings(args.recordings)
+    missing = [backend for backend in args.backends if backend not in recordings]
+    if missing:
+        raise SystemExit(f"录制文件中没有这些后端的响应：{', '.join(missing)}")
+
+    site, base_url = start_site()
+    tasks = [{**task, "task": task["task"].replace("{base_url}", base_url)} for task in TASKS]
+    server_options = {"first_token_delay": args.first_token_delay, "token_delay": args.token_delay}
+    browser = Browser(config=BrowserConfig(headless=True))
+    summaries = []
+    try:
+        for backend in args.backends:
+            summaries.append(
+                await run_backend(backend, recordings[backend], tasks, browser, base_url, args.max_steps, server_options)
+            )
+    finally:
+        await browser.close()
+        site.shutdown()
+
+    print(f"\n{'后端':<26}{'成功率':>8}{'步数/任务':>10}{'耗时(s)':>9}{'提示词tok':>10}{'生成tok':>9}{'解析失败':>8}")
+    for summary in summaries:
+        print(
+            f"{summary['backend']:<28}{summary['success_rate']:>9.0%}{summary['steps_per_task']:>12.1f}"
+            f"{summary['seconds']:>10.1f}{summary['prompt_tokens']:>12}{summary['completion_tokens']:>10}"
+            f"{summary['parse_failures']:>10}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
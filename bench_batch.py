@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from browser_use import Agent, Browser, BrowserConfig
+
+from batch_runner import DEFAULT_AGENT_OPTIONS, run_batch, run_sharded
+from deepseek_wrapper import DeepseekToolWrapper
+from fake_ollama import FakeOllama
+
+
+def scripted_agent(body: dict) -> str:
+    """模拟模型：先打开任务中的网址，到达后返回完成"""
+    prompt = body["prompt"]
+    target = re.search(r"打开 (http://\S+) 并", prompt).group(1)
+    state = {"page_summary": "", "evaluation_previous_goal": "Success", "memory": "", "next_goal": "完成任务"}
+    if f"Current url: {target}" in prompt:
+        action = [{"done": {"text": f"已打开 {target}"}}]
+    else:
+        action = [{"go_to_url": {"url": target}}]
+    return json.dumps({"current_state": state, "action": action}, ensure_ascii=False)
+
+
+def start_static_site(pages: int) -> tuple:
+    """在临时目录生成静态页面并启动本地服务，返回 (服务, 根地址)"""
+    root = tempfile.mkdtemp(prefix="bench_site_")
+    for i in range(pages):
+        with open(os.path.join(root, f"item{i}.html"), "w", encoding="utf-8") as f:
+            f.write(f"<html><head><title>视频 {i}</title></head><body><h1>视频 {i}</h1><a href='/'>首页</a></body></html>")
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=root)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def one_browser_per_task(tasks: list, llm) -> float:
+    """当前入口脚本的做法：每个任务启动并关闭自己的浏览器，依次执行"""
+    start = time.perf_counter()
+    for item in tasks:
+        browser = Browser(config=BrowserConfig(headless=True))
+        try:
+            agent = Agent(task=item["task"], llm=llm, browser=browser, **DEFAULT_AGENT_OPTIONS)
+            await agent.run(max_steps=5)
+        finally:
+            await browser.close()
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="批量运行器吞吐基准")
+    parser.add_argument("--tasks", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="分片运行的工作进程数")
+    args = parser.parse_args()
+
+    site, base_url = start_static_site(args.tasks)
+    tasks = [{"id": i, "task": f"打开 {base_url}/item{i}.html 并返回页面标题"} for i in range(args.tasks)]
+    try:
+        with FakeOllama(responses=[scripted_agent]) as server:
+            llm = DeepseekToolWrapper(base_url=server.url)
+
+            baseline = await one_browser_per_task(tasks, llm)
+            print(f"每任务一个浏览器：{args.tasks / baseline * 60:7.1f} 任务/分钟（{baseline:.1f}s）")
+
+            output = tempfile.mktemp(suffix=".jsonl")
+            summary = await run_batch(tasks, output, llm, concurrency=args.concurrency, max_steps=5)
+            print(
+                f"共享浏览器 x{args.concurrency} 上下文：{summary['tasks_per_minute']:7.1f} 任务/分钟"
+                f"（{summary['seconds']:.1f}s，成功 {summary['succeeded']}/{summary['tasks']}）"
+            )
+
+            # 每个进程一个浏览器，进程内同样并发 concurrency 个上下文
+            output = tempfile.mktemp(suffix=".jsonl")
+            summary = await asyncio.to_thread(
+                run_sharded, tasks, output, "wrapper", processes=args.processes, concurrency=args.concurrency,
+                max_steps=5, llm_options={"base_url": server.url},
+            )
+            print(
+                f"{summary['processes']} 进程 x{args.concurrency} 上下文：{summary['tasks_per_minute']:7.1f} 任务/分钟"
+                f"（{summary['seconds']:.1f}s，成功 {summary['succeeded']}/{summary['tasks']}）"
+            )
+    finally:
+        site.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
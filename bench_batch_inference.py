@@ -0,0 +1,89 @@
+import argparse
+import time
+
+from langchain_core.messages import HumanMessage
+
+from bench_prompt import build_browser_tools
+from deepseek_wrapper import DeepseekToolWrapper
+from fake_ollama import FakeOllama
+
+REPLY = '<think>判断类别。</think>{"action": "done", "params": {"text": "正面"}}'
+BAD_MARKER = "无法处理的样本"
+
+
+def respond(body: dict) -> str:
+    # 带标记的样本每次都让服务端断开连接，重试后仍失败，用来检查逐项错误
+    if BAD_MARKER in body.get("prompt", ""):
+        raise ConnectionAbortedError(BAD_MARKER)
+    return REPLY
+
+
+def build_inputs(count: int, bad_every: int):
+    return [
+        f"评论 {i}：{BAD_MARKER if bad_every and i % bad_every == bad_every - 1 else '物流很快，包装完好'}，请给出情感类别"
+        for i in range(count)
+    ]
+
+
+def summarize(results) -> tuple:
+    errors = sum(isinstance(result, Exception) for result in results)
+    done = sum(1 for result in results if not isinstance(result, Exception) and result.tool_calls)
+    return done, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比逐个调用与 batch_generate 在不同并发下处理一批独立提示词的吞吐")
+    parser.add_argument("--prompts", type=int, default=128)
+    parser.add_argument("--server-parallel", type=int, default=32, help="桩服务同时处理的请求数（OLLAMA_NUM_PARALLEL）")
+    parser.add_argument("--first-token-delay", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    parser.add_argument("--bad-every", type=int, default=50, help="每多少个样本放入一个必然失败的样本，0 表示不放")
+    args = parser.parse_args()
+
+    inputs = build_inputs(args.prompts, args.bad_every)
+    tools = build_browser_tools()
+    server_options = {
+        "responses": [respond],
+        "first_token_delay": args.first_token_delay,
+        "token_delay": args.token_delay,
+        "max_parallel": args.server_parallel,
+    }
+
+    print(f"\n{args.prompts} 个提示词，桩服务并发 {args.server_parallel}")
+    print(f"{'方式':<24}{'耗时(s)':>9}{'提示词/秒':>11}{'完成':>6}{'失败':>6}{'服务端峰值并发':>16}")
+
+    def report(name, seconds, results, server):
+        done, errors = summarize(results)
+        print(f"{name:<24}{seconds:>9.2f}{len(results) / seconds:>12.1f}{done:>7}{errors:>7}{server.peak_in_flight:>14}")
+
+    # 改造前：逐个 invoke，每项都经过对话状态
+    with FakeOllama(**server_options) as server:
+        wrapper = DeepseekToolWrapper(base_url=server.url, max_retries=1, retry_backoff=0.01)
+        runnable = wrapper.bind_tools(tools)
+        start = time.perf_counter()
+        results = []
+        for text in inputs:
+            try:
+                results.append(runnable.invoke([HumanMessage(content=text)]))
+            except Exception as e:
+                results.append(e)
+        report("逐个 invoke", time.perf_counter() - start, results, server)
+
+    for concurrency in (1, 8, 64):
+        with FakeOllama(**server_options) as server:
+            # max_concurrency 不会超出共享连接池的 max_in_flight，这里把连接池的上限放开到同样大小
+            wrapper = DeepseekToolWrapper(
+                base_url=server.url, max_in_flight=concurrency, max_retries=1, retry_backoff=0.01
+            )
+            start = time.perf_counter()
+            results = wrapper.batch_generate(inputs, tools=tools, max_concurrency=concurrency)
+            report(f"batch_generate 并发 {concurrency}", time.perf_counter() - start, results, server)
+
+    first_error = next((result for result in results if isinstance(result, Exception)), None)
+    if first_error is not None:
+        index = results.index(first_error)
+        print(f"失败项保留在原位置，例如第 {index} 项：{type(first_error).__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage
+from langchain_ollama import OllamaLLM
+
+from deepseek_wrapper import DeepseekToolWrapper
+from fake_ollama import FakeOllama
+from ollama_pool import close_async_pools
+
+REPLY = '<think>直接完成。</think>{"action": "done", "params": {"text": "ok"}}'
+
+
+async def gather_callers(calls) -> tuple:
+    """并发执行所有调用，返回 (耗时, 失败数)"""
+    start = time.perf_counter()
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    failures = sum(isinstance(result, Exception) for result in results)
+    return time.perf_counter() - start, failures
+
+
+async def legacy_callers(url: str, callers: int) -> tuple:
+    """改造前：每个 agent 的包装器各自创建 OllamaLLM，请求全部同时发往服务端"""
+    llms = [OllamaLLM(model="deepseek-r1:1.5b", base_url=url, keep_alive="30m") for _ in range(callers)]
+    return await gather_callers(llm.ainvoke(f"任务 {i}") for i, llm in enumerate(llms))
+
+
+async def pooled_callers(url: str, callers: int, max_in_flight: int, **options) -> tuple:
+    """每个 agent 仍有自己的包装器，但共用同一个连接池和并发上限"""
+    wrappers = [
+        DeepseekToolWrapper(base_url=url, max_in_flight=max_in_flight, stop_on_action=False, **options)
+        for _ in range(callers)
+    ]
+    try:
+        return await gather_callers(wrapper.ainvoke([HumanMessage(content=f"任务 {i}")]) for i, wrapper in enumerate(wrappers))
+    finally:
+        await close_async_pools()
+
+
+def report(name: str, server: FakeOllama, callers: int, elapsed: float, failures: int):
+    print(
+        f"{name}：失败 {failures:2d}/{callers}，服务端拒绝 {server.rejected:3d} 次，"
+        f"新建连接 {server.connections:3d}，服务端峰值并发 {server.peak_in_flight:2d}，耗时 {elapsed:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发调用桩服务，对比独立客户端与共享连接池")
+    parser.add_argument("--callers", type=int, default=50)
+    parser.add_argument("--parallel", type=int, default=4, help="服务端同时处理的请求数")
+    parser.add_argument("--queue", type=int, default=8, help="服务端排队上限，超出返回 503")
+    args = parser.parse_args()
+
+    scenarios = [
+        ("独立 OllamaLLM", lambda url: legacy_callers(url, args.callers)),
+        (f"共享连接池 max_in_flight={args.parallel}", lambda url: pooled_callers(url, args.callers, args.parallel)),
+        # 上限超过服务端容量时，被拒绝的请求在退避后重试
+        (f"共享连接池 max_in_flight={args.parallel + args.queue + 4}，重试 5 次",
+         lambda url: pooled_callers(url, args.callers, args.parallel + args.queue + 4, max_retries=5, retry_backoff=0.1)),
+    ]
+    for name, run in scenarios:
+        server = FakeOllama(
+            responses=[REPLY], first_token_delay=0.05, token_delay=0.002,
+            max_parallel=args.parallel, max_queue=args.queue,
+        )
+        with server:
+            elapsed, failures = asyncio.run(run(server.url))
+        report(name, server, args.callers, elapsed, failures)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from browser_use import Browser, BrowserConfig
+
+from bench_backends import TASKS, load_recordings, run_backend, start_site, write_recordings
+
+# 只在提示词中说明格式，与按动作 JSON schema 约束解码（constrained_output=True）
+MODES = {
+    "提示词约束": {},
+    "format 约束": {"constrained_output": True},
+}
+# 仓库中的录制是按动作 schema 手写的合法输出，不是真实模型在 format 约束下的输出，
+# 回放时只检查链路：每个请求都带上 format 约束、符合 schema 的回复都能解析为动作。
+# 步数和无效推理的前后对比需要用 --upstream 对真实 Ollama 运行两种模式，可加 --record 保存真实响应
+RECORDING = "recordings/constrained.jsonl"
+
+
+def check_plumbing(summary: dict) -> list:
+    failures = []
+    if summary["constrained_calls"] != summary["model_calls"]:
+        failures.append(f"{summary['model_calls'] - summary['constrained_calls']} 个请求没有带 format 约束")
+    if summary["parse_failures"]:
+        failures.append(f"{summary['parse_failures']} 个符合 schema 的回复没能解析为动作")
+    return failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="对比提示词说明格式与 format 约束解码的步数和无效推理；不给 --upstream 时只检查链路")
+    parser.add_argument("--max-steps", type=int, default=8)
+    parser.add_argument("--first-token-delay", type=float, default=0.5, help="回放时模拟模型首 token 延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="回放时模拟逐块输出间隔（秒）")
+    parser.add_argument("--upstream", help="真实 Ollama 地址（需 0.5 及以上），给出时对真实模型运行两种模式")
+    parser.add_argument("--model", help="--upstream 时使用的模型，默认为 wrapper 后端的默认模型")
+    parser.add_argument("--record", action="store_true", help="--upstream 时把 format 约束下的真实响应写入 RECORDING")
+    parser.add_argument("--output", help="把完整结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    site, base_url = start_site()
+    tasks = [{**task, "task": task["task"].replace("{base_url}", base_url)} for task in TASKS]
+    server_options = {"first_token_delay": args.first_token_delay, "token_delay": args.token_delay}
+    model = {"model": args.model} if args.model else {}
+    # 回放手写录制时只运行 format 约束一种模式
+    modes = MODES if args.upstream else {"format 约束": MODES["format 约束"]}
+    browser = Browser(config=BrowserConfig(headless=True))
+    summaries = {}
+    try:
+        for mode, llm_options in modes.items():
+            recordings = {} if args.upstream else load_recordings(RECORDING)["wrapper"]
+            summaries[mode] = await run_backend(
+                "wrapper", recordings, tasks, browser, base_url, args.max_steps, server_options,
+                {**model, **llm_options}, upstream=args.upstream,
+            )
+    finally:
+        await browser.close()
+        site.shutdown()
+
+    # 无效推理：模型输出里没能解析出合法动作，这一步的推理白白浪费，需要重来
+    print(f"\n{'模式':<12}{'成功率':>8}{'步数/任务':>10}{'模型调用':>10}{'无效推理':>10}{'带约束':>8}{'耗时(s)':>9}")
+    for mode, summary in summaries.items():
+        print(
+            f"{mode:<12}{summary['success_rate']:>9.0%}{summary['steps_per_task']:>12.2f}"
+            f"{summary['model_calls']:>12}{summary['parse_failures']:>12}{summary['constrained_calls']:>10}"
+            f"{summary['seconds']:>10.1f}"
+        )
+    failures = []
+    if args.upstream:
+        before, after = summaries["提示词约束"], summaries["format 约束"]
+        print(
+            f"真实模型 {args.model or '默认模型'}：步数/任务 {before['steps_per_task']:.2f} → {after['steps_per_task']:.2f}，"
+            f"无效推理 {before['parse_failures']} → {after['parse_failures']}"
+        )
+        if after["constrained_calls"] != after["model_calls"]:
+            failures.append("format 约束模式下有请求没有带 format 约束")
+        if args.record:
+            write_recordings(RECORDING, "wrapper", after["recorded"], base_url)
+    else:
+        print("回放的是手写录制，只检查链路，不代表真实模型；前后对比请加 --upstream")
+        failures = check_plumbing(summaries["format 约束"])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=2)
+    for failure in failures:
+        print(f"失败：{failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from browser_use import Agent
+
+from batch_runner import DEFAULT_AGENT_OPTIONS
+from deepseek_wrapper import DeepseekToolWrapper
+from fake_ollama import FakeOllama
+from instrumentation import MetricsCallback, RunMetrics
+from replay import Cassette, ReplayBrowserContext, replay_agent
+
+
+def agent_reply(done: bool) -> str:
+    action = {"done": {"text": "视频标题：AI-ToolKit 入门教程"}} if done else {"click_element": {"index": 1}}
+    return json.dumps({
+        "current_state": {"page_summary": "", "evaluation_previous_goal": "Success", "memory": "", "next_goal": "继续"},
+        "action": [action],
+    }, ensure_ascii=False)
+
+
+async def run(cassette: Cassette, compress: bool, server_options: dict) -> dict:
+    """回放录制的页面，由 browser-use Agent 逐步调用包装器，返回每步提示词长度和汇总"""
+    steps = len(cassette.entries["state"])
+    responses = [agent_reply(done=step == steps - 1) for step in range(steps)]
+    metrics = RunMetrics()
+    with FakeOllama(responses=responses, **server_options) as server:
+        llm = DeepseekToolWrapper(base_url=server.url, compress_dom=compress, callbacks=[MetricsCallback(metrics)])
+        agent = Agent(
+            task=cassette.meta["task"], llm=llm, browser_context=ReplayBrowserContext(cassette), **DEFAULT_AGENT_OPTIONS
+        )
+        replay_agent(agent, cassette)
+        start = time.perf_counter()
+        await agent.run(max_steps=steps)
+        elapsed = time.perf_counter() - start
+    completion = metrics.counters.get('tokens_total{type="completion"}', 0)
+    prompts = [request["prompt"] for request in server.requests]
+    # 系统提示词和工具目录每步相同，页面状态和历史都在固定前缀之后
+    fixed = len(os.path.commonprefix(prompts))
+    return {
+        "prompt_chars": [len(prompt) for prompt in prompts],
+        "variable_chars": [len(prompt) - fixed for prompt in prompts],
+        "prefill_chars": server.prompt_chars_evaluated,
+        "seconds": elapsed,
+        "tokens_per_second": completion / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在录制的页面上对比压缩页面状态前后的提示词长度和生成速度")
+    parser.add_argument("--cassette", default="recordings/dom_pages.jsonl", help="replay.py 录制的文件，只用到页面快照和动作结果")
+    parser.add_argument("--prefill-us-per-char", type=float, default=50, help="桩服务每个未缓存提示词字符的预填充耗时（微秒）")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="桩服务逐块输出间隔（秒）")
+    args = parser.parse_args()
+
+    cassette = Cassette.load(args.cassette)
+    server_options = {"prompt_eval_per_char": args.prefill_us_per_char * 1e-6, "token_delay": args.token_delay}
+    results = {}
+    for name, compress in (("原始", False), ("compress_dom", True)):
+        results[name] = asyncio.run(run(cassette, compress, server_options))
+
+    before, after = results["原始"], results["compress_dom"]
+    print(f"\n{'步骤':<6}{'原始提示词':>10}{'其中固定前缀之后':>14}{'压缩后':>10}{'其中固定前缀之后':>14}  (字符)")
+    rows = zip(before["prompt_chars"], before["variable_chars"], after["prompt_chars"], after["variable_chars"])
+    for step, (plain, plain_variable, compressed, compressed_variable) in enumerate(rows, 1):
+        print(f"{step:<8}{plain:>14}{plain_variable:>16}{compressed:>14}{compressed_variable:>16}")
+    for name, result in results.items():
+        print(
+            f"{name:<14} 提示词合计 {sum(result['prompt_chars']):7d} 字符（约 {sum(result['prompt_chars']) // 4} token），"
+            f"服务端预填充 {result['prefill_chars']:7d} 字符，耗时 {result['seconds']:.2f}s，"
+            f"有效生成速度 {result['tokens_per_second']:.1f} tok/s"
+        )
+    saved = 1 - sum(after["variable_chars"]) / sum(before["variable_chars"])
+    print(f"固定前缀之后的提示词（页面状态和历史）合计减少 {saved:.0%}")
+
+
+if __name__ == "__main__":
+    main()
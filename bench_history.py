@@ -0,0 +1,54 @@
+import argparse
+import sys
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from history_window import HistoryWindow, estimate_tokens
+
+
+def build_history(steps: int, page_chars: int) -> list:
+    """仿照 browser-use 的消息历史：每一步是模型的工具调用、工具结果和下一步的页面状态"""
+    messages = [SystemMessage(content="你是浏览器自动化助手。"), HumanMessage(content="任务：在 bilibili 搜索 AI-ToolKit")]
+    messages.append(HumanMessage(content="第 0 步页面状态：" + "[1]<a>首页</a> " * (page_chars // 16)))
+    for step in range(1, steps + 1):
+        messages.append(AIMessage(content="", tool_calls=[
+            {"name": "AgentOutput", "args": {"action": [{"click_element": {"index": step}}]}, "id": f"call_{step}"}
+        ]))
+        messages.append(ToolMessage(content="", tool_call_id=f"call_{step}"))
+        messages.append(HumanMessage(content=f"第 {step} 步页面状态：" + f"[{step}]<button>搜索</button> " * (page_chars // 24)))
+    return messages
+
+
+def render(message) -> str:
+    return message.content if message.content else str(getattr(message, "tool_calls", "") or "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查各 keep_last_turns 下折叠后的提示词 token 数，以及当前页面状态是否原样保留")
+    parser.add_argument("--steps", type=int, default=12)
+    parser.add_argument("--page-chars", type=int, default=20000, help="每步页面状态的字符数")
+    parser.add_argument("--max-tokens", type=int, default=4000)
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'keep_last_turns':<16}{'步数':>6}{'原始 token':>12}{'折叠后 token':>14}{'当前页面':>10}")
+    for keep_last_turns in range(0, 5):
+        window = HistoryWindow(args.max_tokens, render, keep_last_turns=keep_last_turns)
+        for steps in range(1, args.steps + 1):
+            messages = build_history(steps, args.page_chars)
+            trimmed = window.apply(("bench",), messages)
+            # 最后一条 AIMessage 之后的消息是模型这一步要据此行动的页面状态，任何时候都不能被折叠
+            current = len(messages) - max(i for i, m in enumerate(messages) if isinstance(m, AIMessage)) - 1
+            kept = trimmed[-current:] == messages[-current:]
+            if not kept:
+                failures.append(f"keep_last_turns={keep_last_turns} 第 {steps} 步折叠了当前页面状态")
+        before = sum(estimate_tokens(render(message)) for message in messages)
+        after = sum(estimate_tokens(render(message)) for message in trimmed)
+        print(f"{keep_last_turns:<16}{steps:>6}{before:>12}{after:>14}{'保留' if kept else '被折叠':>10}")
+    for failure in failures:
+        print(f"失败：{failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 启动路径：命令行入口的 --help、各后端的 run --dry-run（加载全部模块并创建模型，不启动浏览器），
+# 以及按旧方式在模块顶层导入所有依赖的 test2.py 作为对照
+TARGETS: Dict[str, List[str]] = {
+    "cli --help": ["cli.py", "--help"],
+    "cli run ollama": ["cli.py", "run", "--backend", "ollama", "--task", "-", "--dry-run"],
+    "cli run deepseek-api": ["cli.py", "run", "--backend", "deepseek-api", "--task", "-", "--dry-run"],
+    "cli run wrapper": ["cli.py", "run", "--backend", "wrapper", "--task", "-", "--dry-run"],
+    "import test2": ["-c", "import test2"],
+}
+
+# 每条路径不应加载的包，出现即视为回归（与机器快慢无关）
+FORBIDDEN: Dict[str, Tuple[str, ...]] = {
+    "cli --help": ("browser_use", "langchain_core", "langchain_openai", "langchain_ollama", "openai", "ollama"),
+    "cli run ollama": ("deepseek_wrapper", "langchain_huggingface"),
+    "cli run deepseek-api": ("deepseek_wrapper", "langchain_ollama", "langchain_huggingface", "ollama"),
+    "cli run wrapper": ("langchain_huggingface",),
+}
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float], Set[str]]:
+    """解析 -X importtime 的输出，返回 (导入总耗时, 各顶层包的累计耗时, 任意层级加载过的顶层包名)，单位秒"""
+    total, packages, loaded = 0.0, defaultdict(float), set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        # 被其他模块间接导入的包同样算作加载，用于检查不该加载的包
+        loaded.add(package)
+        # 包名前的缩进表示嵌套层级，顶层只有一个空格；只有顶层计入耗时，避免重复计算
+        if len(name) - len(name.lstrip()) == 1:
+            seconds = int(cumulative) / 1e6
+            total += seconds
+            packages[package] += seconds
+    return total, dict(packages), loaded
+
+
+def measure(command: List[str]) -> Dict[str, object]:
+    env = {**os.environ, "ANONYMIZED_TELEMETRY": "false", "PYTHONDONTWRITEBYTECODE": "1"}
+    # 只创建模型、不发请求，没有配置密钥时用占位值
+    env.setdefault("DEEPSEEK_API_KEY", "sk-placeholder")
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *command], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} 退出码 {process.returncode}：{process.stderr[-500:]}")
+    total, packages, loaded = parse_importtime(process.stderr)
+    return {"wall": wall, "imports": total, "packages": packages, "loaded": loaded}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用 -X importtime 测量各启动路径的导入耗时，检查是否加载了不该加载的包")
+    parser.add_argument("--repeat", type=int, default=3, help="每条路径运行几次，取最快的一次")
+    parser.add_argument("--baseline", help="之前用 --save-baseline 保存的结果，导入耗时超出 tolerance 视为回归")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--save-baseline", help="把本次结果保存为基线")
+    parser.add_argument("--top", type=int, default=5, help="每条路径列出最慢的几个顶层包")
+    args = parser.parse_args()
+
+    results = {}
+    for name, command in TARGETS.items():
+        runs = [measure(command) for _ in range(args.repeat)]
+        results[name] = min(runs, key=lambda result: result["imports"])
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    failures = []
+    print(f"\n{'启动路径':<24}{'进程耗时(s)':>12}{'导入耗时(s)':>12}{'基线(s)':>9}  最慢的顶层包")
+    for name, result in results.items():
+        packages = sorted(result["packages"].items(), key=lambda item: -item[1])[:args.top]
+        slowest = "，".join(f"{package} {seconds:.2f}" for package, seconds in packages)
+        reference = baseline.get(name)
+        print(
+            f"{name:<24}{result['wall']:>12.2f}{result['imports']:>12.2f}"
+            f"{reference if reference is not None else '-':>9}  {slowest}"
+        )
+        loaded = sorted(set(FORBIDDEN.get(name, ())) & result["loaded"])
+        if loaded:
+            failures.append(f"{name} 加载了 {', '.join(loaded)}")
+        if reference is not None and result["imports"] > reference * (1 + args.tolerance):
+            failures.append(f"{name} 导入耗时 {result['imports']:.2f}s，超过基线 {reference:.2f}s 的 {args.tolerance:.0%}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({name: round(result["imports"], 3) for name, result in results.items()}, f, ensure_ascii=False, indent=2)
+    for failure in failures:
+        print(f"回归：{failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
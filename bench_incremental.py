@@ -0,0 +1,55 @@
+import time
+
+from langchain_core.messages import SystemMessage, HumanMessage
+
+from bench_prompt import build_browser_tools
+from deepseek_wrapper import DeepseekToolWrapper
+from fake_ollama import FakeOllama
+
+REPLY = '{"action": "click_element", "params": {"index": 3}, "thought": "点击搜索框"}'
+
+
+def page_state(step: int) -> str:
+    """模拟 browser-use 每步发送的页面状态，约 1500 字符"""
+    return f"当前网址: https://www.bilibili.com/?step={step}\n" + "".join(
+        f"[{i}]<a>推荐视频 {step}-{i}</a>\n" for i in range(80)
+    )
+
+
+def run_steps(model: DeepseekToolWrapper, steps: int) -> list:
+    """按 agent 的方式逐步追加消息，返回每步的调用耗时（秒）"""
+    messages = [SystemMessage(content="你是浏览器自动化助手。"), HumanMessage(content="任务：在 bilibili 搜索 AI-ToolKit")]
+    latencies = []
+    for step in range(steps):
+        messages.append(HumanMessage(content=page_state(step)))
+        start = time.perf_counter()
+        reply = model.invoke(messages)
+        latencies.append(time.perf_counter() - start)
+        messages.append(reply)
+    return latencies
+
+
+def main():
+    steps = 8
+    tools = build_browser_tools()
+    configs = [
+        ("每步冷启动 keep_alive=0", {"keep_alive": 0}),
+        ("keep_alive + 稳定前缀", {}),
+        # context 只在生成完整结束时返回，因此关闭提前返回
+        ("keep_alive + context 复用", {"reuse_context": True, "stop_on_action": False}),
+    ]
+
+    print(f"模拟 {steps} 步 browser-use 任务，桩服务预填充 20µs/字符，模型加载 0.3s")
+    for name, options in configs:
+        # 响应只有一个分块，调用耗时即首 token 延迟
+        with FakeOllama(responses=[REPLY], prompt_eval_per_char=20e-6, load_delay=0.3, chunk_size=len(REPLY)) as server:
+            model = DeepseekToolWrapper(base_url=server.url, **options).bindTools(tools)
+            latencies = run_steps(model, steps)
+            print(
+                f"{name:<24} 第1步 {latencies[0] * 1000:7.1f} ms | 第{steps}步 {latencies[-1] * 1000:7.1f} ms | "
+                f"服务端预填充 {server.prompt_chars_evaluated} 字符"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import os
+import stat
+import tempfile
+import time
+from pathlib import Path
+
+import browser_launcher
+from browser_launcher import BROWSERS, find_browser
+
+
+def legacy_discover(kind: str):
+    """改造前入口脚本的做法：每次运行依次探测所有常见安装路径"""
+    for path in BROWSERS[kind]["paths"]:
+        if Path(path).exists():
+            return path
+    return None
+
+
+def timed(fn, rounds: int) -> float:
+    """返回平均每次调用的耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="浏览器发现耗时基准")
+    parser.add_argument("--kind", default="chrome", choices=list(BROWSERS))
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    # 用临时可执行文件代替真实浏览器，只测量查找开销，磁盘缓存也写到临时目录
+    root = tempfile.mkdtemp(prefix="bench_launch_")
+    fake = os.path.join(root, "chrome")
+    Path(fake).write_text("")
+    os.chmod(fake, os.stat(fake).st_mode | stat.S_IXUSR)
+    browser_launcher.CACHE_FILE = Path(root) / "browser_launcher.json"
+    browser_launcher._write_cache(args.kind, fake)
+
+    legacy = timed(lambda: legacy_discover(args.kind), args.rounds)
+    print(f"逐个探测安装路径：{legacy:8.1f} µs/次")
+
+    disk = timed(lambda: browser_launcher._discover(args.kind), args.rounds)
+    print(f"磁盘缓存命中：    {disk:8.1f} µs/次")
+
+    find_browser.cache_clear()
+    find_browser(args.kind)
+    memory = timed(lambda: find_browser(args.kind), args.rounds)
+    print(f"进程内缓存命中：  {memory:8.1f} µs/次")
+    print("冷启动与 CDP 连接预热浏览器的差异需本机安装浏览器，可用 `python browser_launcher.py warm` 后设置 BROWSER_CDP_URL 对比")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import asyncio
+import json
+
+from browser_use import Browser, BrowserConfig
+
+from bench_backends import TASKS, load_recordings, run_backend, start_site, write_recordings
+
+# 两种提示词格式：每步最多一个动作，与一次回复最多 4 个动作（页面变化时由 page_guard 中止剩余动作）。
+# 仓库中的两份录制是手写的，只用来检查链路（多动作回复能被解析、执行并在页面跳转时中止），
+# 往返次数的对比需要用 --upstream 对真实模型运行，可加 --record 把真实响应保存为新的录制
+MODES = {
+    "逐个动作": ("recordings/actions_single.jsonl", {"max_actions_per_step": 1}),
+    "多动作规划": ("recordings/actions_plan.jsonl", {"max_actions_per_step": 4}),
+}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="对比每步一个动作与多动作规划在固定任务集上的模型往返次数")
+    parser.add_argument("--max-steps", type=int, default=8)
+    parser.add_argument("--first-token-delay", type=float, default=0.5, help="回放时模拟模型首 token 延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="回放时模拟逐块输出间隔（秒）")
+    parser.add_argument("--upstream", help="真实 Ollama 地址，给出时请求真实模型而不是回放录制")
+    parser.add_argument("--model", help="--upstream 时使用的模型，默认为 wrapper 后端的默认模型")
+    parser.add_argument("--record", action="store_true", help="--upstream 时把真实响应写回 MODES 中的录制文件")
+    parser.add_argument("--output", help="把完整结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    site, base_url = start_site()
+    tasks = [{**task, "task": task["task"].replace("{base_url}", base_url)} for task in TASKS]
+    server_options = {"first_token_delay": args.first_token_delay, "token_delay": args.token_delay}
+    llm_options = {"model": args.model} if args.model else {}
+    browser = Browser(config=BrowserConfig(headless=True))
+    summaries = {}
+    try:
+        for mode, (path, agent_options) in MODES.items():
+            recordings = {} if args.upstream else load_recordings(path)["wrapper"]
+            summaries[mode] = await run_backend(
+                "wrapper", recordings, tasks, browser, base_url, args.max_steps, server_options,
+                llm_options, agent_options, upstream=args.upstream,
+            )
+            if args.upstream and args.record:
+                write_recordings(path, "wrapper", summaries[mode]["recorded"], base_url)
+    finally:
+        await browser.close()
+        site.shutdown()
+
+    # 每步调用一次模型，模型调用次数即往返次数
+    print(f"\n{'模式':<12}{'成功率':>8}{'往返/任务':>10}{'往返合计':>10}{'耗时(s)':>9}")
+    for mode, summary in summaries.items():
+        print(
+            f"{mode:<12}{summary['success_rate']:>9.0%}{summary['model_calls'] / len(tasks):>12.2f}"
+            f"{summary['model_calls']:>12}{summary['seconds']:>10.1f}"
+        )
+    for task in summaries["多动作规划"]["tasks"]:
+        print(f"  {task['id']:<8}{task['steps']} 步  {task['result']}")
+    if args.upstream:
+        single, plan = (summaries[mode]["model_calls"] for mode in MODES)
+        print(f"真实模型 {args.model or '默认模型'}：模型往返减少 {1 - plan / single:.0%}")
+    else:
+        print("回放的是手写录制，只检查链路，往返次数不代表真实模型；对比请加 --upstream")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+import argparse
+import json
+import time
+from typing import List, Tuple
+
+from action_parser import ActionParser
+from bench_prompt import build_browser_tools
+
+# 本地 deepseek-r1 / qwen2 在 browser-use 任务中的典型输出，(输出, 期望动作)
+CORPUS: List[Tuple[str, str]] = [
+    ('{"action": "go_to_url", "params": {"url": "https://www.bilibili.com"}, "thought": "打开网站"}', "go_to_url"),
+    ('<think>\n用户要求打开 bilibili，我应该先导航过去。\n</think>\n\n{"action": "go_to_url", "params": {"url": "https://www.bilibili.com"}}', "go_to_url"),
+    ('<think>搜索框的索引是 5。</think>\n```json\n{\n  "action": "input_text",\n  "params": {"index": 5, "text": "AI-ToolKit"},\n  "thought": "输入关键词"\n}\n```', "input_text"),
+    ('```json\n{"action": "click_element", "params": {"index": 12}}\n```\n点击搜索按钮后应该会跳转到结果页。', "click_element"),
+    ("好的，我将点击用户标签页：{'action': 'click_element', 'params': {'index': 23}, 'thought': '切换到用户标签'}", "click_element"),
+    ('{"action": "click_element", "params": {"index": 7,}, "thought": "点击第一个用户",}', "click_element"),
+    ('{"action": "scroll_down", "params": {"amount": None}, "thought": "继续向下看"}', "scroll_down"),
+    ('<think>\n页面已经加载，下一步点击视频选项卡。{不确定索引}\n</think>\n{"action": "click_element", "params": {"index": "31"}}', "click_element"),
+    ('{"name": "send_keys", "arguments": {"keys": "Enter"}}', "send_keys"),
+    ('{"click_element": {"index": 4}}', "click_element"),
+    ('我需要先等待视频播放。\n{"action": "wait", "params": {"seconds": 15}, "thought": "等待15秒"', "wait"),
+    ('<think>视频已经播放了 15 秒，可以返回结果。</think>{"action": "done", "params": {"text": "标题：AI-ToolKit 教程，时长 12:34"}}', "done"),
+    ('{"action": "input_text", "params": {"index": 5, "text": "他说\\"你好\\""}}', "input_text"),
+    ('Step 1: {"note": "页面状态"} Step 2: {"action": "go_back", "params": {}}', "go_back"),
+    ('{"action": "open_tab", "parameters": {"url": "https://space.bilibili.com"}}', "open_tab"),
+    ('{"action": "click_element", "params": {"index": "first"}}', None),
+    ('{"action": "fly_to_moon", "params": {}}', None),
+    ("我不确定下一步该做什么，请提供更多信息。", None),
+    ('<think>\n' + '分析页面结构。' * 200 + '\n</think>\n{"action": "extract_content", "params": {"goal": "视频标题和播放时长"}}', "extract_content"),
+    ('{"action":"switch_tab","params":{"page_id":1},"thought":"切换到新打开的视频页"}', "switch_tab"),
+]
+
+
+def legacy_parse(response: str):
+    """改造前 _parse_response 的行为：整段必须是合法 JSON"""
+    try:
+        data = json.loads(response)
+        if isinstance(data, dict) and "action" in data:
+            return data
+    except ValueError:
+        pass
+    return None
+
+
+def load_corpus(path: str) -> List[Tuple[str, str]]:
+    """读取录制的模型输出，每行 {"output": ..., "expected": 动作名或 null}"""
+    with open(path, encoding="utf-8") as f:
+        return [(item["output"], item.get("expected")) for item in map(json.loads, f) if item]
+
+
+def evaluate(parse, corpus, rounds: int) -> Tuple[float, float]:
+    """返回 (正确率, 每次解析微秒数)"""
+    correct = 0
+    for output, expected in corpus:
+        action = parse(output)
+        correct += (action["action"] if action else None) == expected
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for output, _ in corpus:
+            parse(output)
+    elapsed = time.perf_counter() - start
+    return correct / len(corpus), elapsed / (rounds * len(corpus)) * 1e6
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="动作解析器基准")
+    arg_parser.add_argument("--corpus", help="录制的模型输出 JSONL 文件，默认使用内置语料")
+    arg_parser.add_argument("--rounds", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else CORPUS
+    parser = ActionParser(build_browser_tools())
+    print(f"语料 {len(corpus)} 条，每条解析 {args.rounds} 次")
+    for name, parse in (("json.loads 整段解析", legacy_parse), ("ActionParser", parser.parse)):
+        accuracy, micros = evaluate(parse, corpus, args.rounds)
+        print(f"{name:<20} 正确率 {accuracy:6.1%} | {micros:8.1f} µs/次")
+
+
+if __name__ == "__main__":
+    main()
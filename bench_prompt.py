@@ -0,0 +1,95 @@
+import time
+from typing import List, Optional
+
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, create_model
+
+from deepseek_wrapper import DeepseekToolWrapper
+
+# 仿照 browser-use 控制器注册的动作，参数模型与之一致
+BROWSER_ACTIONS = {
+    "done": ("完成任务并返回结果", {"text": (str, ...)}),
+    "search_google": ("在当前标签页中用 Google 搜索", {"query": (str, ...)}),
+    "go_to_url": ("在当前标签页打开网址", {"url": (str, ...)}),
+    "go_back": ("返回上一页", {}),
+    "click_element": ("点击元素", {"index": (int, ...), "xpath": (Optional[str], None)}),
+    "input_text": ("向可交互元素输入文本", {"index": (int, ...), "text": (str, ...), "xpath": (Optional[str], None)}),
+    "switch_tab": ("切换标签页", {"page_id": (int, ...)}),
+    "open_tab": ("在新标签页打开网址", {"url": (str, ...)}),
+    "close_tab": ("关闭标签页", {"page_id": (int, ...)}),
+    "extract_content": ("提取页面内容", {"goal": (str, ...)}),
+    "scroll_down": ("向下滚动页面", {"amount": (Optional[int], None)}),
+    "scroll_up": ("向上滚动页面", {"amount": (Optional[int], None)}),
+    "send_keys": ("发送特殊按键，如 Enter、Escape", {"keys": (str, ...)}),
+    "scroll_to_text": ("滚动到包含指定文本的位置", {"text": (str, ...)}),
+    "get_dropdown_options": ("获取下拉框全部选项", {"index": (int, ...)}),
+    "select_dropdown_option": ("选择下拉框选项", {"index": (int, ...), "text": (str, ...)}),
+    "hover_element": ("鼠标悬停在元素上", {"index": (int, ...)}),
+    "wait": ("等待指定秒数", {"seconds": (int, 3)}),
+    "refresh_page": ("刷新当前页面", {}),
+    "take_screenshot": ("截取当前页面", {"full_page": (bool, False)}),
+    "upload_file": ("向文件输入框上传文件", {"index": (int, ...), "path": (str, ...)}),
+    "press_enter": ("在当前焦点元素上按回车", {}),
+    "get_page_title": ("获取页面标题", {}),
+    "play_video": ("播放页面中的视频", {"index": (Optional[int], None)}),
+}
+
+
+def _noop(**kwargs) -> str:
+    return "ok"
+
+
+def build_browser_tools() -> List[StructuredTool]:
+    """构建与 browser-use 动作相同规模的工具列表"""
+    tools = []
+    for name, (description, fields) in BROWSER_ACTIONS.items():
+        args_schema = create_model(f"{name}_params", __base__=BaseModel, **fields)
+        tools.append(
+            StructuredTool.from_function(
+                func=_noop, name=name, description=description, args_schema=args_schema
+            )
+        )
+    return tools
+
+
+def build_history(steps: int) -> list:
+    """模拟 agent 每一步累积的消息历史"""
+    messages = [SystemMessage(content="你是浏览器自动化助手。")]
+    for step in range(steps):
+        messages.append(HumanMessage(content=f"第 {step} 步页面状态: [{step}]<button>搜索</button>"))
+        messages.append(AIMessage(content='{"action": "click_element", "params": {"index": 1}}'))
+    return messages
+
+
+def measure(model: DeepseekToolWrapper, messages: list, rounds: int, cached: bool) -> float:
+    """返回每次构建提示词的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if not cached:
+            model._tool_catalogue_cache.clear()
+            model._prompt_states.clear()
+        model._format_messages_to_prompt(messages)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    tools = build_browser_tools()
+    messages = build_history(steps=8)
+    rounds = 500
+
+    print(f"已绑定动作数: {len(tools)}，每组测量 {rounds} 次")
+    for compact in (False, True):
+        model = DeepseekToolWrapper(compact_tools=compact).bindTools(tools)
+        uncached = measure(model, messages, rounds, cached=False)
+        cached = measure(model, messages, rounds, cached=True)
+        catalogue = model._format_tool_descriptions()
+        mode = "紧凑" if compact else "缩进"
+        print(
+            f"[{mode}] 无缓存 {uncached:8.1f} µs/步 | 有缓存 {cached:8.1f} µs/步 | "
+            f"加速 {uncached / cached:5.1f}x | 工具目录 {len(catalogue)} 字符"
+        )
+
+
+if __name__ == "__main__":
+    main()
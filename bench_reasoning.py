@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import time
+
+from browser_use import Agent
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_ollama import ChatOllama
+
+from batch_runner import DEFAULT_AGENT_OPTIONS
+from bench_dom import agent_reply
+from deepseek_wrapper import DeepseekToolWrapper
+from fake_ollama import FakeOllama
+from history_window import estimate_tokens
+from reasoning_budget import ReasoningBudget
+from replay import Cassette, ReplayBrowserContext, replay_agent
+
+# 桩服务逐字输出，中文推理约一字一个 token，与 ReasoningBudget 按流式块计数一致
+CHUNK_CHARS = 1
+
+
+class TokenCounter(BaseCallbackHandler):
+    """累计流式输出的全部文本（含推理段和提前停止前已生成的部分），按 estimate_tokens 折算"""
+
+    def __init__(self):
+        self.parts = []
+
+    def on_llm_new_token(self, token: str, *, chunk=None, **kwargs):
+        # 包装器直接回调时 token 为含推理段的原始文本；经 astream 调用时推理段在块的 reasoning_content 中
+        if chunk is not None:
+            token += chunk.message.additional_kwargs.get("reasoning_content") or ""
+        self.parts.append(token)
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens("".join(self.parts))
+
+
+def reasoning(tokens: int) -> str:
+    sentence = "先确认当前页面的状态再决定下一步点击哪个元素"
+    return (sentence * (tokens // len(sentence) + 1))[:tokens]
+
+
+def reasoning_tokens(step: int, plan: int, simple: int, overthink_every: int) -> int:
+    """第一步规划整个任务，之后的简单操作也会想很久，每隔几步还有一次远超需要的长推理"""
+    if step == 0:
+        return plan
+    return simple * 6 if overthink_every and step % overthink_every == 0 else simple
+
+
+async def run_agent(cassette: Cassette, mode: str, args) -> dict:
+    steps = len(cassette.entries["state"])
+
+    def step_of(body: dict) -> int:
+        # 历史中的每个动作渲染为一条 Assistant 消息，第一条是 browser-use 的示例
+        return body["prompt"].count("\nAssistant: ") - 1
+
+    def reasoner_reply(body: dict) -> str:
+        step = step_of(body)
+        think = reasoning(reasoning_tokens(step, args.plan_tokens, args.simple_tokens, args.overthink_every))
+        return f"<think>{think}</think>\n{agent_reply(done=step == steps - 1)}"
+
+    def fast_reply(body: dict) -> str:
+        return agent_reply(done=step_of(body) == steps - 1)
+
+    counter = TokenCounter()
+    server_options = {"token_delay": args.token_delay, "chunk_size": CHUNK_CHARS}
+    with FakeOllama(responses=[reasoner_reply], **server_options) as slow, \
+            FakeOllama(responses=[fast_reply], **server_options) as quick:
+        reasoner = DeepseekToolWrapper(base_url=slow.url, callbacks=[counter])
+        llm = reasoner
+        if mode != "只用推理模型":
+            llm = ReasoningBudget(
+                reasoner=reasoner,
+                fast=DeepseekToolWrapper(model_name="qwen2:7b", base_url=quick.url, callbacks=[counter]),
+                max_reasoning_tokens=args.budget,
+                route_simple=mode == "预算+简单步骤路由",
+            )
+        agent = Agent(task=cassette.meta["task"], llm=llm, browser_context=ReplayBrowserContext(cassette), **DEFAULT_AGENT_OPTIONS)
+        replay_agent(agent, cassette)
+        start = time.perf_counter()
+        history = await agent.run(max_steps=steps + 2)
+        elapsed = time.perf_counter() - start
+    return {
+        "done": history.is_done(),
+        "steps": len(history.history),
+        "seconds": elapsed,
+        "completion_tokens": counter.tokens,
+        "stats": llm.stats() if isinstance(llm, ReasoningBudget) else None,
+        "tasks": llm.task_stats() if isinstance(llm, ReasoningBudget) else None,
+    }
+
+
+def task_savings(task: dict, args) -> dict:
+    """与不设上限的推理模型逐步对比：每一步不设上限时的推理长度由 reasoning_tokens 给出
+
+    截断节省：被推理上限截断的步骤，不设上限时的推理减去截断前已生成的推理；
+    路由节省：交给快速模型的步骤，不设上限时的推理；历史节省：去掉历史推理段少发送的提示词 token。
+    """
+    capped = routed = 0
+    for step, record in enumerate(task["step_log"]):
+        unbounded = reasoning_tokens(step, args.plan_tokens, args.simple_tokens, args.overthink_every)
+        if record["capped"]:
+            capped += max(0, unbounded - record["reasoning_tokens"])
+        elif record["model"] == "fast":
+            routed += unbounded
+    history = task["history_tokens_stripped"]
+    return {"capped": capped, "routed": routed, "history": history, "total": capped + routed + history}
+
+
+def run_chat(turns: int, think_tokens: int, strip: bool) -> int:
+    """多轮对话，历史中保留 ChatOllama 返回的原始回复（含 <think>），返回各轮请求的提示词 token 合计"""
+    reply = f"<think>{reasoning(think_tokens)}</think>\n好的，已记下。"
+    with FakeOllama(responses=[reply]) as server:
+        chat = ChatOllama(model="deepseek-r1:7b", base_url=server.url)
+        llm = ReasoningBudget(reasoner=chat, fast=chat, route_simple=False, max_reasoning_tokens=None) if strip else chat
+        messages = []
+        for turn in range(turns):
+            messages.append(HumanMessage(content=f"第 {turn + 1} 个问题：记录今天的第 {turn + 1} 条待办"))
+            answer = llm.invoke(messages)
+            messages.append(AIMessage(content=answer.content))
+        return sum(
+            estimate_tokens("".join(message.get("content") or "" for message in body.get("messages") or []))
+            for body in server.requests
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比推理模型每步完整推理与推理预算（上限、去掉历史推理段、简单步骤路由）的 token 和耗时")
+    parser.add_argument("--cassette", default="recordings/dom_pages.jsonl")
+    parser.add_argument("--budget", type=int, default=1024, help="每步推理 token 上限")
+    parser.add_argument("--plan-tokens", type=int, default=700, help="第一步的推理长度")
+    parser.add_argument("--simple-tokens", type=int, default=400, help="简单步骤的推理长度")
+    parser.add_argument("--overthink-every", type=int, default=4, help="每隔几步出现一次 6 倍长的推理，0 表示没有")
+    parser.add_argument("--token-delay", type=float, default=0.001, help="桩服务逐块输出间隔（秒）")
+    args = parser.parse_args()
+
+    cassette = Cassette.load(args.cassette)
+    results = {}
+    for mode in ("只用推理模型", "推理预算", "预算+简单步骤路由"):
+        results[mode] = asyncio.run(run_agent(cassette, mode, args))
+
+    baseline = results["只用推理模型"]["completion_tokens"]
+    print(f"\n任务：{cassette.meta['task']}（{len(cassette.entries['state'])} 步，推理上限 {args.budget}）")
+    print(f"{'模式':<18}{'完成':>6}{'步数':>6}{'生成tok':>10}{'节省':>8}{'耗时(s)':>9}")
+    for mode, result in results.items():
+        saved = 1 - result["completion_tokens"] / baseline
+        print(
+            f"{mode:<18}{'是' if result['done'] else '否':>6}{result['steps']:>7}"
+            f"{result['completion_tokens']:>11}{saved:>9.0%}{result['seconds']:>9.2f}"
+        )
+    for mode, result in results.items():
+        if result["stats"]:
+            print(f"  {mode}：{result['stats']}")
+
+    print("\n每个任务节省的 token（与只用推理模型逐步对比）")
+    print(f"{'模式':<18}{'任务':<16}{'截断步数':>8}{'截断节省':>10}{'路由步数':>8}{'路由节省':>10}{'历史节省':>10}{'合计':>8}")
+    for mode, result in results.items():
+        for number, stats in enumerate((result["tasks"] or {}).values(), 1):
+            saved = task_savings(stats, args)
+            print(
+                f"{mode:<18}{f'任务 {number}':<16}{stats['capped_steps']:>10}{saved['capped']:>12}"
+                f"{stats['routed_steps']:>10}{saved['routed']:>12}{saved['history']:>12}{saved['total']:>10}"
+            )
+
+    plain, stripped = run_chat(turns=8, think_tokens=300, strip=False), run_chat(turns=8, think_tokens=300, strip=True)
+    print(f"\n8 轮对话（每轮回复含 300 token 推理）提示词合计：原样保留 {plain} token，去掉历史推理段 {stripped} token（{1 - stripped / plain:.0%}）")
+
+
+if __name__ == "__main__":
+    main()
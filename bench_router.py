@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+from langchain_ollama import ChatOllama
+
+from fake_ollama import FakeOllama
+from llm_router import LLMRouter
+
+
+class SpikyLatency:
+    """脚本化响应：每 every 次请求有一次慢 spike 秒，其余 base 秒；down 为 True 时直接断开连接"""
+
+    def __init__(self, base: float, spike: float, every: int, text: str = "ok"):
+        self.base = base
+        self.spike = spike
+        self.every = every
+        self.text = text
+        self.count = 0
+        self.down = False
+        self._lock = threading.Lock()
+
+    def __call__(self, body: dict) -> str:
+        if self.down:
+            # 桩服务的处理线程出错时不返回响应直接关闭连接，与进程崩溃时客户端看到的一致
+            raise ConnectionAbortedError("后端已宕机")
+        with self._lock:
+            self.count += 1
+            slow = self.every and self.count % self.every == 0
+        time.sleep(self.spike if slow else self.base)
+        return self.text
+
+
+async def run(llm, requests: int, outage_at=None, outage=None) -> dict:
+    """顺序发出请求，返回每次耗时和失败数；第 outage_at 次起 outage 宕机"""
+    latencies, failures = [], 0
+    for i in range(requests):
+        if outage is not None and i == outage_at:
+            outage.down = True
+        start = time.perf_counter()
+        try:
+            await llm.ainvoke("你好")
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            failures += 1
+    return {"latencies": latencies, "failures": failures}
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+def report(name: str, result: dict):
+    latencies = result["latencies"]
+    print(
+        f"{name:<22}{statistics.median(latencies) if latencies else float('nan'):>8.3f}"
+        f"{percentile(latencies, 0.95):>8.3f}{percentile(latencies, 0.99):>8.3f}"
+        f"{max(latencies, default=float('nan')):>8.3f}{sum(latencies):>9.2f}{result['failures']:>6}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在注入延迟的桩服务上对比单后端、回退和对冲请求的延迟分布")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--primary-latency", type=float, default=0.05, help="主后端正常耗时（秒）")
+    parser.add_argument("--spike", type=float, default=1.5, help="主后端慢请求耗时（秒）")
+    parser.add_argument("--spike-every", type=int, default=25, help="每多少次请求出现一次慢请求")
+    parser.add_argument("--fallback-latency", type=float, default=0.15, help="备用后端耗时（秒）")
+    parser.add_argument("--timeout", type=float, default=1.0, help="回退模式的单后端超时（秒）")
+    args = parser.parse_args()
+
+    print(f"\n{'模式':<20}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'合计(s)':>9}{'失败':>6}   (秒)")
+
+    def servers():
+        latency = SpikyLatency(args.primary_latency, args.spike, args.spike_every)
+        primary = FakeOllama(responses=[latency])
+        fallback = FakeOllama(responses=[SpikyLatency(args.fallback_latency, 0, 0)])
+        return primary.start(), fallback.start(), latency
+
+    def backends(primary, fallback):
+        return [ChatOllama(model="primary", base_url=primary.url), ChatOllama(model="fallback", base_url=fallback.url)]
+
+    # 主后端每 spike_every 次请求有一次很慢
+    modes = {
+        "仅主后端": lambda b: b[0],
+        "回退（超时）": lambda b: LLMRouter(backends=b, timeout=args.timeout),
+        "对冲（p95）": lambda b: LLMRouter(backends=b, hedge=True, hedge_delay=args.primary_latency * 4),
+    }
+    routers = {}
+    for outage in (False, True):
+        # 宕机场景：主后端在一半请求之后不再响应
+        for name, build in modes.items():
+            primary, fallback, latency = servers()
+            llm = build(backends(primary, fallback))
+            if not outage:
+                routers[name] = llm
+            result = asyncio.run(run(llm, args.requests, args.requests // 2, latency if outage else None))
+            report(f"{name}·宕机" if outage else name, result)
+            primary.stop()
+            fallback.stop()
+        print()
+
+    print(f"对冲统计：{routers['对冲（p95）'].stats()}")
+
+
+if __name__ == "__main__":
+    main()
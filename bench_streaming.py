@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+from langchain_core.messages import HumanMessage
+
+from bench_prompt import build_browser_tools
+from deepseek_wrapper import DeepseekToolWrapper
+from fake_ollama import FakeOllama
+
+# DeepSeek-R1 风格的输出：推理段、动作 JSON、之后继续输出解释
+R1_REPLY = (
+    "<think>\n" + "用户要在 bilibili 搜索 AI-ToolKit，先找到搜索框。" * 40 + "\n</think>\n"
+    "```json\n"
+    '{"action": "input_text", "params": {"index": 5, "text": "AI-ToolKit"}, "thought": "在搜索框输入关键词"}\n'
+    "```\n"
+    + "以上动作会在搜索框中输入关键词，接下来需要点击搜索按钮并切换到用户标签页。" * 30
+)
+
+
+async def measure(stop_on_action: bool, rounds: int) -> tuple:
+    """返回 (平均耗时秒, 解析出的动作名)"""
+    with FakeOllama(responses=[R1_REPLY], token_delay=0.002, chunk_size=8) as server:
+        model = DeepseekToolWrapper(base_url=server.url, stop_on_action=stop_on_action).bindTools(build_browser_tools())
+        messages = [HumanMessage(content="在 bilibili 搜索 AI-ToolKit")]
+        start = time.perf_counter()
+        for _ in range(rounds):
+            result = await model.agenerate([messages])
+        elapsed = (time.perf_counter() - start) / rounds
+    action = result.generations[0][0].generation_info["parsed_response"]["action"]
+    return elapsed, action
+
+
+async def main():
+    rounds = 3
+    print(f"脚本化 R1 输出 {len(R1_REPLY)} 字符，每 8 字符一块，块间隔 2ms")
+    for stop_on_action in (False, True):
+        elapsed, action = await measure(stop_on_action, rounds)
+        mode = "流式提前返回" if stop_on_action else "等待完整输出"
+        print(f"{mode}: {elapsed * 1000:7.1f} ms/步，解析结果 action={action}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
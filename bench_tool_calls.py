@@ -0,0 +1,118 @@
+import argparse
+import random
+import time
+
+import numpy as np
+from langchain.tools import tool
+
+from tool_executor import ToolExecutor
+
+# 模拟远程工具的耗时（秒），0 表示纯计算
+LATENCY = {"value": 0.0}
+
+
+@tool
+def multiply(first: int, second: int) -> int:
+    """实现两个整数的乘法运算。"""
+    time.sleep(LATENCY["value"])
+    return first * second
+
+
+@tool
+def add(first: int, second: int) -> int:
+    """实现两个整数的加法运算。"""
+    time.sleep(LATENCY["value"])
+    return first + second
+
+
+@tool
+def exponentiate(base: int, exponent: int) -> int:
+    """实现指数运算。"""
+    time.sleep(LATENCY["value"])
+    return base**exponent
+
+
+tools = [multiply, add, exponentiate]
+
+VECTORIZED = {
+    "multiply": lambda first, second: np.multiply(first, second),
+    "add": lambda first, second: np.add(first, second),
+    "exponentiate": lambda base, exponent: np.power(base, exponent),
+}
+
+
+def legacy_tool_chain(input):
+    """改造前 testTool1.py 的 tool_chain：深度优先逐个调用"""
+    tool_map = {tool.name: tool for tool in tools}
+    choose_tool = tool_map[input["name"]]
+    arguments = input["arguments"].copy()
+    for key, value in arguments.items():
+        if isinstance(value, dict):
+            arguments[key] = legacy_tool_chain(value)
+    return choose_tool.invoke(arguments)
+
+
+def random_call(rng: random.Random, depth: int):
+    """随机嵌套调用，叶子取值范围小，子调用之间常有重复"""
+    if depth == 0:
+        return rng.randint(1, 9)
+    name = rng.choice(["multiply", "add", "add"]) if depth > 1 else rng.choice(["multiply", "add", "exponentiate"])
+    keys = ("base", "exponent") if name == "exponentiate" else ("first", "second")
+    exponent = rng.randint(0, 3)
+    return {
+        "name": name,
+        "arguments": {
+            keys[0]: random_call(rng, depth - 1),
+            keys[1]: exponent if name == "exponentiate" else random_call(rng, depth - 1),
+        },
+    }
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比深度优先逐个调用与依赖图执行器处理嵌套工具调用的耗时")
+    parser.add_argument("--depth", type=int, default=4, help="单个嵌套调用的深度")
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="单个调用场景中每次工具调用的耗时（秒）")
+    parser.add_argument("--batch", type=int, default=2000, help="批量场景的调用个数")
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    # 单个嵌套调用：工具较慢时，同一层的子调用可以同时执行
+    LATENCY["value"] = args.tool_latency
+    call = {
+        "name": "add",
+        "arguments": {
+            "first": random_call(rng, args.depth - 1),
+            "second": {"name": "multiply", "arguments": {"first": random_call(rng, args.depth - 2), "second": 2}},
+        },
+    }
+    expected, legacy_seconds = timed(lambda: legacy_tool_chain(call))
+    executor = ToolExecutor(tools, max_workers=16)
+    result, dag_seconds = timed(lambda: executor.run(call))
+    assert result == expected
+    print(f"\n单个嵌套调用（深度 {args.depth}，每次工具调用 {args.tool_latency * 1000:.0f}ms）")
+    print(f"  深度优先逐个调用  {legacy_seconds:>7.3f}s")
+    print(f"  依赖图并发执行    {dag_seconds:>7.3f}s  {legacy_seconds / dag_seconds:.1f}x  {executor.stats}")
+
+    # 批量：纯计算工具，同一层的同类调用合并为数组运算
+    LATENCY["value"] = 0.0
+    calls = [random_call(rng, args.depth) for _ in range(args.batch)]
+    expected, legacy_seconds = timed(lambda: [legacy_tool_chain(call) for call in calls])
+    rows = [("深度优先逐个调用", legacy_seconds, expected, None)]
+    for name, vectorized in (("依赖图·逐个执行", None), ("依赖图·向量化", VECTORIZED)):
+        executor = ToolExecutor(tools, vectorized=vectorized)
+        results, seconds = timed(lambda: executor.run_batch(calls))
+        rows.append((name, seconds, results, executor.stats))
+    print(f"\n批量 {args.batch} 个嵌套调用（深度 {args.depth}）")
+    for name, seconds, results, stats in rows:
+        same = "一致" if results == expected else "不一致"
+        print(f"  {name:<16}{seconds:>7.3f}s  {legacy_seconds / seconds:>5.1f}x  {same}  {stats or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from browser_use import Browser, BrowserConfig
+
+# 各浏览器的环境变量覆盖、PATH 中的可执行文件名和常见安装路径
+BROWSERS: Dict[str, Dict[str, List[str]]] = {
+    "chrome": {
+        "env": ["CHROME_PATH"],
+        "names": ["google-chrome", "google-chrome-stable", "chrome", "chromium", "chromium-browser"],
+        "paths": [
+            # Windows 路径
+            r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+            r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+            # MacOS 路径
+            "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+            # Linux 路径
+            "/usr/bin/google-chrome",
+            "/opt/google/chrome/chrome",
+        ],
+    },
+    "edge": {
+        "env": ["EDGE_PATH"],
+        "names": ["msedge", "microsoft-edge", "microsoft-edge-stable"],
+        "paths": [
+            r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe",
+            r"C:\Program Files\Microsoft\Edge\Application\msedge.exe",
+            "/Applications/Microsoft Edge.app/Contents/MacOS/Microsoft Edge",
+            "/usr/bin/microsoft-edge",
+        ],
+    },
+}
+
+# 发现结果缓存在磁盘上，后续运行只需确认一次路径仍然存在
+CACHE_FILE = Path(os.getenv("BROWSER_CACHE_FILE", Path.home() / ".cache" / "browser_launcher.json"))
+
+
+def _read_cache() -> Dict[str, str]:
+    try:
+        return json.loads(CACHE_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(kind: str, path: str):
+    cache = _read_cache()
+    cache[kind] = path
+    try:
+        CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        CACHE_FILE.write_text(json.dumps(cache, ensure_ascii=False), encoding="utf-8")
+    except OSError:
+        # 缓存写不进去不影响本次运行
+        pass
+
+
+def _discover(kind: str) -> Optional[str]:
+    """按 环境变量 > 磁盘缓存 > PATH > 常见安装路径 的顺序查找"""
+    spec = BROWSERS[kind]
+    for env in spec["env"]:
+        path = os.getenv(env)
+        if path and Path(path).exists():
+            return path
+
+    cached = _read_cache().get(kind)
+    if cached and Path(cached).exists():
+        return cached
+
+    for name in spec["names"]:
+        path = shutil.which(name)
+        if path:
+            return path
+    for path in spec["paths"]:
+        if Path(path).exists():
+            return path
+    return None
+
+
+@lru_cache(maxsize=None)
+def find_browser(kind: str = "chrome") -> str:
+    """返回浏览器可执行文件路径，同一进程内只查找一次"""
+    if kind not in BROWSERS:
+        raise ValueError(f"不支持的浏览器类型：{kind}")
+    path = _discover(kind)
+    if not path:
+        env = BROWSERS[kind]["env"][0]
+        raise FileNotFoundError(
+            f"未找到 {kind} 安装路径，请确认：\n"
+            f"1. 已安装最新版浏览器\n"
+            f"2. 如果使用自定义安装路径，请设置环境变量 {env}"
+        )
+    _write_cache(kind, path)
+    return path
+
+
+def cdp_available(cdp_url: str, timeout: float = 0.3) -> bool:
+    """检查 CDP 地址上是否有可连接的浏览器"""
+    try:
+        with urllib.request.urlopen(f"{cdp_url}/json/version", timeout=timeout) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def _configure_browser(kind: str, **config) -> Browser:
+    # 有预热的浏览器时直接通过 CDP 连接，省去冷启动
+    cdp_url = os.getenv("BROWSER_CDP_URL")
+    if cdp_url and cdp_available(cdp_url):
+        return Browser(config=BrowserConfig(cdp_url=cdp_url, **config))
+    return Browser(config=BrowserConfig(chrome_instance_path=find_browser(kind), **config))
+
+
+def configure_chrome_browser(**config) -> Browser:
+    """配置Chrome浏览器实例，额外参数传给 BrowserConfig"""
+    return _configure_browser("chrome", **config)
+
+
+def configure_edge_browser(**config) -> Browser:
+    """配置Edge浏览器实例，额外参数传给 BrowserConfig"""
+    return _configure_browser("edge", **config)
+
+
+def start_warm_browser(
+    kind: str = "chrome",
+    port: int = 9222,
+    headless: bool = False,
+    user_data_dir: Optional[str] = None,
+    timeout: float = 15.0,
+) -> subprocess.Popen:
+    """启动一个开启远程调试端口的浏览器，供后续 agent 通过 CDP 连接"""
+    args = [
+        find_browser(kind),
+        f"--remote-debugging-port={port}",
+        f"--user-data-dir={user_data_dir or tempfile.mkdtemp(prefix='warm_browser_')}",
+        "--no-first-run",
+        "--no-default-browser-check",
+    ]
+    if headless:
+        args.append("--headless=new")
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    cdp_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cdp_available(cdp_url):
+            return process
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"浏览器未能在 {timeout} 秒内开放调试端口 {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="浏览器发现与预热")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("find", help="打印发现的浏览器路径").add_argument("--kind", default="chrome", choices=list(BROWSERS))
+    warm = sub.add_parser("warm", help="启动预热浏览器并保持运行")
+    warm.add_argument("--kind", default="chrome", choices=list(BROWSERS))
+    warm.add_argument("--port", type=int, default=9222)
+    warm.add_argument("--headless", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "find":
+        print(find_browser(args.kind))
+        return
+
+    process = start_warm_browser(args.kind, port=args.port, headless=args.headless)
+    print(f"预热浏览器已启动，请设置 BROWSER_CDP_URL=http://127.0.0.1:{args.port} 后运行 agent，Ctrl+C 退出")
+    try:
+        process.wait()
+    except KeyboardInterrupt:
+        process.terminate()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import os
+import sys
+from typing import List, Optional
+
+# 只导入标准库和 backends.py（各后端的依赖在其工厂函数内部导入），
+# browser-use、LangChain 和所选后端在执行 run 时才加载，--help 和参数错误可以立即返回
+from backends import BACKENDS, DEFAULT_AGENT_OPTIONS, create_llm
+
+BROWSERS = ("chrome", "edge")
+
+
+async def run(args: argparse.Namespace) -> int:
+    from browser_use import Agent
+
+    from browser_launcher import configure_chrome_browser, configure_edge_browser
+    from page_guard import guard_page_changes
+
+    llm = create_llm(args.backend, model=args.model)
+    if args.dry_run:
+        print(f"已加载 {args.backend} 后端：{type(llm).__name__}")
+        return 0
+
+    configure = configure_edge_browser if args.browser == "edge" else configure_chrome_browser
+    browser = configure(headless=args.headless)
+    try:
+        agent = Agent(task=args.task, llm=llm, browser=browser, **DEFAULT_AGENT_OPTIONS)
+        # 一步中的多个动作在页面跳转后不再继续执行
+        guard_page_changes(agent)
+        history = await agent.run(max_steps=args.max_steps)
+    finally:
+        await browser.close()
+        if args.backend == "wrapper":
+            # 关闭包装器共享的 Ollama 连接，避免事件循环结束时出现未关闭连接的警告；其他后端不加载 ollama 客户端
+            from ollama_pool import close_async_pools
+
+            await close_async_pools()
+    print(f"\n执行结果：{history.final_result()}")
+    return 0 if history.is_done() else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="AI-ToolKit 浏览器 Agent 命令行入口")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="用选定的模型后端运行一个浏览器任务")
+    run_parser.add_argument("--backend", default="wrapper", choices=list(BACKENDS))
+    run_parser.add_argument("--task", required=True, help="任务描述")
+    run_parser.add_argument("--model", help="覆盖后端的默认模型")
+    run_parser.add_argument("--max-steps", type=int, default=30)
+    run_parser.add_argument("--browser", default=os.getenv("AGENT_BROWSER", "chrome"), choices=BROWSERS)
+    run_parser.add_argument("--headless", action="store_true")
+    run_parser.add_argument("--dry-run", action="store_true", help="只加载模块并创建模型，不启动浏览器，用于检查配置和测量启动耗时")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == "run":
+        return asyncio.run(run(args))
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,150 +1,922 @@
-from typing import List, Optional, Any, Dict
-from langchain.callbacks.manager import CallbackManagerForLLMRun
+from typing import List, Optional, Any, Dict, Tuple, Union, Iterator, AsyncIterator, Sequence, Callable
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from langchain.callbacks.manager import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
 from langchain.schema import BaseMessage
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import AIMessage, SystemMessage, HumanMessage
-from langchain_core.tools import BaseTool
-from pydantic import Field
-from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.messages import AIMessage, AIMessageChunk, SystemMessage, HumanMessage, ToolMessage, ToolCall
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool, StructuredTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field, PrivateAttr
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult, GenerationChunk
 from langchain_ollama import OllamaLLM
+import asyncio
+import hashlib
 import json
+import threading
+import time
+import uuid
+
+from action_parser import THINK_CLOSE, THINK_OPEN, ActionParser, ActionScanner, ReasoningSplitter, strip_reasoning
+from dom_compressor import DomCompressor
+from history_window import HistoryWindow, estimate_tokens
+from llm_utils import evict_oldest, tool_signature, tools_key
+from ollama_pool import async_pool, backoff_delay, close_async_pools, is_retryable, sync_pool
+
+# 固定的系统说明，放在提示词最前面以便服务端复用 KV 缓存
+SYSTEM_PREAMBLE = """
+        你是一个专门用于浏览器自动化的AI助手。你可以：
+        1. 理解和执行网页操作任务
+        2. 使用提供的工具进行交互
+        3. 处理页面状态和DOM元素
+        4. 正确处理错误和异常情况
+        """
+
+TOOL_FORMAT_HINT = """
+            使用工具时，请遵循以下格式：
+            {
+                "action": "工具名称",
+                "params": {
+                    "参数名": "参数值"
+                },
+                "thought": "行动原因说明"
+            }
+            """
+
+# max_actions > 1 时代替 TOOL_FORMAT_HINT，{max_actions} 在渲染时替换
+PLAN_FORMAT_HINT = """
+            使用工具时，请遵循以下格式，可以一次给出按顺序执行的多个动作（最多 {max_actions} 个）：
+            {{
+                "actions": [
+                    {{"action": "工具名称", "params": {{"参数名": "参数值"}}}}
+                ],
+                "thought": "行动原因说明"
+            }}
+            只有能够预见的连续操作（例如输入文本、按回车、点击标签页）才放在一起；
+            后面的动作需要先看到前一个动作的结果时，只给出第一个动作。
+            """
+
+
+@dataclass
+class PromptState:
+    """单个对话已渲染的提示词，用于增量拼接"""
+    header: str
+    fingerprints: List[tuple] = field(default_factory=list)
+    # offsets[i] 为前 i 条消息渲染后提示词的长度
+    offsets: List[int] = field(default_factory=list)
+    prompt: str = ""
+    # 上一次请求返回的 Ollama context 及生成它的请求的消息指纹，
+    # 只有当前消息以这些指纹开头时 context 才对应当前前缀
+    context: Optional[List[int]] = None
+    context_fingerprints: List[tuple] = field(default_factory=list)
+
+
+@dataclass
+class GenerationStats:
+    """单次生成中包装器自身的耗时和 token 数，随结果上报给回调"""
+    prompt_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    prompt_chars: int = 0
+    # Ollama 只在生成完整结束时返回 token 数，提前返回时按流式块数和提示词长度估算
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    chunks: int = 0
+
 
 class DeepseekToolWrapper(BaseChatModel):
     """Deepseek 模型的工具调用包装器，专门用于浏览器自动化任务"""
     
     ollama: OllamaLLM = Field(default=None)
     tools: List[BaseTool] = Field(default_factory=list)
+    # 紧凑模式下工具目录不缩进，减少提示词 token
+    compact_tools: bool = Field(default=False)
+    # 每次回复最多包含的动作数，大于 1 时提示词改为动作列表格式，回复中的每个动作对应一个 tool_call
+    max_actions: int = Field(default=1)
+    # 把由已绑定工具生成的 JSON schema 作为 Ollama 的 format 参数，按语法约束解码，每次回复都是合法动作；
+    # 约束下模型不再输出 <think> 推理段，也不能直接给出最终回答，只适合每一步都必须调用工具的场景（如 browser-use）
+    constrained_output: bool = Field(default=False)
+    
+    # 工具目录缓存：键为 (工具版本, 渲染模式, 动作数上限, 各工具的名称、描述和参数 schema 摘要)
+    _tool_catalogue_cache: Dict[tuple, str] = PrivateAttr(default_factory=dict)
+    _parsers: Dict[tuple, ActionParser] = PrivateAttr(default_factory=dict)
+    _action_schemas: Dict[tuple, Dict] = PrivateAttr(default_factory=dict)
+    # bind_tools 传入的非 BaseTool 工具（pydantic 模型、函数、OpenAI 格式字典）按内容缓存的转换结果
+    _converted_tools: Dict[tuple, BaseTool] = PrivateAttr(default_factory=dict)
+    _tools_version: int = PrivateAttr(default=0)
+    
+    # 复用上一轮返回的 Ollama context，只发送新增消息；
+    # context 在生成完整结束时才返回，提前返回（stop_on_action）的轮次不会更新
+    reuse_context: bool = Field(default=False)
+    # 最多保留多少个对话的增量提示词状态
+    max_conversations: int = Field(default=32)
+    # 流式生成，扫描到第一个完整的动作 JSON 后立即返回并取消剩余生成
+    stop_on_action: bool = Field(default=True)
+    
+    # 同一 Ollama 服务的请求共用连接池，最多同时进行 max_in_flight 个，其余排队等待
+    max_in_flight: int = Field(default=4)
+    connect_timeout: float = Field(default=5.0)
+    # 两块输出之间的最长等待（秒），包括首块前的模型加载和预填充
+    request_timeout: float = Field(default=120.0)
+    # 收到任何输出之前的连接失败、超时和 5xx 按指数退避重试
+    max_retries: int = Field(default=2)
+    retry_backoff: float = Field(default=0.5)
+    # 压缩 browser-use 的当前页面状态：截断长文本、去掉重复的文本行，见 dom_compressor.py
+    compress_dom: bool = Field(default=False)
+    dom_max_text_chars: int = Field(default=80)
+    _dom_compressor: Optional[DomCompressor] = PrivateAttr(default=None)
+    # 提示词 token 预算（快速估算），超出时折叠早先的轮次，保留系统说明、工具目录、任务和最后 keep_last_turns 轮，
+    # 折叠的内容在请求结束后于后台并入滚动摘要，见 history_window.py；None 表示不限制
+    max_prompt_tokens: Optional[int] = Field(default=None)
+    keep_last_turns: int = Field(default=4)
+    # 生成摘要所用的模型，默认与包装器相同，可指定更小的模型
+    summary_model: Optional[str] = Field(default=None)
+    _history_window: Optional[HistoryWindow] = PrivateAttr(default=None)
+    _header_tokens: Dict[tuple, int] = PrivateAttr(default_factory=dict)
+    _prompt_states: "OrderedDict[tuple, PromptState]" = PrivateAttr(default_factory=OrderedDict)
+    # 多个 Agent 并发共用一个包装器时保护增量提示词状态
+    _state_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
     
     def __init__(
         self, 
         model_name: str = "deepseek-r1:1.5b",
         temperature: float = 0.7,
         max_tokens: int = 2048,
+        keep_alive: Union[int, str] = "30m",
+        base_url: Optional[str] = None,
         **kwargs
     ):
         super().__init__(**kwargs)
+        # keep_alive 让模型在步骤之间保持加载，服务端才能复用前缀的 KV 缓存
+        ollama_kwargs = {"base_url": base_url} if base_url else {}
         self.ollama = OllamaLLM(
             model=model_name,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            keep_alive=keep_alive,
+            **ollama_kwargs
         )
     
     @property
     def _llm_type(self) -> str:
         return "deepseek_wrapper"
+    
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        """区分模型配置的参数，响应缓存的键由此生成"""
+        return {
+            "model": self.ollama.model,
+            "temperature": self.ollama.temperature,
+            "compact_tools": self.compact_tools,
+            "max_actions": self.max_actions,
+            "constrained_output": self.constrained_output,
+            "compress_dom": self.compress_dom,
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "tools": [tool.name for tool in self.tools],
+        }
         
     def bindTools(self, tools: List[BaseTool]):
         self.tools = tools
+        # 绑定新工具后旧的目录缓存全部失效
+        self._tools_version += 1
+        self._tool_catalogue_cache.clear()
+        self._parsers.clear()
+        self._action_schemas.clear()
         return self
     
-    def _format_tool_descriptions(self) -> str:
+    def bind_tools(
+        self,
+        tools: Sequence[Union[Dict[str, Any], type, Callable, BaseTool]],
+        *,
+        tool_choice: Optional[Union[str, Dict]] = None,
+        **kwargs: Any,
+    ) -> Runnable:
+        """LangChain 标准接口，create_openai_tools_agent、with_structured_output 会调用
+        
+        与 bindTools 不同，这里不修改模型本身，而是把工具作为调用参数绑定，
+        同一个包装器可以同时服务多组工具。
+        """
+        formatted_tools = [self._convert_tool(tool) for tool in tools]
+        return self.bind(tools=formatted_tools, tool_choice=tool_choice, **kwargs)
+    
+    def _convert_tool(self, tool: Union[Dict[str, Any], type, Callable, BaseTool]) -> BaseTool:
+        """转换为 BaseTool，按内容缓存
+        
+        browser-use 每一步都以同一个 AgentOutput 模型调用 with_structured_output，
+        create_openai_tools_agent 每一步都传入同一组 OpenAI 格式字典，缓存后不必每步重新生成 schema。
+        """
+        if isinstance(tool, BaseTool):
+            return tool
+        key = tool_signature(tool)
+        converted = self._converted_tools.get(key)
+        if converted is None:
+            evict_oldest(self._converted_tools)
+            converted = self._converted_tools[key] = _to_base_tool(tool)
+        return converted
+    
+    def _resolve_tools(self, tools: Optional[Sequence[Any]]) -> Optional[List[BaseTool]]:
+        """把调用参数中的工具统一为 BaseTool，create_openai_tools_agent 直接用 bind(tools=[OpenAI 格式字典]) 绑定"""
+        if tools is None or all(isinstance(tool, BaseTool) for tool in tools):
+            return tools
+        return [self._convert_tool(tool) for tool in tools]
+    
+    def _tool_catalogue_key(self, tools: Optional[List[BaseTool]] = None) -> tuple:
+        """工具目录缓存键，按工具内容生成：每步重新创建的同一组工具命中同一条目，工具列表被原地修改时键随之变化"""
+        tools = self.tools if tools is None else tools
+        return (self._tools_version, self.compact_tools, self.max_actions, tools_key(tools))
+    
+    def _format_tool_descriptions(self, tools: Optional[List[BaseTool]] = None) -> str:
         """格式化工具描述，添加浏览器操作相关的说明"""
+        tools = self.tools if tools is None else tools
+        key = self._tool_catalogue_key(tools)
+        cached = self._tool_catalogue_cache.get(key)
+        if cached is not None:
+            return cached
+        
         tool_descriptions = []
-        for tool in self.tools:
+        for tool in tools:
+            schema = _args_schema(tool)
             desc = {
                 "name": tool.name,
                 "description": tool.description,
-                "parameters": tool.args_schema.schema() if tool.args_schema else None,
-                "required": tool.args_schema.schema().get("required", []) if tool.args_schema else []
+                "parameters": schema,
+                "required": schema.get("required", []) if schema else []
             }
             tool_descriptions.append(desc)
-        return json.dumps(tool_descriptions, ensure_ascii=False, indent=2)
+        
+        if self.compact_tools:
+            rendered = json.dumps(tool_descriptions, ensure_ascii=False, separators=(",", ":"))
+        else:
+            rendered = json.dumps(tool_descriptions, ensure_ascii=False, indent=2)
+        
+        # 只保留最近几组工具的渲染结果
+        evict_oldest(self._tool_catalogue_cache)
+        self._tool_catalogue_cache[key] = rendered
+        return rendered
+    
+    def _format_header(self, tools: Optional[List[BaseTool]] = None) -> str:
+        """渲染系统说明和工具说明，这部分在同一工具集下保持不变"""
+        tools = self.tools if tools is None else tools
+        prompt_parts = [SYSTEM_PREAMBLE]
+        if tools:
+            prompt_parts.append("可用工具:\n" + self._format_tool_descriptions(tools))
+            if self.max_actions > 1:
+                prompt_parts.append(PLAN_FORMAT_HINT.format(max_actions=self.max_actions))
+            else:
+                prompt_parts.append(TOOL_FORMAT_HINT)
+        return "\n".join(prompt_parts)
+    
+    @staticmethod
+    def _format_message(message: BaseMessage) -> Optional[str]:
+        """渲染单条消息，不支持的消息类型返回 None"""
+        if isinstance(message, SystemMessage):
+            return f"System: {message.content}"
+        elif isinstance(message, HumanMessage):
+            return f"Human: {message.content}"
+        elif isinstance(message, AIMessage):
+            if not message.content and message.tool_calls:
+                calls = [{"action": call["name"], "params": call["args"]} for call in message.tool_calls]
+                return f"Assistant: {json.dumps(calls, ensure_ascii=False)}"
+            return f"Assistant: {message.content}"
+        elif isinstance(message, ToolMessage):
+            name = message.name or message.additional_kwargs.get("name") or message.tool_call_id
+            return f"Tool({name}): {message.content}"
+        return None
+    
+    @staticmethod
+    def _fingerprint(message: BaseMessage) -> tuple:
+        # 字符串会缓存自身的哈希，同一消息对象重复计算几乎没有开销
+        content = message.content or str(getattr(message, "tool_calls", "") or "")
+        return (message.type, hash(content if isinstance(content, str) else str(content)))
+    
+    @staticmethod
+    def _task_message(messages: List[BaseMessage]) -> Optional[BaseMessage]:
+        """对话的任务消息：第一条 HumanMessage
+        
+        browser-use 的所有 Agent 共用同一条系统提示词，首条消息无法区分对话。
+        """
+        for message in messages:
+            if isinstance(message, HumanMessage):
+                return message
+        return messages[0] if messages else None
     
-    def _format_messages_to_prompt(self, messages: List[BaseMessage]) -> str:
+    def _prompt_state(self, messages: List[BaseMessage], tools: Optional[List[BaseTool]] = None) -> PromptState:
+        """按 (工具集, 任务消息) 找到对话的增量状态，超出上限时淘汰最久未用的，调用方需持有 _state_lock"""
+        task = self._task_message(messages)
+        key = (self._tool_catalogue_key(tools), self._fingerprint(task) if task is not None else None)
+        state = self._prompt_states.get(key)
+        if state is None:
+            header = self._format_header(tools)
+            state = PromptState(header=header, offsets=[len(header)], prompt=header)
+            self._prompt_states[key] = state
+            while len(self._prompt_states) > self.max_conversations:
+                self._prompt_states.popitem(last=False)
+        else:
+            self._prompt_states.move_to_end(key)
+        return state
+    
+    def _update_prompt_state(self, state: PromptState, messages: List[BaseMessage]) -> int:
+        """复用与上次相同的消息前缀，只渲染新增消息，返回复用的消息数"""
+        fingerprints = [self._fingerprint(message) for message in messages]
+        reused = 0
+        limit = min(len(fingerprints), len(state.fingerprints))
+        while reused < limit and fingerprints[reused] == state.fingerprints[reused]:
+            reused += 1
+        
+        prompt_parts = [state.prompt[:state.offsets[reused]]]
+        offsets = state.offsets[:reused + 1]
+        length = offsets[-1]
+        for message in messages[reused:]:
+            text = self._format_message(message)
+            if text is not None:
+                prompt_parts.append("\n" + text)
+                length += len(text) + 1
+            offsets.append(length)
+        
+        state.prompt = "".join(prompt_parts)
+        state.offsets = offsets
+        state.fingerprints = fingerprints
+        return reused
+    
+    def _format_messages_to_prompt(self, messages: List[BaseMessage], tools: Optional[List[BaseTool]] = None) -> str:
         """将消息转换为提示，添加浏览器自动化相关的上下文"""
-        prompt_parts = []
+        with self._state_lock:
+            state = self._prompt_state(messages, tools)
+            self._update_prompt_state(state, messages)
+            return state.prompt
+    
+    def _conversation_key(self, messages: List[BaseMessage], tools: Optional[List[BaseTool]] = None) -> tuple:
+        """页面状态压缩和历史窗口的对话键，按工具名称和任务消息区分
         
-        # 添加系统说明
-        prompt_parts.append("""
-        你是一个专门用于浏览器自动化的AI助手。你可以：
-        1. 理解和执行网页操作任务
-        2. 使用提供的工具进行交互
-        3. 处理页面状态和DOM元素
-        4. 正确处理错误和异常情况
-        """)
+        并发的 Agent 共用同一条系统提示词，按首条消息区分会让它们共用页面基准和折叠位置。
+        """
+        tools = self.tools if tools is None else tools
+        task = self._task_message(messages)
+        return (tuple(tool.name for tool in tools), self._stable_fingerprint(task) if task is not None else None)
+    
+    @staticmethod
+    def _stable_fingerprint(message: BaseMessage) -> tuple:
+        # 对话键随检查点保存，不能用每个进程随机化的 hash()；每次请求只算任务消息
+        content = message.content or str(getattr(message, "tool_calls", "") or "")
+        text = content if isinstance(content, str) else str(content)
+        return (message.type, hashlib.sha1(text.encode("utf-8")).hexdigest()[:16])
+    
+    def _compress_dom(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """开启 compress_dom 时压缩页面状态消息"""
+        if not self.compress_dom or not messages:
+            return messages
+        if self._dom_compressor is None:
+            self._dom_compressor = DomCompressor(max_text_chars=self.dom_max_text_chars)
+        return self._dom_compressor.compress(messages)
+    
+    def _summarize_history(self, prompt: str) -> str:
+        """在后台线程中调用，使用共享连接池"""
+        params = {"model": self.summary_model} if self.summary_model else {}
+        return strip_reasoning("".join(chunk.text for chunk in self._ollama_stream(prompt, params)))
+    
+    def _apply_history_window(
+        self, messages: List[BaseMessage], key: tuple, tools: Optional[List[BaseTool]] = None
+    ) -> List[BaseMessage]:
+        """设置了 max_prompt_tokens 时把消息裁剪到预算以内"""
+        if self.max_prompt_tokens is None or not messages:
+            return messages
+        history_window = self._get_history_window()
+        catalogue_key = self._tool_catalogue_key(tools)
+        fixed = self._header_tokens.get(catalogue_key)
+        if fixed is None:
+            evict_oldest(self._header_tokens)
+            fixed = self._header_tokens[catalogue_key] = estimate_tokens(self._format_header(tools))
+        return history_window.apply(key, messages, fixed)
+    
+    def _get_history_window(self) -> HistoryWindow:
+        if self._history_window is None:
+            self._history_window = HistoryWindow(
+                self.max_prompt_tokens,
+                render=self._format_message,
+                summarize=self._summarize_history,
+                keep_last_turns=self.keep_last_turns,
+                max_conversations=self.max_conversations,
+            )
+        return self._history_window
+    
+    def _summarize_folded(self, key: tuple):
+        if self._history_window is not None:
+            self._history_window.summarize_pending(key)
+    
+    def export_state(self) -> Dict[str, Any]:
+        """导出可随检查点保存的对话状态（JSON 可序列化）
         
-        # 添加工具说明
-        if self.tools:
-            prompt_parts.append("可用工具:\n" + self._format_tool_descriptions())
-            prompt_parts.append("""
-            使用工具时，请遵循以下格式：
-            {
-                "action": "工具名称",
-                "params": {
-                    "参数名": "参数值"
-                },
-                "thought": "行动原因说明"
-            }
-            """)
+        只包含历史窗口的折叠位置和滚动摘要：它们由模型生成，丢失后需要重新折叠和摘要。
+        增量提示词、Ollama context 和页面状态压缩的基准都能从恢复的消息重新算出，不保存。
+        """
+        if self._history_window is None:
+            return {}
+        return {"history_window": self._history_window.export_state()}
+    
+    def load_state(self, state: Dict[str, Any]):
+        """恢复 export_state 的结果，恢复后第一次请求按当时的折叠位置和摘要继续"""
+        if state.get("history_window") and self.max_prompt_tokens is not None:
+            self._get_history_window().load_state(state["history_window"])
+    
+    def _prepare_request(
+        self, messages: List[BaseMessage], tools: Optional[List[BaseTool]] = None
+    ) -> Tuple[str, Dict[str, Any], PromptState, List[tuple]]:
+        """生成本次请求的提示词和 Ollama 参数，同时返回对话状态和本次请求的消息指纹
         
-        # 添加消息历史
-        for message in messages:
-            if isinstance(message, SystemMessage):
-                prompt_parts.append(f"System: {message.content}")
-            elif isinstance(message, HumanMessage):
-                prompt_parts.append(f"Human: {message.content}")
-            elif isinstance(message, AIMessage):
-                prompt_parts.append(f"Assistant: {message.content}")
-                
-        return "\n".join(prompt_parts)
+        开启 reuse_context 且新消息只是在上一轮之后追加（第一条为模型回复）时，
+        上一轮返回的 context 已包含提示词和原始回复，只需发送回复之后的消息。
+        """
+        format_params = self._format_params(tools)
+        with self._state_lock:
+            state = self._prompt_state(messages, tools)
+            self._update_prompt_state(state, messages)
+            fingerprints = state.fingerprints
+            boundary = len(state.context_fingerprints)
+            if (
+                self.reuse_context
+                and state.context
+                and len(messages) > boundary + 1
+                and fingerprints[:boundary] == state.context_fingerprints
+                and isinstance(messages[boundary], AIMessage)
+            ):
+                suffix = state.prompt[state.offsets[boundary + 1]:].lstrip("\n")
+                return suffix, {"context": state.context, **format_params}, state, fingerprints
+            return state.prompt, format_params, state, fingerprints
+    
+    def _remember_context(self, state: PromptState, fingerprints: List[tuple], generation_info: Optional[Dict]):
+        """记录返回的 context，对应的是准备请求时的消息，而不是状态中此刻的消息"""
+        context = (generation_info or {}).get("context")
+        if self.reuse_context and context:
+            with self._state_lock:
+                state.context = list(context)
+                state.context_fingerprints = fingerprints
+    
+    def _action_parser(self, tools: Optional[List[BaseTool]] = None) -> ActionParser:
+        """按工具集缓存动作解析器"""
+        tools = self.tools if tools is None else tools
+        key = self._tool_catalogue_key(tools)
+        parser = self._parsers.get(key)
+        if parser is None:
+            evict_oldest(self._parsers)
+            parser = self._parsers[key] = ActionParser(tools, max_actions=self.max_actions)
+        return parser
+    
+    def _action_schema(self, tools: Optional[List[BaseTool]] = None) -> Optional[Dict]:
+        """按工具集缓存动作的 JSON schema，没有工具时返回 None"""
+        tools = self.tools if tools is None else tools
+        if not tools:
+            return None
+        key = self._tool_catalogue_key(tools)
+        schema = self._action_schemas.get(key)
+        if schema is None:
+            evict_oldest(self._action_schemas)
+            schema = self._action_schemas[key] = _action_schema(tools, self.max_actions)
+        return schema
+    
+    def _format_params(self, tools: Optional[List[BaseTool]] = None) -> Dict[str, Any]:
+        """开启 constrained_output 时请求附带 format 约束"""
+        schema = self._action_schema(tools) if self.constrained_output else None
+        return {"format": schema} if schema else {}
     
-    def _parse_response(self, response: str) -> Dict:
+    def _parse_response(self, response: str, tools: Optional[List[BaseTool]] = None) -> Dict:
         """解析模型响应，确保返回正确的动作格式"""
-        try:
-            # 尝试解析 JSON
-            action_data = json.loads(response)
-            if isinstance(action_data, dict) and "action" in action_data:
-                return action_data
-        except:
-            pass
-        
-        # 如果不是有效的 JSON，返回默认格式
+        action_data = self._action_parser(tools).parse(response)
+        if action_data is not None:
+            return action_data
+        return self._fallback_action(response)
+    
+    @staticmethod
+    def _fallback_action(response: str) -> Dict:
+        # 找不到合法动作时，返回默认格式
         return {
             "action": "think",
             "thought": response,
             "params": {}
         }
     
-    def _generate(
+    def _tool_calls(self, action: Dict, tools: Optional[List[BaseTool]] = None) -> List[ToolCall]:
+        """动作对应已绑定的工具时转换为 ToolCall，AgentExecutor 据此直接执行工具
+
+        多动作回复按顺序转换，遇到未绑定的工具时截断。
+        """
+        tools = self.tools if tools is None else tools
+        names = {tool.name for tool in tools}
+        tool_calls = []
+        for item in action.get("actions") or [action]:
+            if item["action"] not in names:
+                break
+            params = item.get("params")
+            tool_calls.append(ToolCall(
+                name=item["action"],
+                args=params if isinstance(params, dict) else {},
+                id=f"call_{uuid.uuid4().hex[:24]}"
+            ))
+        return tool_calls
+    
+    def _build_result(
         self,
-        messages: List[BaseMessage],
-        stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
-        **kwargs: Any,
+        text: str,
+        action: Optional[Dict] = None,
+        tools: Optional[List[BaseTool]] = None,
+        stats: Optional[GenerationStats] = None,
+        reasoning: str = "",
     ) -> ChatResult:
-        """生成响应并返回标准格式"""
-        prompt = self._format_messages_to_prompt(messages)
-        response = self.ollama.invoke(prompt)
+        """把模型输出转换为 ChatResult，流式扫描已得到动作时不再重复解析
+
+        reasoning 为流式输出中拆出的推理段，与正文拼回原始文本后解析：正文中没有动作时，
+        ActionParser 会在推理段（包括没有闭合的 <think>）里查找。
+        """
+        stats = stats or GenerationStats()
+        start = time.perf_counter()
+        if action is None:
+            raw = f"{THINK_OPEN}{reasoning}{THINK_CLOSE}{text}" if reasoning else text
+            action = self._action_parser(tools).parse(raw)
+        stats.parse_seconds += time.perf_counter() - start
+        parsed_response = action if action is not None else self._fallback_action(text)
+        tool_calls = self._tool_calls(parsed_response, tools)
+        
+        estimated = stats.prompt_tokens is None
+        input_tokens = stats.prompt_chars // 4 if estimated else stats.prompt_tokens
+        output_tokens = stats.chunks if stats.completion_tokens is None else stats.completion_tokens
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
         
-        # 解析响应
-        parsed_response = self._parse_response(str(response))
+        if tool_calls:
+            message = AIMessage(
+                content=json.dumps(parsed_response, ensure_ascii=False),
+                tool_calls=tool_calls,
+                usage_metadata=usage
+            )
+        else:
+            # 没有调用工具时视为最终回答，去掉推理段后原样返回
+            message = AIMessage(content=strip_reasoning(text), usage_metadata=usage)
         
-        # 创建 ChatGeneration 对象
+        # 创建 ChatGeneration 对象，timings 与 parse_failed（未解析出动作，最终回答也计入）
+        # 供 instrumentation.MetricsCallback 统计
         chat_generation = ChatGeneration(
-            message=AIMessage(content=json.dumps(parsed_response, ensure_ascii=False)),
-            generation_info={"parsed_response": parsed_response}
+            message=message,
+            generation_info={
+                "parsed_response": parsed_response,
+                "parse_failed": action is None,
+                "timings": {"prompt": stats.prompt_seconds, "parse": stats.parse_seconds},
+                "usage_estimated": estimated,
+                "created": time.time(),
+            }
         )
         
         return ChatResult(generations=[chat_generation])
+    
+    def _stream_chunk(
+        self, parts: tuple, action: Optional[Dict], tools: Optional[List[BaseTool]]
+    ) -> ChatGenerationChunk:
+        """流式分块，推理段放入 reasoning_content，找到动作的那一块同时携带 tool_call_chunks"""
+        reasoning, text = parts
+        additional_kwargs = {"reasoning_content": reasoning} if reasoning else {}
+        if action is None:
+            return ChatGenerationChunk(message=AIMessageChunk(content=text, additional_kwargs=additional_kwargs))
+        tool_call_chunks = [{
+            "name": tool_call["name"],
+            "args": json.dumps(tool_call["args"], ensure_ascii=False),
+            "id": tool_call["id"],
+            "index": index,
+        } for index, tool_call in enumerate(self._tool_calls(action, tools))]
+        return ChatGenerationChunk(
+            message=AIMessageChunk(content=text, additional_kwargs=additional_kwargs, tool_call_chunks=tool_call_chunks),
+            generation_info={"action": action}
+        )
+    
+    def _pool_options(self) -> tuple:
+        return self.ollama.base_url, self.max_in_flight, self.connect_timeout, self.request_timeout
+    
+    def _ollama_stream(self, prompt: str, params: Dict[str, Any]) -> Iterator[GenerationChunk]:
+        """通过共享连接池流式请求 Ollama，尚未收到输出时的临时错误按退避重试"""
+        pool = sync_pool(*self._pool_options())
+        request = self.ollama._generate_params(prompt, **params)
+        for attempt in range(self.max_retries + 1):
+            received = False
+            try:
+                with pool.slot() as client:
+                    stream = client.generate(**request)
+                    try:
+                        for part in stream:
+                            received = True
+                            yield _generation_chunk(part)
+                    finally:
+                        stream.close()
+                return
+            except Exception as e:
+                if received or attempt == self.max_retries or not is_retryable(e):
+                    raise
+            time.sleep(backoff_delay(attempt, self.retry_backoff))
+    
+    async def _aollama_stream(self, prompt: str, params: Dict[str, Any]) -> AsyncIterator[GenerationChunk]:
+        """异步版本，连接池按事件循环共享，退避等待期间不占用并发名额"""
+        pool = async_pool(*self._pool_options())
+        request = self.ollama._generate_params(prompt, **params)
+        for attempt in range(self.max_retries + 1):
+            received = False
+            try:
+                async with pool.slot() as client:
+                    stream = await client.generate(**request)
+                    try:
+                        async for part in stream:
+                            received = True
+                            yield _generation_chunk(part)
+                    finally:
+                        # 提前返回时断开 HTTP 流，Ollama 随之停止生成
+                        await stream.aclose()
+                return
+            except Exception as e:
+                if received or attempt == self.max_retries or not is_retryable(e):
+                    raise
+            await asyncio.sleep(backoff_delay(attempt, self.retry_backoff))
+    
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        """流式输出原始文本，stop_on_action 时在第一个完整动作后取消剩余生成"""
+        tools = self._resolve_tools(kwargs.get("tools"))
+        stats = kwargs.get("stats") or GenerationStats()
+        start = time.perf_counter()
+        key = self._conversation_key(messages, tools)
+        messages = self._apply_history_window(self._compress_dom(messages), key, tools)
+        prompt, params, state, fingerprints = self._prepare_request(messages, tools)
+        stats.prompt_seconds += time.perf_counter() - start
+        stats.prompt_chars += len(prompt)
+        scanner = ActionScanner(self._action_parser(tools))
+        splitter = ReasoningSplitter()
+        stream = self._ollama_stream(prompt, params)
+        try:
+            for chunk in stream:
+                self._remember_context(state, fingerprints, chunk.generation_info)
+                _count_tokens(stats, chunk)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text)
+                start = time.perf_counter()
+                action = scanner.feed(chunk.text)
+                stats.parse_seconds += time.perf_counter() - start
+                found = self.stop_on_action and action is not None
+                parts = splitter.feed(chunk.text)
+                if found:
+                    parts = _join_parts(parts, splitter.flush())
+                yield self._stream_chunk(parts, action if found else None, tools)
+                if found:
+                    break
+            else:
+                tail = splitter.flush()
+                if any(tail):
+                    yield self._stream_chunk(tail, None, tools)
+        finally:
+            stream.close()
+            self._summarize_folded(key)
+    
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        """异步流式输出，逻辑与 _stream 相同"""
+        tools = self._resolve_tools(kwargs.get("tools"))
+        stats = kwargs.get("stats") or GenerationStats()
+        start = time.perf_counter()
+        key = self._conversation_key(messages, tools)
+        messages = self._apply_history_window(self._compress_dom(messages), key, tools)
+        prompt, params, state, fingerprints = self._prepare_request(messages, tools)
+        stats.prompt_seconds += time.perf_counter() - start
+        stats.prompt_chars += len(prompt)
+        scanner = ActionScanner(self._action_parser(tools))
+        splitter = ReasoningSplitter()
+        stream = self._aollama_stream(prompt, params)
+        try:
+            async for chunk in stream:
+                self._remember_context(state, fingerprints, chunk.generation_info)
+                _count_tokens(stats, chunk)
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text)
+                start = time.perf_counter()
+                action = scanner.feed(chunk.text)
+                stats.parse_seconds += time.perf_counter() - start
+                found = self.stop_on_action and action is not None
+                parts = splitter.feed(chunk.text)
+                if found:
+                    parts = _join_parts(parts, splitter.flush())
+                yield self._stream_chunk(parts, action if found else None, tools)
+                if found:
+                    break
+            else:
+                tail = splitter.flush()
+                if any(tail):
+                    yield self._stream_chunk(tail, None, tools)
+        finally:
+            await stream.aclose()
+            self._summarize_folded(key)
+    
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """生成响应并返回标准格式"""
+        text, reasoning, action, stats = "", "", None, GenerationStats()
+        for chunk in self._stream(messages, stop, run_manager, stats=stats, **kwargs):
+            text += chunk.text
+            reasoning += chunk.message.additional_kwargs.get("reasoning_content", "")
+            action = (chunk.generation_info or {}).get("action", action)
+        return self._build_result(text, action, self._resolve_tools(kwargs.get("tools")), stats, reasoning)
         
     async def _agenerate(
         self,
         messages: List[BaseMessage],
         stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> ChatResult:
         """异步生成响应"""
-        prompt = self._format_messages_to_prompt(messages)
-        response = await self.ollama.ainvoke(prompt)
-        
-        # 解析响应
-        parsed_response = self._parse_response(str(response))
+        text, reasoning, action, stats = "", "", None, GenerationStats()
+        async for chunk in self._astream(messages, stop, run_manager, stats=stats, **kwargs):
+            text += chunk.text
+            reasoning += chunk.message.additional_kwargs.get("reasoning_content", "")
+            action = (chunk.generation_info or {}).get("action", action)
+        return self._build_result(text, action, self._resolve_tools(kwargs.get("tools")), stats, reasoning)
+
+    
+    def _batch_prompt(self, header: str, item: Union[str, Sequence[BaseMessage]]) -> str:
+        """与对话提示词相同的格式，但不经过增量状态、页面压缩和历史窗口"""
+        messages = [HumanMessage(content=item)] if isinstance(item, str) else item
+        parts = [header]
+        for message in messages:
+            text = self._format_message(message)
+            if text is not None:
+                parts.append(text)
+        return "\n".join(parts)
+    
+    async def _acomplete(self, prompt: str, tools: List[BaseTool], limit: asyncio.Semaphore) -> AIMessage:
+        stats = GenerationStats(prompt_chars=len(prompt))
+        scanner = ActionScanner(self._action_parser(tools)) if tools and self.stop_on_action else None
+        text, action = "", None
+        async with limit:
+            stream = self._aollama_stream(prompt, self._format_params(tools))
+            try:
+                async for chunk in stream:
+                    _count_tokens(stats, chunk)
+                    text += chunk.text
+                    if scanner is not None:
+                        action = scanner.feed(chunk.text)
+                        if action is not None:
+                            break
+            finally:
+                await stream.aclose()
+        return self._build_result(text, action, tools, stats).generations[0].message
+    
+    async def abatch_generate(
+        self,
+        inputs: Sequence[Union[str, Sequence[BaseMessage]]],
+        tools: Optional[Sequence[Any]] = None,
+        max_concurrency: Optional[int] = None,
+        return_exceptions: bool = True,
+    ) -> List[Union[AIMessage, BaseException]]:
+        """批量生成互不相关的提示词（离线评测、分类等），结果与 inputs 顺序一致
         
-        # 创建 ChatGeneration 对象
-        chat_generation = ChatGeneration(
-            message=AIMessage(content=json.dumps(parsed_response, ensure_ascii=False)),
-            generation_info={"parsed_response": parsed_response}
+        每项可以是字符串或消息列表。提示词在发送前全部构建好，工具目录整批只渲染一次；
+        请求通过共享连接池发出，本批最多同时 max_concurrency 个（默认 max_in_flight），
+        同时仍受连接池 max_in_flight 的限制，与 Agent 等其他请求共用同一服务的并发上限；
+        连接错误按 max_retries 重试。return_exceptions 为 True 时失败的项在对应位置返回异常，
+        不影响其他项。批量请求不经过 LangChain 回调，也不记录对话状态。
+        """
+        resolved = self._resolve_tools(tools)
+        resolved = self.tools if resolved is None else resolved
+        header = self._format_header(resolved)
+        prompts = [self._batch_prompt(header, item) for item in inputs]
+        # 在共享连接池之上再限制本批的并发，不另建连接池，不会绕过同一服务的并发上限
+        limit = asyncio.Semaphore(max_concurrency or self.max_in_flight)
+        return await asyncio.gather(
+            *(self._acomplete(prompt, resolved, limit) for prompt in prompts),
+            return_exceptions=return_exceptions,
         )
-        
-        return ChatResult(generations=[chat_generation]) 
\ No newline at end of file
+    
+    def batch_generate(
+        self,
+        inputs: Sequence[Union[str, Sequence[BaseMessage]]],
+        tools: Optional[Sequence[Any]] = None,
+        max_concurrency: Optional[int] = None,
+        return_exceptions: bool = True,
+    ) -> List[Union[AIMessage, BaseException]]:
+        """同步版本，在新的事件循环中执行 abatch_generate，不能在运行中的事件循环里调用"""
+        async def run():
+            try:
+                return await self.abatch_generate(inputs, tools, max_concurrency, return_exceptions)
+            finally:
+                await close_async_pools()
+        return asyncio.run(run())
+
+
+def _to_base_tool(tool: Union[Dict[str, Any], type, Callable, BaseTool]) -> BaseTool:
+    """把 bind_tools 接受的各种工具写法统一为 BaseTool，便于渲染目录和校验参数"""
+    if isinstance(tool, BaseTool):
+        return tool
+    function = convert_to_openai_tool(tool)["function"]
+    # pydantic 模型直接作为参数模型，其余写法保留 JSON schema
+    args_schema = tool if isinstance(tool, type) else function.get("parameters", {})
+    return StructuredTool(
+        name=function["name"],
+        description=function.get("description", ""),
+        args_schema=args_schema,
+        func=lambda **kwargs: kwargs,
+    )
+
+
+def _generation_chunk(part: Any) -> GenerationChunk:
+    """与 OllamaLLM 相同：只有最后一块携带 context 等生成信息"""
+    return GenerationChunk(
+        text=part.get("response") or "",
+        generation_info=dict(part) if part.get("done") is True else None,
+    )
+
+
+def _count_tokens(stats: GenerationStats, chunk: GenerationChunk):
+    """Ollama 每个流式块约为一个 token，最后一块带有准确的计数"""
+    if chunk.text:
+        stats.chunks += 1
+    info = chunk.generation_info or {}
+    if info.get("prompt_eval_count") is not None:
+        stats.prompt_tokens = (stats.prompt_tokens or 0) + info["prompt_eval_count"]
+    if info.get("eval_count") is not None:
+        stats.completion_tokens = (stats.completion_tokens or 0) + info["eval_count"]
+
+
+def _args_schema(tool: BaseTool) -> Optional[Dict]:
+    """工具参数的 JSON schema，args_schema 可能是 pydantic 模型或字典"""
+    if not tool.args_schema:
+        return None
+    if isinstance(tool.args_schema, dict):
+        return tool.args_schema
+    return tool.args_schema.schema()
+
+
+def _action_schema(tools: List[BaseTool], max_actions: int = 1) -> Dict:
+    """动作格式的 JSON schema：各工具的 {"thought", "action", "params"} 取 anyOf，
+    max_actions 大于 1 时为 {"thought", "actions": [...]}
+
+    thought 放在最前，约束解码时模型先写出行动原因再选择工具；
+    各工具参数 schema 中的 $defs 以 "工具名." 为前缀合并到根部，$ref 随之改写。
+    """
+    definitions: Dict[str, Dict] = {}
+    variants = []
+    for tool in tools:
+        params = _hoist_definitions(_args_schema(tool) or {"type": "object"}, tool.name, definitions)
+        variants.append({
+            "type": "object",
+            "properties": {"thought": {"type": "string"}, "action": {"enum": [tool.name]}, "params": params},
+            "required": ["thought", "action", "params"],
+        })
+    if max_actions > 1:
+        # 列表中的单个动作不需要 thought
+        for variant in variants:
+            del variant["properties"]["thought"]
+            variant["required"].remove("thought")
+        items = variants[0] if len(variants) == 1 else {"anyOf": variants}
+        schema = {
+            "type": "object",
+            "properties": {
+                "thought": {"type": "string"},
+                "actions": {"type": "array", "items": items, "minItems": 1, "maxItems": max_actions},
+            },
+            "required": ["thought", "actions"],
+        }
+    else:
+        schema = dict(variants[0]) if len(variants) == 1 else {"anyOf": variants}
+    if definitions:
+        schema["$defs"] = definitions
+    return schema
+
+
+def _hoist_definitions(schema: Dict, prefix: str, definitions: Dict[str, Dict]) -> Dict:
+    """把 schema 中的 $defs（pydantic v1 为 definitions）移入 definitions，返回改写引用后的 schema"""
+    local = {**schema.get("definitions", {}), **schema.get("$defs", {})}
+    if not local:
+        return schema
+
+    def rebase(value):
+        if isinstance(value, dict):
+            ref = value.get("$ref")
+            if isinstance(ref, str) and ref.startswith(("#/$defs/", "#/definitions/")):
+                value = {**value, "$ref": f"#/$defs/{prefix}.{ref.rsplit('/', 1)[1]}"}
+            return {key: rebase(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [rebase(item) for item in value]
+        return value
+
+    for name, definition in local.items():
+        definitions[f"{prefix}.{name}"] = rebase(definition)
+    return rebase({key: value for key, value in schema.items() if key not in ("$defs", "definitions")})
+
+
+def _join_parts(first: tuple, second: tuple) -> tuple:
+    return first[0] + second[0], first[1] + second[1]
@@ -0,0 +1,120 @@
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+# browser-use（AgentMessagePrompt）渲染的页面状态消息中的固定标记
+STATE_MARKER = "[Current state starts here]"
+ELEMENTS_HEADER = "Interactive elements from current page:\n"
+_URL = re.compile(r"^Current url: (.*)$", re.M)
+# 元素列表之后是步骤信息和时间，再之后是上一步的动作结果
+_STEP_INFO = re.compile(r"^(Current step: |Current date and time: )", re.M)
+# 可交互元素为 [编号]<标签>文本</标签>，不属于可交互元素的文本为 []文本，
+# 其余行（[Start of page]、... pixels below ... 等）是页面位置提示
+_ELEMENT = re.compile(r"\[\d*\]")
+_OPEN_TAG = re.compile(r"\[\d*\](<(\w+)[^>]*>)?")
+
+
+@dataclass
+class PageState:
+    """拆开的页面状态消息：元素列表之前的部分、地址、元素行、元素列表之后的部分"""
+    head: str
+    url: str
+    elements: List[str]
+    tail: str
+
+    def render(self, block: str) -> str:
+        return f"{self.head}{ELEMENTS_HEADER}{block}\n{self.tail}"
+
+
+def is_state_message(message: BaseMessage) -> bool:
+    return isinstance(message, HumanMessage) and isinstance(message.content, str) and STATE_MARKER in message.content
+
+
+def parse_page_state(text: str) -> Optional[PageState]:
+    start = text.find(ELEMENTS_HEADER)
+    url = _URL.search(text)
+    if start < 0 or url is None:
+        return None
+    body = text[start + len(ELEMENTS_HEADER):]
+    step_info = _STEP_INFO.search(body)
+    block, tail = (body[:step_info.start()], body[step_info.start():]) if step_info else (body, "")
+    elements: List[str] = []
+    for line in block.rstrip("\n").split("\n"):
+        # 元素文本可能跨行，续行并入上一个元素
+        if elements and _ELEMENT.match(elements[-1]) and not _ELEMENT.match(line) and not line.startswith(("[", "...")):
+            elements[-1] += "\n" + line
+        else:
+            elements.append(line)
+    return PageState(head=text[:start], url=url.group(1).strip(), elements=elements, tail=tail)
+
+
+def truncate_element(element: str, max_chars: int) -> str:
+    """合并元素文本中的空白，超过 max_chars 的部分截断"""
+    match = _OPEN_TAG.match(element)
+    if match is None:
+        return element
+    prefix, tag = match.group(0), match.group(2)
+    closing = f"</{tag}>" if tag and element.endswith(f"</{tag}>") else ""
+    text = " ".join(element[len(prefix):len(element) - len(closing)].split())
+    if len(text) > max_chars:
+        text = text[:max_chars] + "…"
+    return f"{prefix}{text}{closing}"
+
+
+def dedupe_text(elements: List[str]) -> Tuple[List[str], int]:
+    """去掉与前面重复的非交互文本行（[]文本），返回 (元素行, 去掉的行数)
+
+    搜索结果等列表中每项的简介截断后常常完全相同，可交互元素编号唯一，不受影响。
+    """
+    seen, kept, dropped = set(), [], 0
+    for line in elements:
+        if line.startswith("[]"):
+            if line in seen:
+                dropped += 1
+                continue
+            seen.add(line)
+        kept.append(line)
+    return kept, dropped
+
+
+def _stub(url: str) -> HumanMessage:
+    return HumanMessage(content=f"[页面状态已省略：{url}]")
+
+
+def _stale(message: BaseMessage) -> BaseMessage:
+    page = parse_page_state(message.content) if is_state_message(message) else None
+    return message if page is None else _stub(page.url)
+
+
+class DomCompressor:
+    """在 browser-use 的页面状态进入提示词之前压缩
+
+    只改写最后一条（当前）页面状态：元素文本合并空白并截断到 max_text_chars，
+    重复的非交互文本行只保留第一行。browser-use 每步会删除上一步的页面状态，这里不补回；
+    其他流程留在历史中的旧页面状态替换为一行占位。不保存任何跨调用的状态，可以被多个 Agent 同时使用。
+    """
+
+    def __init__(self, max_text_chars: int = 80):
+        self.max_text_chars = max_text_chars
+
+    def compress_page(self, text: str) -> Optional[str]:
+        """压缩单条页面状态文本，无法识别格式时返回 None"""
+        page = parse_page_state(text)
+        if page is None:
+            return None
+        elements = [truncate_element(line, self.max_text_chars) for line in page.elements]
+        elements, dropped = dedupe_text(elements)
+        if dropped:
+            elements.append(f"（{dropped} 行与上文重复的文本已省略）")
+        return page.render("\n".join(elements))
+
+    def compress(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """返回压缩后的消息列表，最后一条不是页面状态时原样返回"""
+        if not messages or not is_state_message(messages[-1]):
+            return messages
+        text = self.compress_page(messages[-1].content)
+        if text is None:
+            return messages
+        return [_stale(message) for message in messages[:-1]] + [HumanMessage(content=text)]
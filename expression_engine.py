@@ -0,0 +1,343 @@
+import ast
+import math
+import re
+from functools import lru_cache, reduce
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# 数字字面量：不匹配标识符中的数字（log10、x1）、十六进制和复数
+_NUMBER = re.compile(r"(?<![\w.])((?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)(?![\w.])")
+# 以下划线开头的名字（__import__、_c0 等）一律拒绝，字面量占位符因此不会与用户变量冲突
+_PRIVATE_NAME = re.compile(r"(?<!\w)_")
+_PLACEHOLDER = "_c{}"
+# 模板键中字面量的位置，表达式里不会出现
+_SEPARATOR = "\0"
+
+MAX_LENGTH = 1000
+# 整数乘方结果的位数上限，防止 9**9**9 这类表达式占满 CPU 和内存
+MAX_INT_BITS = 4096
+
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.UAdd, ast.USub)
+
+
+class ExpressionError(ValueError):
+    """表达式不合法、含有不允许的语法或求值失败"""
+
+
+def _scalar_pow(base, exponent):
+    if (
+        isinstance(base, int)
+        and isinstance(exponent, int)
+        and exponent > 0
+        and abs(base) > 1
+        and exponent * abs(base).bit_length() > MAX_INT_BITS
+    ):
+        raise ExpressionError("乘方结果过大")
+    return base ** exponent
+
+
+def _vector_round(x, digits=0):
+    if np.ndim(digits) == 0:
+        return np.round(x, int(digits))
+    # 批量求值时各表达式的小数位数可能不同
+    scale = 10.0 ** np.asarray(digits)
+    return np.round(x * scale) / scale
+
+
+def _vector_log(x, base=None):
+    # np.log 的第二个参数是 out，不是底数
+    return np.log(x) if base is None else np.log(x) / np.log(base)
+
+
+SCALAR_FUNCTIONS = {
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log2": math.log2,
+    "log10": math.log10,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "floor": math.floor,
+    "ceil": math.ceil,
+}
+
+VECTOR_FUNCTIONS = {
+    "abs": np.abs,
+    "round": _vector_round,
+    "min": lambda *args: reduce(np.minimum, args),
+    "max": lambda *args: reduce(np.maximum, args),
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": _vector_log,
+    "log2": np.log2,
+    "log10": np.log10,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "asin": np.arcsin,
+    "acos": np.arccos,
+    "atan": np.arctan,
+    "floor": np.floor,
+    "ceil": np.ceil,
+}
+
+CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau}
+
+# np.round 先乘 10**digits 再取整，.xx5 附近与 Python round 的结果可能差一位
+_SCALAR_ONLY = frozenset({"round"})
+
+# 乘方改为调用带上限检查的函数，其余运算直接编译成字节码
+_SCALAR_GLOBALS = {"__builtins__": {}, "_pow": _scalar_pow, **SCALAR_FUNCTIONS, **CONSTANTS}
+_VECTOR_GLOBALS = {"__builtins__": {}, "_pow": np.power, **VECTOR_FUNCTIONS, **CONSTANTS}
+
+
+def _rewrite_pow(tree: ast.Expression) -> ast.Expression:
+    """把乘方改为调用 _pow
+
+    按广度优先的逆序处理，子节点总在父节点之前改写；不用 NodeTransformer 递归，
+    很深的嵌套（如 1+1+...+1）也不会超出递归深度。
+    """
+    for node in reversed(list(ast.walk(tree))):
+        for name, value in ast.iter_fields(node):
+            if isinstance(value, ast.BinOp) and isinstance(value.op, ast.Pow):
+                setattr(node, name, _pow_call(value))
+            elif isinstance(value, list):
+                value[:] = [_pow_call(item) if isinstance(item, ast.BinOp) and isinstance(item.op, ast.Pow) else item
+                            for item in value]
+    return tree
+
+
+def _pow_call(node: ast.BinOp) -> ast.Call:
+    func = ast.copy_location(ast.Name(id="_pow", ctx=ast.Load()), node)
+    return ast.copy_location(ast.Call(func=func, args=[node.left, node.right], keywords=[]), node)
+
+
+def _check(tree: ast.AST, placeholders: int) -> None:
+    """只允许数字、变量、四则运算、乘方、取模和白名单中的函数调用，用显式栈遍历"""
+    allowed = {_PLACEHOLDER.format(i) for i in range(placeholders)}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Expression):
+            stack.append(node.body)
+        elif isinstance(node, ast.BinOp):
+            if not isinstance(node.op, _OPERATORS):
+                raise ExpressionError(f"不支持的运算符：{type(node.op).__name__}")
+            stack.extend((node.right, node.left))
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, _OPERATORS):
+                raise ExpressionError(f"不支持的运算符：{type(node.op).__name__}")
+            stack.append(node.operand)
+        elif isinstance(node, ast.Constant):
+            if type(node.value) not in (int, float):
+                raise ExpressionError(f"不支持的常量：{node.value!r}")
+        elif isinstance(node, ast.Name):
+            if node.id.startswith("_") and node.id not in allowed:
+                raise ExpressionError(f"不允许的名称：{node.id}")
+            if node.id in SCALAR_FUNCTIONS:
+                raise ExpressionError(f"函数 {node.id} 只能调用")
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in SCALAR_FUNCTIONS:
+                raise ExpressionError(f"不允许调用：{ast.unparse(node.func)}")
+            if node.keywords:
+                raise ExpressionError("不支持关键字参数")
+            for arg in node.args:
+                if isinstance(arg, ast.Starred):
+                    raise ExpressionError("不支持 * 参数")
+            stack.extend(reversed(node.args))
+        else:
+            raise ExpressionError(f"不支持的语法：{type(node).__name__}")
+
+
+class _Template:
+    """数字字面量替换为占位符后的表达式，编译一次，按占位符的取值多次求值"""
+
+    __slots__ = ("code", "placeholders", "variables", "scalar_only")
+
+    def __init__(self, key: str):
+        parts = key.split(_SEPARATOR)
+        self.placeholders = tuple(_PLACEHOLDER.format(i) for i in range(len(parts) - 1))
+        template = parts[0] + "".join(name + part for name, part in zip(self.placeholders, parts[1:]))
+        try:
+            tree = ast.parse(template, mode="eval")
+            _check(tree, len(self.placeholders))
+            names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+            self.code = compile(_rewrite_pow(tree), "<expression>", "eval")
+        except SyntaxError as e:
+            raise ExpressionError(f"表达式语法错误：{e.msg}") from None
+        except (RecursionError, MemoryError):
+            # 校验和改写不递归，解析和编译仍可能因嵌套过深失败
+            raise ExpressionError("表达式嵌套过深") from None
+        self.variables = frozenset(names - set(self.placeholders) - SCALAR_FUNCTIONS.keys() - CONSTANTS.keys())
+        # 含有 NumPy 与 Python 语义不同的函数时，批量求值也逐个计算
+        self.scalar_only = bool(names & _SCALAR_ONLY)
+
+
+@lru_cache(maxsize=1024)
+def _template(key: str) -> _Template:
+    return _Template(key)
+
+
+def _literal(token: str):
+    return int(token) if token.isdigit() else float(token)
+
+
+def _check_text(text: str):
+    if "_" in text and _PRIVATE_NAME.search(text):
+        raise ExpressionError("不允许以下划线开头的名称")
+
+
+def split_literals(text: str) -> Tuple[str, List[str]]:
+    """拆出数字字面量，返回 (模板键, 字面量文本)：'23+45' 与 '1+2' 的模板键相同"""
+    if len(text) > MAX_LENGTH:
+        raise ExpressionError(f"表达式超过 {MAX_LENGTH} 个字符")
+    _check_text(text)
+    # 带分组的 split 一次扫描得到交替的非数字部分和字面量
+    parts = _NUMBER.split(text)
+    return _SEPARATOR.join(parts[::2]), parts[1::2]
+
+
+class CompiledExpression:
+    """编译后的表达式：__call__ 按 Python 语义逐个求值，vectorized 用 NumPy 对整个数组求值"""
+
+    __slots__ = ("source", "_template", "_constants")
+
+    def __init__(self, source: str):
+        self.source = source
+        key, tokens = split_literals(source)
+        self._template = _template(key)
+        self._constants = tuple(map(_literal, tokens))
+
+    @property
+    def variables(self) -> frozenset:
+        return self._template.variables
+
+    def _names(self, variables: Dict[str, object]) -> Dict[str, object]:
+        missing = self._template.variables and self._template.variables - variables.keys()
+        if missing:
+            raise ExpressionError(f"缺少变量：{', '.join(sorted(missing))}")
+        names = dict(zip(self._template.placeholders, self._constants))
+        names.update(variables)
+        return names
+
+    def __call__(self, **variables):
+        try:
+            return eval(self._template.code, _SCALAR_GLOBALS, self._names(variables))
+        except TypeError as e:
+            # 函数参数个数不对等
+            raise ExpressionError(str(e)) from None
+
+    def vectorized(self, **arrays) -> np.ndarray:
+        """变量可以是数组，按 NumPy 广播求值；结果为浮点数组，除零和定义域错误得到 inf/nan"""
+        names = self._names({name: np.asarray(value, dtype=float) for name, value in arrays.items()})
+        with np.errstate(all="ignore"):
+            try:
+                return np.asarray(eval(self._template.code, _VECTOR_GLOBALS, names), dtype=float)
+            except TypeError as e:
+                raise ExpressionError(str(e)) from None
+
+
+@lru_cache(maxsize=4096)
+def compile_expression(text: str) -> CompiledExpression:
+    """解析、校验并编译表达式；相同文本直接复用，字面量不同的同构表达式复用编译结果"""
+    return CompiledExpression(text)
+
+
+def evaluate(text: str, **variables):
+    """安全地计算一个表达式，代替 eval"""
+    return compile_expression(text)(**variables)
+
+
+def evaluate_many(expressions: Iterable[str], **arrays) -> np.ndarray:
+    """批量计算：按模板分组，每组把各表达式的字面量拼成数组，整组只求值一次
+
+    arrays 中的变量对所有表达式共用，长度须与表达式个数相同或为标量。
+    NumPy 与 Python 语义不同的部分改为逐个求值，结果与 evaluate 一致：含 round 的模板整组逐个计算，
+    负数的非整数次方（evaluate 得到复数）所在的行逐个计算，此时返回复数数组。
+    除零、定义域错误和结果过大不抛出异常，得到 inf/nan。
+    """
+    expressions = list(expressions)
+    if not expressions:
+        return np.empty(0, dtype=float)
+    if max(map(len, expressions)) > MAX_LENGTH:
+        raise ExpressionError(f"表达式超过 {MAX_LENGTH} 个字符")
+    # 拼成一个字符串，拆字面量、生成模板键和转换数字都只调用一次
+    text = "\n".join(expressions)
+    if text.count("\n") != len(expressions) - 1:
+        text = "\n".join(" ".join(expression.split()) for expression in expressions)
+    _check_text(text)
+    parts = _NUMBER.split(text)
+    keys = _SEPARATOR.join(parts[::2]).split("\n")
+    tokens = parts[1::2]
+    values = np.array(tokens, dtype=float)
+    counts = np.fromiter((key.count(_SEPARATOR) for key in keys), dtype=np.int64, count=len(keys))
+    starts = np.cumsum(counts) - counts
+    group_ids: Dict[str, int] = {}
+    groups = np.fromiter((group_ids.setdefault(key, len(group_ids)) for key in keys), dtype=np.int64, count=len(keys))
+
+    out = np.empty(len(expressions), dtype=float)
+    variables = {name: np.asarray(value, dtype=float) for name, value in arrays.items()}
+    fallback: Dict[int, object] = {}
+
+    def scalar(compiled: _Template, row: int):
+        names = {
+            placeholder: _literal(tokens[starts[row] + offset]) for offset, placeholder in enumerate(compiled.placeholders)
+        }
+        for name in compiled.variables:
+            value = variables[name]
+            names[name] = float(value[row] if value.ndim else value)
+        try:
+            return eval(compiled.code, _SCALAR_GLOBALS, names)
+        except TypeError as e:
+            raise ExpressionError(str(e)) from None
+        except (ArithmeticError, ValueError):
+            return math.nan
+
+    with np.errstate(all="ignore"):
+        for key, group in group_ids.items():
+            compiled = _template(key)
+            missing = compiled.variables - variables.keys()
+            if missing:
+                raise ExpressionError(f"缺少变量：{', '.join(sorted(missing))}")
+            rows = np.flatnonzero(groups == group)
+            if compiled.scalar_only:
+                fallback.update((row, scalar(compiled, row)) for row in rows.tolist())
+                continue
+            # 负数的非整数次方在 NumPy 中为 nan，记下这些行，之后逐个计算
+            negative_powers = []
+
+            def power(base, exponent):
+                negative_powers.append((np.asarray(base) < 0) & (np.asarray(exponent) % 1 != 0))
+                return np.power(base, exponent)
+
+            names = {"_pow": power}
+            for offset, placeholder in enumerate(compiled.placeholders):
+                column = values[starts[rows] + offset]
+                # 整组相同的字面量（如 round 的位数）保持为标量
+                names[placeholder] = column[0] if (column == column[0]).all() else column
+            for name in compiled.variables:
+                value = variables[name]
+                names[name] = value[rows] if value.ndim else value
+            try:
+                result = eval(compiled.code, _VECTOR_GLOBALS, names)
+            except TypeError as e:
+                raise ExpressionError(str(e)) from None
+            out[rows] = np.broadcast_to(result, (len(rows),))
+            if negative_powers:
+                mask = np.broadcast_to(reduce(np.logical_or, negative_powers), (len(rows),))
+                fallback.update((row, scalar(compiled, row)) for row in rows[mask].tolist())
+    if fallback:
+        if any(isinstance(value, complex) for value in fallback.values()):
+            out = out.astype(complex)
+        for row, value in fallback.items():
+            out[row] = value
+    return out
@@ -0,0 +1,292 @@
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Union
+
+# 脚本化响应：固定字符串，或根据请求体生成字符串的函数
+ScriptedResponse = Union[str, Callable[[dict], str]]
+
+
+class FakeOllama:
+    """本地 Ollama 桩服务，用于基准测试，不需要 GPU 和真实模型
+
+    模拟了真实服务中影响延迟的几个因素：
+    - 模型加载：keep_alive 到期或为 0 时，下次请求需重新加载
+    - 提示词预填充：与上一次序列相同的前缀命中 KV 缓存，只计算新增部分
+    - 逐块输出：首块前等待预填充，之后每块间隔 token_delay
+    - 并发：同时处理 max_parallel 个请求，其余排队，排队超过 max_queue 时返回 503
+      （对应 OLLAMA_NUM_PARALLEL 与 OLLAMA_MAX_QUEUE）
+    """
+
+    def __init__(
+        self,
+        responses: Optional[List[ScriptedResponse]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        first_token_delay: float = 0.0,
+        token_delay: float = 0.0,
+        prompt_eval_per_char: float = 0.0,
+        load_delay: float = 0.0,
+        chunk_size: int = 4,
+        max_parallel: Optional[int] = None,
+        max_queue: Optional[int] = None,
+    ):
+        self.responses = list(responses or ['{"action": "done", "params": {"text": "ok"}}'])
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.prompt_eval_per_char = prompt_eval_per_char
+        self.load_delay = load_delay
+        self.chunk_size = chunk_size
+        self.max_parallel = max_parallel
+        self.max_queue = max_queue
+
+        self.requests: List[dict] = []
+        self.prompt_chars_evaluated = 0
+        self.connections = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+        self._lock = threading.Lock()
+        self._cursor = 0
+        self._loaded_until: Dict[str, float] = {}
+        self._kv_cache: Dict[str, str] = {}
+        self._contexts: Dict[int, str] = {}
+        self._pending = 0
+        self._slots = threading.Semaphore(max_parallel) if max_parallel else None
+
+        self._server = _QuietHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOllama":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _next_response(self, body: dict) -> str:
+        with self._lock:
+            scripted = self.responses[self._cursor % len(self.responses)]
+            self._cursor += 1
+        return scripted(body) if callable(scripted) else scripted
+
+    def _admit(self) -> bool:
+        """请求进入队列，队列已满时拒绝"""
+        with self._lock:
+            if self.max_queue is not None and self._pending >= (self.max_parallel or 0) + self.max_queue:
+                self.rejected += 1
+                return False
+            self._pending += 1
+            return True
+
+    def _running(self, delta: int):
+        with self._lock:
+            self.in_flight += delta
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if delta < 0:
+                self._pending -= 1
+
+    def _prefill(self, model: str, full_input: str) -> tuple:
+        """计算本次请求的加载与预填充耗时，返回 (秒, 需计算的字符数)"""
+        now = time.monotonic()
+        with self._lock:
+            delay = 0.0
+            if self._loaded_until.get(model, 0.0) < now:
+                delay += self.load_delay
+                self._kv_cache.pop(model, None)
+            cached = len(os.path.commonprefix([self._kv_cache.get(model, ""), full_input]))
+            uncached = len(full_input) - cached
+            self.prompt_chars_evaluated += uncached
+        return delay + uncached * self.prompt_eval_per_char, uncached
+
+    def _finish(self, model: str, sequence: str, keep_alive) -> int:
+        """记录 KV 缓存与 keep_alive，返回本次序列的 context 句柄"""
+        ttl = _parse_keep_alive(keep_alive)
+        with self._lock:
+            self._kv_cache[model] = sequence
+            self._loaded_until[model] = time.monotonic() + ttl
+            handle = len(self._contexts) + 1
+            self._contexts[handle] = sequence
+        return handle
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, payload: dict, status: int = 200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_chunk(self, payload: dict):
+                data = (json.dumps(payload, ensure_ascii=False) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path == "/api/version":
+                    self._send_json({"version": "0.0.0-fake"})
+                elif self.path == "/api/tags":
+                    self._send_json({"models": []})
+                else:
+                    self._send_json({"error": "not found"}, status=404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with fake._lock:
+                    fake.requests.append(body)
+                handler = {"/api/generate": self._generate, "/api/chat": self._chat}.get(self.path)
+                if handler is None:
+                    self._send_json({"error": "not found"}, status=404)
+                elif not fake._admit():
+                    self._send_json({"error": "server busy, please try again.  maximum pending requests exceeded"}, status=503)
+                else:
+                    with fake._slots or nullcontext():
+                        fake._running(1)
+                        try:
+                            handler(body)
+                        finally:
+                            fake._running(-1)
+
+            def _generate(self, body: dict):
+                model = body.get("model", "")
+                context = body.get("context") or []
+                prompt = body.get("prompt") or ""
+                full_input = "".join(fake._contexts.get(handle, "") for handle in context) + prompt
+                text = fake._next_response(body)
+                self._reply(
+                    body, full_input, text,
+                    piece=lambda chunk: {"model": model, "response": chunk, "done": False},
+                    final=lambda handle, uncached, reply: _final_payload(model, reply, handle, uncached, len(text) // 4),
+                )
+
+            def _chat(self, body: dict):
+                """/api/chat：脚本化响应为字符串，或 {"content": ..., "tool_calls": [...]}"""
+                model = body.get("model", "")
+                full_input = "".join(
+                    f"{message.get('role')}: {message.get('content') or ''}\n" for message in body.get("messages") or []
+                )
+                reply = fake._next_response(body)
+                if isinstance(reply, str):
+                    reply = {"content": reply}
+                tool_calls = reply.get("tool_calls")
+
+                def message(content: str, with_tools: bool) -> dict:
+                    payload = {"role": "assistant", "content": content}
+                    if with_tools and tool_calls:
+                        payload["tool_calls"] = tool_calls
+                    return payload
+
+                def final(handle: int, uncached: int, content: str) -> dict:
+                    generated = reply.get("content", "") + json.dumps(tool_calls or [], ensure_ascii=False)
+                    payload = _final_payload(model, "", handle, uncached, len(generated) // 4)
+                    del payload["response"], payload["context"]
+                    # 非流式时完整内容和工具调用都在最终消息里
+                    return {**payload, "message": message(content, with_tools=body.get("stream", True) is False)}
+
+                self._reply(
+                    body, full_input, reply.get("content", ""),
+                    piece=lambda chunk: {"model": model, "message": message(chunk, False), "done": False},
+                    final=final,
+                    # 真实服务在最终块之前单独发送一块携带 tool_calls 的消息
+                    tail=[{"model": model, "message": message("", True), "done": False}] if tool_calls else [],
+                )
+
+            def _reply(self, body: dict, full_input: str, text: str, piece, final, tail=()):
+                """按请求的 stream 参数整体返回或逐块输出 text，最后发送 final 块"""
+                model = body.get("model", "")
+                delay, uncached = fake._prefill(model, full_input)
+                time.sleep(fake.first_token_delay + delay)
+
+                if body.get("stream", True) is False:
+                    handle = fake._finish(model, full_input + text, body.get("keep_alive"))
+                    self._send_json(final(handle, uncached, text))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    step = max(fake.chunk_size, 1)
+                    for i in range(0, len(text), step):
+                        if i:
+                            time.sleep(fake.token_delay)
+                        self._write_chunk(piece(text[i:i + step]))
+                    for payload in tail:
+                        self._write_chunk(payload)
+                    handle = fake._finish(model, full_input + text, body.get("keep_alive"))
+                    self._write_chunk(final(handle, uncached, ""))
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端提前取消生成
+                    self.close_connection = True
+
+        return Handler
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    # 与真实服务一样接受大量并发连接，排队和拒绝由 max_parallel / max_queue 控制
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # 客户端取消或断开连接属于预期情况，不打印堆栈
+        pass
+
+
+def _final_payload(model: str, text: str, handle: int, prompt_chars: int, eval_count: int = 1) -> dict:
+    return {
+        "model": model,
+        "response": text,
+        "done": True,
+        "done_reason": "stop",
+        "context": [handle],
+        "prompt_eval_count": prompt_chars // 4,
+        "eval_count": max(eval_count, 1),
+    }
+
+
+def _parse_keep_alive(keep_alive) -> float:
+    """把 Ollama 的 keep_alive（秒数或 '5m' 这类字符串）换算为秒"""
+    if keep_alive is None:
+        return 300.0
+    if isinstance(keep_alive, (int, float)):
+        return float(keep_alive) if keep_alive >= 0 else float("inf")
+    units = {"s": 1, "m": 60, "h": 3600}
+    value = str(keep_alive).strip()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
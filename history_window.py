@@ -0,0 +1,228 @@
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+# 中日韩字符和全角符号在 DeepSeek/Qwen 的分词器中约一字一 token，其余文本约 4 字符一 token
+_CJK = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+SUMMARY_HEADER = "[早先历史摘要]"
+
+SUMMARY_PROMPT = """请把下面的浏览器自动化任务历史压缩成简短的中文摘要，保留已完成的操作、访问过的页面、
+得到的关键信息（数值、标题、链接）和遇到的错误，不要编造，不超过 {limit} 字。
+
+已有摘要：
+{summary}
+
+新增历史：
+{history}
+
+摘要："""
+
+
+def estimate_tokens(text: str) -> int:
+    """不加载分词器的快速估算，偏保守"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@dataclass
+class _Conversation:
+    # 已折叠的消息数（不含固定保留的开头部分）及其指纹，历史被改写时重新开始；
+    # 从检查点恢复时指纹为 None，第一次请求时按恢复的消息重新计算
+    folded: int = 0
+    fingerprints: Optional[List[tuple]] = field(default_factory=list)
+    summary: str = ""
+    # 已折叠但尚未并入摘要的消息，先以摘录形式放在摘要之后
+    unsummarized: List[str] = field(default_factory=list)
+    summarizing: bool = False
+
+
+class HistoryWindow:
+    """按 token 预算裁剪对话历史
+
+    开头的 SystemMessage 和第一条 HumanMessage（任务）以及最后 keep_last_turns 轮原样保留，
+    一轮从一条 AIMessage 开始。超出预算时把最早的若干轮折叠掉，直到降到预算的 target_ratio，
+    留出余量使折叠不必每步发生、提示词前缀尽量保持不变。
+
+    折叠的内容立即以每条一行的摘录代替；本次请求结束后由 summarize_pending 在后台线程中
+    调用 summarize 把它们并入滚动摘要，不阻塞请求，摘要完成后之后的请求改用摘要。
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        render: Callable[[BaseMessage], Optional[str]],
+        summarize: Optional[Callable[[str], str]] = None,
+        keep_last_turns: int = 4,
+        target_ratio: float = 0.75,
+        excerpt_chars: int = 160,
+        summary_chars: int = 600,
+        max_conversations: int = 32,
+    ):
+        self.max_tokens = max_tokens
+        self.render = render
+        self.summarize = summarize
+        self.keep_last_turns = keep_last_turns
+        self.target_ratio = target_ratio
+        self.excerpt_chars = excerpt_chars
+        self.summary_chars = summary_chars
+        self.max_conversations = max_conversations
+        self._conversations: "OrderedDict[tuple, _Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+
+    def _tokens(self, message: BaseMessage) -> int:
+        text = self.render(message)
+        return estimate_tokens(text) + 1 if text is not None else 0
+
+    def _excerpt(self, message: BaseMessage) -> Optional[str]:
+        text = self.render(message)
+        if not text:
+            return None
+        text = " ".join(text.split())
+        return text if len(text) <= self.excerpt_chars else text[:self.excerpt_chars] + "…"
+
+    @staticmethod
+    def _fingerprint(message: BaseMessage) -> tuple:
+        content = message.content or str(getattr(message, "tool_calls", "") or "")
+        return (message.type, hash(content if isinstance(content, str) else str(content)))
+
+    def _conversation(self, key: tuple) -> _Conversation:
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            conversation = self._conversations[key] = _Conversation()
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        else:
+            self._conversations.move_to_end(key)
+        return conversation
+
+    @staticmethod
+    def _pinned(messages: List[BaseMessage]) -> int:
+        """开头固定保留的消息数：系统消息和第一条任务消息"""
+        for index, message in enumerate(messages):
+            if isinstance(message, HumanMessage):
+                return index + 1
+            if not isinstance(message, SystemMessage):
+                return index
+        return len(messages)
+
+    def _summary_message(self, conversation: _Conversation) -> Optional[HumanMessage]:
+        parts = [part for part in [conversation.summary, *conversation.unsummarized] if part]
+        if not parts:
+            return None
+        return HumanMessage(content=SUMMARY_HEADER + "\n" + "\n".join(parts))
+
+    def apply(self, key: tuple, messages: List[BaseMessage], fixed_tokens: int = 0) -> List[BaseMessage]:
+        """返回预算内的消息列表，fixed_tokens 为系统说明和工具目录等不在消息中的部分"""
+        pinned = self._pinned(messages)
+        head, rest = messages[:pinned], messages[pinned:]
+        # 最后 keep_last_turns 轮不折叠；最后一条 AIMessage 之后是当前这一轮（模型要据此行动的页面状态），
+        # 任何时候都不折叠，keep_last_turns 为 0 时最多折叠到最后一条 AIMessage 为止
+        starts = [index for index, message in enumerate(rest) if isinstance(message, AIMessage)]
+        if not starts:
+            foldable = 0
+        elif self.keep_last_turns == 0:
+            foldable = starts[-1] + 1
+        else:
+            foldable = starts[-self.keep_last_turns] if len(starts) >= self.keep_last_turns else 0
+
+        with self._lock:
+            conversation = self._conversation(key)
+            fingerprints = [self._fingerprint(message) for message in rest[:conversation.folded]]
+            if conversation.fingerprints is None and conversation.folded <= foldable:
+                conversation.fingerprints = fingerprints
+            if conversation.folded > foldable or fingerprints != conversation.fingerprints:
+                conversation = self._conversations[key] = _Conversation()
+
+            base = fixed_tokens + sum(self._tokens(message) for message in head)
+            sizes = [self._tokens(message) for message in rest]
+            summary = self._summary_message(conversation)
+            total = base + (self._tokens(summary) if summary else 0) + sum(sizes[conversation.folded:])
+            if total > self.max_tokens:
+                target = self.max_tokens * self.target_ratio
+                folded = conversation.folded
+                excerpts = []
+                # 按整轮折叠：降到目标以下后，仍折叠到下一轮的开头为止
+                while folded < foldable and (total > target or not isinstance(rest[folded], AIMessage)):
+                    total -= sizes[folded]
+                    excerpt = self._excerpt(rest[folded])
+                    if excerpt:
+                        excerpts.append(excerpt)
+                        total += estimate_tokens(excerpt) + 1
+                    folded += 1
+                conversation.folded = folded
+                conversation.fingerprints = [self._fingerprint(message) for message in rest[:folded]]
+                conversation.unsummarized.extend(excerpts)
+            summary = self._summary_message(conversation)
+            folded = conversation.folded
+
+        return head + ([summary] if summary else []) + rest[folded:]
+
+    def export_state(self) -> List[dict]:
+        """各对话的折叠位置和摘要，对话键需要跨进程不变（见 DeepseekToolWrapper._conversation_key）"""
+        with self._lock:
+            return [
+                {
+                    "key": key,
+                    "folded": conversation.folded,
+                    "summary": conversation.summary,
+                    "unsummarized": list(conversation.unsummarized),
+                }
+                for key, conversation in self._conversations.items()
+            ]
+
+    def load_state(self, states: List[dict]):
+        with self._lock:
+            for state in states:
+                key = _as_tuple(state["key"])
+                self._conversations[key] = _Conversation(
+                    folded=state["folded"],
+                    fingerprints=None,
+                    summary=state["summary"],
+                    unsummarized=list(state["unsummarized"]),
+                )
+                self._conversations.move_to_end(key)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+
+    def summarize_pending(self, key: tuple):
+        """请求结束后调用：模型空闲、浏览器执行动作期间生成摘要，不与本对话的请求争用模型"""
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is not None:
+                self._schedule(conversation)
+
+    def _schedule(self, conversation: _Conversation):
+        """在后台把尚未并入的摘录合并进摘要，同一对话同时只有一个任务"""
+        if self.summarize is None or conversation.summarizing or not conversation.unsummarized:
+            return
+        conversation.summarizing = True
+        pending = list(conversation.unsummarized)
+        prompt = SUMMARY_PROMPT.format(
+            limit=self.summary_chars, summary=conversation.summary or "（无）", history="\n".join(pending)
+        )
+        self._executor.submit(self._summarize, conversation, prompt, len(pending))
+
+    def _summarize(self, conversation: _Conversation, prompt: str, consumed: int):
+        try:
+            summary = self.summarize(prompt).strip()
+        except Exception:
+            # 摘要失败时保留摘录，下次折叠时重试
+            summary = ""
+        with self._lock:
+            conversation.summarizing = False
+            if summary:
+                conversation.summary = summary[:self.summary_chars * 2]
+                del conversation.unsummarized[:consumed]
+                self._schedule(conversation)
+
+
+def _as_tuple(value):
+    """JSON 把元组存成列表，恢复成可作为字典键的元组"""
+    return tuple(_as_tuple(item) for item in value) if isinstance(value, list) else value
@@ -0,0 +1,229 @@
+import argparse
+import copy
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# prompt/parse 由 DeepseekToolWrapper 在结果中上报，inference 为模型调用的其余耗时，
+# dom/actions 由 instrument_agent 包装 browser-use 的页面状态提取和动作执行得到
+PHASES = ("prompt", "inference", "parse", "dom", "actions")
+
+# 当前步骤按上下文保存：并发运行的 Agent 各在自己的 asyncio 任务中，记录的步骤互不覆盖
+_current_step: ContextVar[int] = ContextVar("metrics_step", default=0)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩法百分位数，values 为空时返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class RunMetrics:
+    """收集一次运行中各阶段的耗时、token 数和解析失败
+
+    每条记录 {"ts", "step", "phase", "seconds", ...} 实时追加到 jsonl_path（可为空），
+    同时累计为计数器，运行结束时可输出 p50/p95 汇总和 Prometheus 文本格式。
+    step 取自记录所在 Agent 的当前步骤（见 instrument_agent），多个 Agent 可共用一个实例。
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None):
+        self.jsonl_path = jsonl_path
+        self.events: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def record(self, phase: str, seconds: float, **fields: Any):
+        event = {"ts": round(time.time(), 3), "step": _current_step.get(), "phase": phase, "seconds": round(seconds, 6), **fields}
+        with self._lock:
+            self.events.append(event)
+            self.counters[f'phase_seconds_total{{phase="{phase}"}}'] += seconds
+            self.counters[f'phase_calls_total{{phase="{phase}"}}'] += 1
+            for kind in ("prompt", "completion"):
+                if fields.get(f"{kind}_tokens"):
+                    self.counters[f'tokens_total{{type="{kind}"}}'] += fields[f"{kind}_tokens"]
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def merge(self, events: List[Dict[str, Any]], counters: Dict[str, float]):
+        """并入另一个 RunMetrics 的记录和计数器，用于汇总多个工作进程"""
+        with self._lock:
+            self.events.extend(events)
+            for name, value in counters.items():
+                self.counters[name] += value
+            if self.jsonl_path and events:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+
+    def summary(self) -> str:
+        return format_summary(self.events, dict(self.counters))
+
+    def prometheus(self, prefix: str = "browser_agent") -> str:
+        """Prometheus 文本格式，可交给 node_exporter 的 textfile collector 采集"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+        lines, declared = [], set()
+        for name, value in counters:
+            metric = name.split("{")[0]
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {prefix}_{metric} counter")
+            lines.append(f"{prefix}_{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+
+
+def format_summary(events: List[Dict[str, Any]], counters: Optional[Dict[str, float]] = None) -> str:
+    """按阶段汇总次数、p50、p95 和总耗时，附带 token 与失败计数"""
+    by_phase: Dict[str, List[float]] = defaultdict(list)
+    tokens = defaultdict(int)
+    failures = 0
+    for event in events:
+        by_phase[event["phase"]].append(event["seconds"])
+        tokens["prompt"] += event.get("prompt_tokens") or 0
+        tokens["completion"] += event.get("completion_tokens") or 0
+        failures += bool(event.get("parse_failed"))
+
+    phases = [phase for phase in PHASES if phase in by_phase] + sorted(set(by_phase) - set(PHASES))
+    lines = [f"{'阶段':<10}{'次数':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'总计(s)':>10}"]
+    for phase in phases:
+        values = by_phase[phase]
+        lines.append(
+            f"{phase:<12}{len(values):>6}{percentile(values, 50) * 1000:>10.1f}"
+            f"{percentile(values, 95) * 1000:>10.1f}{sum(values):>10.2f}"
+        )
+    lines.append(f"tokens：提示词 {tokens['prompt']}，生成 {tokens['completion']}；解析失败 {failures} 次")
+    extra = {name: value for name, value in (counters or {}).items() if not name.startswith(("phase_", "tokens_"))}
+    if extra:
+        lines.append("其他计数：" + "，".join(f"{name}={value:g}" for name, value in sorted(extra.items())))
+    return "\n".join(lines)
+
+
+class MetricsCallback(BaseCallbackHandler):
+    """LangChain 回调：记录每次模型调用的耗时和 token 数
+
+    任意聊天模型都可使用，例如 ChatOpenAI(..., callbacks=[MetricsCallback(metrics)])。
+    DeepseekToolWrapper 会在结果中额外上报提示词构建和解析的耗时以及解析是否失败。
+    """
+
+    # 在调用方的事件循环中同步执行，计时不受线程池调度影响
+    run_inline = True
+
+    def __init__(self, metrics: RunMetrics):
+        self.metrics = metrics
+        # run_id -> (perf_counter, 墙上时间)
+        self._starts: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any):
+        self._starts[run_id] = (time.perf_counter(), time.time())
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+        self._starts[run_id] = (time.perf_counter(), time.time())
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        start = self._starts.pop(run_id, None)
+        if start is None or not response.generations or not response.generations[0]:
+            return
+        total = time.perf_counter() - start[0]
+        generation = response.generations[0][0]
+        info = generation.generation_info or {}
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+        if not usage and response.llm_output:
+            token_usage = response.llm_output.get("token_usage") or {}
+            usage = {"input_tokens": token_usage.get("prompt_tokens"), "output_tokens": token_usage.get("completion_tokens")}
+
+        # 响应缓存命中时结果是早先生成的，其中的 timings 不属于本次调用
+        cached = info.get("created", start[1]) < start[1]
+        timings = {} if cached else info.get("timings") or {}
+        for phase, seconds in timings.items():
+            self.metrics.record(phase, seconds)
+        if cached:
+            usage = {}
+        self.metrics.record(
+            "inference",
+            total - sum(timings.values()),
+            prompt_tokens=usage.get("input_tokens"),
+            completion_tokens=usage.get("output_tokens"),
+            parse_failed=bool(info.get("parse_failed")),
+            cached=cached,
+        )
+        if info.get("parse_failed"):
+            self.metrics.count("parse_failures_total")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.metrics.record("inference", time.perf_counter() - start[0], error=type(error).__name__)
+        self.metrics.count("llm_errors_total")
+
+
+def instrument_agent(agent, metrics: RunMetrics):
+    """包装 browser-use Agent 的页面状态提取和动作执行，分别记为 dom 和 actions 阶段"""
+    browser_context = agent.browser_context
+    # Agent 的默认 controller 是所有实例共享的同一个对象，复制一份再包装，避免影响其他 Agent
+    controller = agent.controller = copy.copy(agent.controller)
+    get_state = browser_context.get_state
+    multi_act = controller.multi_act
+    get_next_action = agent.get_next_action
+
+    async def timed_get_state(*args, **kwargs):
+        _current_step.set(agent.n_steps)
+        start = time.perf_counter()
+        try:
+            return await get_state(*args, **kwargs)
+        finally:
+            metrics.record("dom", time.perf_counter() - start)
+
+    async def timed_multi_act(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await multi_act(*args, **kwargs)
+        finally:
+            metrics.record("actions", time.perf_counter() - start)
+
+    async def counted_get_next_action(*args, **kwargs):
+        # 模型输出无法转换为 AgentOutput 时 browser-use 抛出 ValueError
+        try:
+            return await get_next_action(*args, **kwargs)
+        except ValueError:
+            metrics.count("agent_output_errors_total")
+            raise
+
+    browser_context.get_state = timed_get_state
+    controller.multi_act = timed_multi_act
+    agent.get_next_action = counted_get_next_action
+    return agent
+
+
+def load_events(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="汇总运行时记录的各阶段耗时")
+    parser.add_argument("jsonl", help="RunMetrics 写出的 JSONL 文件")
+    args = parser.parse_args()
+    print(format_summary(load_events(args.jsonl)))
+
+
+if __name__ == "__main__":
+    main()
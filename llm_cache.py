@@ -0,0 +1,139 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+# 工具、函数等对象的 repr 中带有内存地址，每次运行都不同
+_MEMORY_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """合并连续空白，缩进或换行不同的相同提示词命中同一条缓存"""
+    return " ".join(prompt.split())
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class SQLiteLLMCache(BaseCache):
+    """基于 SQLite 的持久化 LLM 响应缓存
+
+    通过 LangChain 的 cache 参数接入，ChatOpenAI 与 DeepseekToolWrapper 均可使用：
+        ChatOpenAI(..., cache=SQLiteLLMCache())
+        DeepseekToolWrapper(cache=SQLiteLLMCache())
+    键为 (模型参数哈希, 规范化提示词哈希)，模型参数中包含模型名和温度。
+    条目超过 ttl 秒后失效，总大小超过 max_bytes 或条数超过 max_entries 时按最近访问时间淘汰。
+    """
+
+    def __init__(
+        self,
+        database_path: str = ".llm_cache.sqlite",
+        ttl: Optional[float] = 7 * 24 * 3600,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_entries: Optional[int] = None,
+    ):
+        self.database_path = database_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " llm_hash TEXT NOT NULL,"
+            " prompt_hash TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " PRIMARY KEY (llm_hash, prompt_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> tuple:
+        return _digest(_MEMORY_ADDRESS.sub("", llm_string)), _digest(normalize_prompt(prompt))
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM llm_cache WHERE llm_hash = ? AND prompt_hash = ?", key
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE llm_hash = ? AND prompt_hash = ?", key)
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET accessed = ? WHERE llm_hash = ? AND prompt_hash = ?", (now, *key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return loads(row[0])
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        value = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (*self._key(prompt, llm_string), value, len(value), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小和条数都在上限内"""
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if total <= self.max_bytes and (self.max_entries is None or count <= self.max_entries):
+            return
+        rows = self._conn.execute("SELECT llm_hash, prompt_hash, size FROM llm_cache ORDER BY accessed").fetchall()
+        for llm_hash, prompt_hash, size in rows:
+            if total <= self.max_bytes and (self.max_entries is None or count <= self.max_entries):
+                break
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE llm_hash = ? AND prompt_hash = ?", (llm_hash, prompt_hash)
+            )
+            total -= size
+            count -= 1
+            self.evictions += 1
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """本进程的命中统计以及缓存库当前的条数和大小"""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": count,
+            "bytes": total,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
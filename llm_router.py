@@ -0,0 +1,297 @@
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable
+from pydantic import Field, PrivateAttr
+
+from llm_utils import (
+    TEXT_ONLY_MODELS, check_tool_calls, evict_oldest, json_tool_call, model_name, plain_messages, tool_call_required,
+    tool_name, tools_key,
+)
+
+
+class BackendStats:
+    """单个后端最近 window 次成功调用的耗时，以及失败、超时和对冲的计数"""
+
+    def __init__(self, name: str, window: int = 100):
+        self.name = name
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.wins = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def as_dict(self) -> Dict[str, Any]:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            "calls": self.calls,
+            "wins": self.wins,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p95": round(p95, 3) if p95 is not None else None,
+        }
+
+
+class RouterError(RuntimeError):
+    """所有后端都失败时抛出，errors 为各后端的异常"""
+
+    def __init__(self, errors: Dict[str, BaseException]):
+        self.errors = errors
+        super().__init__("所有模型后端均失败：" + "；".join(f"{name}: {error!r}" for name, error in errors.items()))
+
+
+class LLMRouter(BaseChatModel):
+    """在多个模型后端之间路由的聊天模型
+
+    按 backends 的顺序优先使用靠前的后端：
+    - 出错、超时（timeout）或要求工具调用时没有给出合法的工具调用，立即换下一个后端；
+    - 连续失败 failure_threshold 次的后端在 cooldown 秒内排到最后，避免每次都先等它失败，
+      偶发的一次超时不影响它的优先级；
+    - hedge=True 时，当前后端超过其历史耗时的 hedge_quantile 分位（样本不足时用 hedge_delay）
+      仍未返回，同时向下一个后端发出请求，先返回合法结果的胜出，另一个被取消。
+
+    bind_tools / with_structured_output 把工具分别交给每个后端；deepseek-reasoner 这类不支持
+    工具调用的后端改为按文本回复，从中提取 JSON 作为工具调用。
+    """
+
+    backends: List[Any]
+    names: Optional[List[str]] = None
+    timeout: Optional[float] = Field(default=120.0, description="单个后端一次调用的最长等待（秒）")
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_delay: float = Field(default=5.0, description="耗时样本不足 min_samples 时的对冲等待（秒）")
+    min_samples: int = 5
+    failure_threshold: int = 2
+    cooldown: float = 30.0
+    # browser-use 按 model_name 选择调用方式，这里不能是 deepseek-reasoner，统一走工具调用
+    model_name: str = "llm-router"
+
+    _stats: List[BackendStats] = PrivateAttr(default_factory=list)
+    _bound: Dict[tuple, Runnable] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _hedges: int = PrivateAttr(default=0)
+    _hedge_wins: int = PrivateAttr(default=0)
+    # 同步调用的后端请求在这里执行，不用事件循环的默认线程池，落败的请求不会拖住 asyncio.run 的退出
+    _blocking_pool: ThreadPoolExecutor = PrivateAttr(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-router")
+    )
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if not self.backends:
+            raise ValueError("至少需要一个模型后端")
+        names = self.names or [model_name(backend) for backend in self.backends]
+        if len(names) != len(self.backends):
+            raise ValueError("names 与 backends 数量不一致")
+        self.names = names
+        self._stats = [BackendStats(name) for name in names]
+
+    @property
+    def _llm_type(self) -> str:
+        return "llm-router"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"backends": self.names, "hedge": self.hedge}
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[Any] = None, **kwargs: Any) -> Runnable:
+        return self.bind(tools=list(tools), tool_choice=tool_choice, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """各后端的调用次数、胜出次数、失败、超时和耗时分位，以及对冲次数"""
+        with self._lock:
+            return {
+                "backends": {stats.name: stats.as_dict() for stats in self._stats},
+                "hedges": self._hedges,
+                "hedge_wins": self._hedge_wins,
+            }
+
+    def _order(self) -> List[int]:
+        """配置顺序，处于冷却期的后端排到最后"""
+        now = time.monotonic()
+        indices = range(len(self.backends))
+        return [i for i in indices if self._stats[i].cooldown_until <= now] + [
+            i for i in indices if self._stats[i].cooldown_until > now
+        ]
+
+    def _hedge_after(self, index: int) -> float:
+        stats = self._stats[index]
+        if len(stats.latencies) < self.min_samples:
+            return self.hedge_delay
+        return stats.quantile(self.hedge_quantile)
+
+    def _runnable(self, index: int, tools: Optional[List[Any]], tool_choice: Optional[Any]) -> Runnable:
+        backend = self.backends[index]
+        if not tools:
+            return backend
+        # 按工具内容而不是对象 id 缓存：每个 Agent 的工具对象不同但内容相同，释放的对象地址还会被复用
+        key = (index, tools_key(tools), str(tool_choice))
+        with self._lock:
+            bound = self._bound.get(key)
+            if bound is None:
+                # 每个后端最多保留 8 组工具的绑定，不随 Agent 数量增长
+                evict_oldest(self._bound, 8 * len(self.backends))
+                bound = self._bound[key] = backend.bind_tools(tools, tool_choice=tool_choice)
+        return bound
+
+    async def _call_backend(
+        self,
+        index: int,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]],
+        tools: Optional[List[Any]],
+        tool_choice: Optional[Any],
+        blocking: bool,
+        **kwargs: Any,
+    ) -> AIMessage:
+        async def invoke(runnable: Runnable, messages: List[BaseMessage]) -> AIMessage:
+            # 同步调用方使用后端的同步接口，在线程中执行；超时或对冲落败时不再等待其结果
+            if blocking:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._blocking_pool, functools.partial(runnable.invoke, messages, stop=stop, **kwargs)
+                )
+            return await runnable.ainvoke(messages, stop=stop, **kwargs)
+
+        backend = self.backends[index]
+        if tools and model_name(backend) in TEXT_ONLY_MODELS:
+            if len(tools) != 1:
+                raise ValueError(f"{self.names[index]} 不支持工具调用，只能按文本回复单个结构化输出")
+            reply = await invoke(backend, plain_messages(messages))
+            call = json_tool_call(reply.content, tool_name(tools[0]))
+            return AIMessage(content=reply.content, tool_calls=[call] if call else [])
+        return await invoke(self._runnable(index, tools, tool_choice), messages)
+
+    async def _attempt(
+        self, index: int, call: Callable[[int], Awaitable[AIMessage]], check: Callable[[AIMessage], None]
+    ) -> AIMessage:
+        stats = self._stats[index]
+        with self._lock:
+            stats.calls += 1
+        start = time.perf_counter()
+        try:
+            message = await asyncio.wait_for(call(index), self.timeout)
+            check(message)
+        except asyncio.CancelledError:
+            with self._lock:
+                stats.cancelled += 1
+            raise
+        except Exception as error:
+            with self._lock:
+                stats.failures += 1
+                if isinstance(error, asyncio.TimeoutError):
+                    stats.timeouts += 1
+                stats.consecutive_failures += 1
+                if stats.consecutive_failures >= self.failure_threshold:
+                    stats.cooldown_until = time.monotonic() + self.cooldown
+            raise
+        with self._lock:
+            stats.latencies.append(time.perf_counter() - start)
+            stats.consecutive_failures = 0
+            stats.cooldown_until = 0.0
+        return message
+
+    async def _route(self, call: Callable[[int], Awaitable[AIMessage]], check: Callable[[AIMessage], None]) -> AIMessage:
+        order = self._order()
+        candidates = iter(order)
+        pending: Dict[asyncio.Future, int] = {}
+        errors: Dict[str, BaseException] = {}
+        hedged = False
+
+        def launch() -> Optional[int]:
+            index = next(candidates, None)
+            if index is not None:
+                pending[asyncio.ensure_future(self._attempt(index, call, check))] = index
+            return index
+
+        current = launch()
+        try:
+            while pending:
+                # 只有一个请求在途且还有后备时才对冲，同时最多两个请求
+                wait = self._hedge_after(current) if self.hedge and len(pending) == 1 and not hedged else None
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch() is not None:
+                        hedged = True
+                        with self._lock:
+                            self._hedges += 1
+                    continue
+                for future in done:
+                    index = pending.pop(future)
+                    if future.exception() is None:
+                        with self._lock:
+                            self._stats[index].wins += 1
+                            if hedged and index != order[0]:
+                                self._hedge_wins += 1
+                        return future.result()
+                    errors[self.names[index]] = future.exception()
+                if not pending:
+                    current = launch()
+                    hedged = False
+            raise RouterError(errors)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def _respond(
+        self, messages: List[BaseMessage], stop: Optional[List[str]], blocking: bool, **kwargs: Any
+    ) -> ChatResult:
+        tools = kwargs.pop("tools", None)
+        tool_choice = kwargs.pop("tool_choice", None)
+        structured = kwargs.pop("ls_structured_output_format", None) is not None
+        # 只有强制调用工具时，不含工具调用的回复才算失败；否则直接回答是合法的（如 AgentExecutor 的最终答复）
+        check = functools.partial(check_tool_calls, tools=tools, required=tool_call_required(tool_choice, structured))
+
+        async def call(index: int) -> AIMessage:
+            return await self._call_backend(index, messages, stop, tools, tool_choice, blocking, **kwargs)
+
+        message = await self._route(call, check)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await self._respond(messages, stop, blocking=False, **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # 调用方可能已在事件循环中，路由逻辑在单独线程的事件循环中运行
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self._respond(messages, stop, blocking=True, **kwargs)).result()
+
+
+def create_router(backends: Sequence[str], timeout: Optional[float] = 120.0, hedge: bool = False, **kwargs: Any) -> LLMRouter:
+    """按 backends.py 中的名称依次创建各后端（使用各自的默认模型），kwargs 传给每个后端"""
+    from backends import create_llm
+
+    return LLMRouter(
+        backends=[create_llm(name, **kwargs) for name in backends], names=list(backends), timeout=timeout, hedge=hedge
+    )
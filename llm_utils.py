@@ -0,0 +1,134 @@
+import hashlib
+import json
+import uuid
+import weakref
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel
+
+from action_parser import iter_json_objects, repair_json, strip_reasoning
+
+# 不支持工具调用、只能按文本回复 JSON 的模型（browser-use 对它们同样走文本解析）
+TEXT_ONLY_MODELS = ("deepseek-reasoner",)
+
+# pydantic 模型类、函数等对象的 schema 摘要，按对象弱引用缓存：对象释放后条目随之删除，
+# 不会因为内存地址被新对象复用而命中旧条目
+_DIGESTS: "weakref.WeakKeyDictionary[Any, str]" = weakref.WeakKeyDictionary()
+
+
+def _digest(value: Any) -> str:
+    text = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def schema_digest(schema: Any) -> Optional[str]:
+    """工具参数 schema 的内容摘要，schema 可以是字典、pydantic 模型类或函数"""
+    if schema is None:
+        return None
+    if isinstance(schema, dict):
+        return _digest(schema)
+    try:
+        return _DIGESTS[schema]
+    except (KeyError, TypeError):
+        pass
+    digest = _digest(convert_to_openai_tool(schema))
+    try:
+        _DIGESTS[schema] = digest
+    except TypeError:
+        # 不能弱引用的对象每次重新计算
+        pass
+    return digest
+
+
+def tool_signature(tool: Any) -> tuple:
+    """单个工具的 (名称, 描述, 参数 schema 摘要)，内容相同的工具签名相同"""
+    if isinstance(tool, BaseTool):
+        return tool.name, tool.description, schema_digest(tool.args_schema)
+    return None, None, schema_digest(tool)
+
+
+def tools_key(tools: Optional[Sequence[Any]]) -> tuple:
+    """按工具内容生成缓存键，代替工具对象的 id
+
+    browser-use 每一步都重新绑定工具，每步得到新的工具对象；
+    释放的对象地址还会被复用，按 id 缓存既不命中，又可能取到另一组工具的结果。
+    """
+    return tuple(tool_signature(tool) for tool in tools or ())
+
+
+def evict_oldest(cache: Dict, limit: int = 8):
+    """字典按插入顺序淘汰最早的条目，为新条目腾出位置"""
+    while len(cache) >= limit:
+        cache.pop(next(iter(cache)))
+
+
+def model_name(backend: Any) -> str:
+    return str(getattr(backend, "model_name", None) or getattr(backend, "model", None) or type(backend).__name__)
+
+
+def tool_name(tool: Any) -> str:
+    return convert_to_openai_tool(tool)["function"]["name"]
+
+
+def plain_messages(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """工具调用和工具结果改写为普通文本，相邻的同类消息合并（deepseek-reasoner 要求角色交替）"""
+    plain: List[BaseMessage] = []
+    for message in messages:
+        if isinstance(message, AIMessage) and message.tool_calls:
+            message = AIMessage(content="\n".join(
+                json.dumps(call["args"], ensure_ascii=False) for call in message.tool_calls
+            ))
+        elif isinstance(message, ToolMessage):
+            if not message.content:
+                continue
+            message = HumanMessage(content=message.content)
+        previous = plain[-1] if plain else None
+        if (
+            previous is not None and type(previous) is type(message) and not isinstance(message, SystemMessage)
+            and isinstance(previous.content, str) and isinstance(message.content, str)
+        ):
+            plain[-1] = type(message)(content=f"{previous.content}\n\n{message.content}")
+        else:
+            plain.append(message)
+    return plain
+
+
+def json_tool_call(text: str, name: str) -> Optional[Dict[str, Any]]:
+    """从文本回复中取第一个合法的 JSON 对象，作为唯一工具的调用参数"""
+    for candidate in iter_json_objects(strip_reasoning(text)):
+        for attempt in (candidate, repair_json(candidate)):
+            try:
+                data = json.loads(attempt)
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                return {"name": name, "args": data, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+    return None
+
+
+def tool_call_required(tool_choice: Any, structured: bool = False) -> bool:
+    """tool_choice 是否强制调用工具：any/required/指定工具名，以及 with_structured_output
+
+    未指定或为 auto/none 时模型可以直接回答（如 AgentExecutor 的最终答复）。
+    """
+    if structured:
+        return True
+    return tool_choice not in (None, False, "auto", "none")
+
+
+def check_tool_calls(message: AIMessage, tools: Optional[List[Any]], required: bool = True):
+    """required 时回复必须包含工具调用；回复中的工具调用参数都要能通过 Pydantic 模型校验"""
+    if not tools:
+        return
+    if not message.tool_calls:
+        if required:
+            raise ValueError("回复中没有工具调用")
+        return
+    schemas = {tool_name(tool): tool for tool in tools if isinstance(tool, type) and issubclass(tool, BaseModel)}
+    for call in message.tool_calls:
+        schema = schemas.get(call["name"])
+        if schema is not None:
+            schema.model_validate(call["args"])
@@ -1,50 +1,24 @@
 import os
 import asyncio
-from pathlib import Path
 from dotenv import load_dotenv
 from langchain_ollama import ChatOllama  # 使用本地 Ollama 模型
-from browser_use import Agent, Browser, BrowserConfig
+from browser_use import Agent
+from browser_launcher import configure_chrome_browser
 from pydantic import SecretStr
+from trajectory_cache import TrajectoryCache
+from agent_checkpoint import AgentCheckpoint
+from ollama_pool import close_async_pools
 
 # 加载环境变量
 load_dotenv()
 
-def configure_chrome_browser() -> Browser:
-    """配置Chrome浏览器实例"""
-    chrome_path = None
-    possible_paths = [
-        # Windows 路径
-        r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-        r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
-        # MacOS 路径
-        "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
-        # Linux 路径
-        "/usr/bin/google-chrome",
-        "/opt/google/chrome/chrome",
-    ]
-
-    # 检测有效路径
-    for path in possible_paths:
-        if Path(path).exists():
-            chrome_path = path
-            break
-
-    if not chrome_path:
-        raise FileNotFoundError(
-            "未找到Google Chrome安装路径，请确认：\n"
-            "1. 已安装最新版Chrome\n"
-            "2. 如果使用自定义安装路径，请手动指定"
-        )
-
-    return Browser(
-        config=BrowserConfig(
-            chrome_instance_path=chrome_path,  # 关键配置
-        )
-    )
-
 async def main():
     # 初始化浏览器
     chrome_browser = configure_chrome_browser()
+    # 相同任务之前成功过时直接重放当时的动作，页面对不上时再交给模型
+    trajectories = TrajectoryCache()
+    # 每个成功的步骤之后保存检查点，中途失败后重新运行本脚本会从最后一个成功的步骤继续
+    checkpoints = AgentCheckpoint()
 
     try:
         # 创建智能体，使用本地 Ollama 模型
@@ -67,13 +41,22 @@ async def main():
             max_failures=3,
             max_actions_per_step=2
         )
-
-        # 执行任务
-        result = await agent.run()
+        trajectories.attach(agent)
+        checkpoints.attach(agent)
+
+        # 执行任务：有上次中断留下的检查点时恢复后继续，否则按轨迹缓存重放
+        if checkpoints.exists(agent.task):
+            result = await checkpoints.resume(agent)
+        else:
+            result = await trajectories.run(agent)
         print(f"\n执行结果：{result}")
 
     finally:
         await chrome_browser.close()
+        # 关闭包装器共享的 Ollama 连接，避免事件循环结束时出现未关闭连接的警告
+        await close_async_pools()
+        print(trajectories.summary())
+        print(checkpoints.summary())
 
 if __name__ == "__main__":
     asyncio.run(main())
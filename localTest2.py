@@ -1,36 +1,16 @@
 import os
 import asyncio
-from pathlib import Path
-from browser_use import Agent, Browser, BrowserConfig
+from browser_use import Agent
+from browser_launcher import configure_chrome_browser
 from langchain_ollama import ChatOllama
 from deepseek_wrapper import DeepseekToolWrapper
-
-def configure_chrome_browser() -> Browser:
-    """配置 Chrome 浏览器实例"""
-    chrome_path = None
-    possible_paths = [
-        r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-        r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
-        "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
-        "/usr/bin/google-chrome",
-        "/opt/google/chrome/chrome",
-    ]
-
-    for path in possible_paths:
-        if Path(path).exists():
-            chrome_path = path
-            break
-
-    if not chrome_path:
-        raise FileNotFoundError(
-            "未找到Google Chrome，请确认已安装最新版本，并修改路径"
-        )
-
-    return Browser(
-        config=BrowserConfig(
-            chrome_instance_path=chrome_path,  
-        )
-    )
+from llm_cache import SQLiteLLMCache
+from instrumentation import MetricsCallback, RunMetrics, instrument_agent
+from page_guard import guard_page_changes
+from agent_checkpoint import AgentCheckpoint
+from backends import create_llm
+from reasoning_budget import ReasoningBudget
+from ollama_pool import close_async_pools
 
 #根据需要选择使用qwen还是deepseek
 '''
@@ -40,7 +20,30 @@ llm1=ChatOllama(
             )
 '''
 
-llm2=DeepseekToolWrapper()
+# 相同任务重复运行时，相同提示词直接读取缓存的响应
+llm_cache = SQLiteLLMCache(os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"))
+
+# 记录每步各阶段耗时、token 数和解析失败，写入 METRICS_PATH，运行结束打印 p50/p95 汇总
+metrics = RunMetrics(os.getenv("METRICS_PATH", "metrics.jsonl"))
+
+# 提示词超过 token 预算时折叠早先的步骤，并在后台生成滚动摘要，留出余量给 32000 的上下文窗口
+llm2=DeepseekToolWrapper(
+    cache=llm_cache,
+    callbacks=[MetricsCallback(metrics)],
+    max_prompt_tokens=int(os.getenv("MAX_PROMPT_TOKENS", "24000")),
+)
+
+# 设置 REASONING_BUDGET（每步推理 token 上限）后，简单步骤交给不推理的 FAST_MODEL（默认 qwen2:7b），
+# R1 推理超出上限时停止生成并改由它回答
+if os.getenv("REASONING_BUDGET"):
+    llm2 = ReasoningBudget(
+        reasoner=llm2,
+        fast=create_llm("ollama", model=os.getenv("FAST_MODEL"), cache=llm_cache, callbacks=[MetricsCallback(metrics)]),
+        max_reasoning_tokens=int(os.getenv("REASONING_BUDGET")),
+    )
+
+# 每个成功的步骤之后保存 Agent 历史、页面地址、cookies 和模型的滚动摘要，失败后重新运行从断点继续
+checkpoints = AgentCheckpoint(os.getenv("AGENT_CHECKPOINT_DIR"))
 
 '''
 llm3=ChatOllama(
@@ -73,16 +76,28 @@ async def main():
             browser=browser,
             use_vision=False,
             max_failures=3,
-            max_actions_per_step=2
+            max_actions_per_step=4
         )
+        # 一步中的多个动作在页面跳转后不再继续执行
+        guard_page_changes(agent)
+        instrument_agent(agent, metrics)
+        checkpoints.attach(agent)
 
-        # 运行任务
-        result = await agent.run()
+        # 运行任务，上次中途失败时从最后一个成功的步骤继续
+        result = await checkpoints.resume(agent)
         print("\n执行结果：", result)
         
     finally:
         # 5. 确保关闭浏览器
         await browser.close()
+        # 关闭包装器共享的 Ollama 连接，避免事件循环结束时出现未关闭连接的警告
+        await close_async_pools()
+        print(f"LLM 缓存统计：{llm_cache.stats()}")
+        print(metrics.summary())
+        print(checkpoints.summary())
+        if isinstance(llm2, ReasoningBudget):
+            print(f"推理预算统计：{llm2.stats()}")
+        metrics.write_prometheus(os.getenv("METRICS_PROM_PATH", "metrics.prom"))
 
 if __name__ == "__main__":
     asyncio.run(main())
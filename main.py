@@ -1,8 +1,9 @@
 from langchain.agents import AgentExecutor
 from langchain.tools import BaseTool
-from langchain.prompts import ChatPromptTemplate
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.agents import create_openai_tools_agent
 from deepseek_wrapper import DeepseekToolWrapper
+from expression_engine import evaluate
 from typing import Optional, Type
 
 # 定义一些示例工具
@@ -11,27 +12,26 @@ class CalculatorTool(BaseTool):
     description: str = "用于执行基本数学计算"
     
     def _run(self, query: str) -> str:
+        # 模型给出的表达式只按白名单语法求值，不能访问 Python 内置函数和对象
         try:
-            return str(eval(query))
-        except:
+            return str(evaluate(query))
+        except (ArithmeticError, ValueError):
             return "计算错误"
             
     async def _arun(self, query: str) -> str:
         return self._run(query)
 
-def main():
-    # 初始化包装后的模型
-    model = DeepseekToolWrapper()
-    
+def create_agent_executor(model, verbose: bool = True) -> AgentExecutor:
+    """用给定模型创建计算器 agent 执行器"""
     # 定义工具列表
     tools = [CalculatorTool()]
     
-    # 创建提示模板
+    # 创建提示模板，工具调用和结果以消息形式放入 agent_scratchpad
     prompt = ChatPromptTemplate.from_messages([
         ("system", "你是一个有帮助的助手，可以使用提供的工具来完成任务。"),
         ("human", "{input}"),
         ("assistant", "让我来帮你完成这个任务。"),
-        ("human", "{agent_scratchpad}"),
+        MessagesPlaceholder("agent_scratchpad"),
     ])
     
     # 创建agent
@@ -42,11 +42,16 @@ def main():
     )
     
     # 创建执行器
-    agent_executor = AgentExecutor(
+    return AgentExecutor(
         agent=agent,
         tools=tools,
-        verbose=True
+        verbose=verbose
     )
+
+def main():
+    # 初始化包装后的模型
+    model = DeepseekToolWrapper()
+    agent_executor = create_agent_executor(model)
     
     # 测试
     result = agent_executor.invoke(
@@ -0,0 +1,111 @@
+import asyncio
+import random
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+from ollama import AsyncClient, Client, ResponseError
+
+# 这些状态码表示服务端暂时忙或网关异常，稍后重试通常能成功；Ollama 队列满时返回 503
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """连接失败、超时和临时性的服务端错误可以重试，其余错误直接抛出"""
+    if isinstance(error, ResponseError):
+        return error.status_code in RETRY_STATUS
+    # ollama 把非流式请求的 httpx.ConnectError 转成了内置 ConnectionError
+    return isinstance(error, (httpx.TransportError, ConnectionError))
+
+
+def backoff_delay(attempt: int, base: float, cap: float = 8.0) -> float:
+    """指数退避加随机抖动，避免多个调用方同时重试"""
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def _client_options(max_in_flight: int, connect_timeout: float, request_timeout: float) -> dict:
+    # request_timeout 是读取两块输出之间的最长等待，流式生成时不会限制总时长
+    return {
+        "timeout": httpx.Timeout(request_timeout, connect=connect_timeout),
+        "limits": httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight),
+    }
+
+
+class AsyncOllamaPool:
+    """同一事件循环内访问同一 Ollama 服务的共享异步客户端，并限制同时进行的请求数"""
+
+    def __init__(self, host: Optional[str], max_in_flight: int, connect_timeout: float, request_timeout: float):
+        self.client = AsyncClient(host=host, **_client_options(max_in_flight, connect_timeout, request_timeout))
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[AsyncClient]:
+        async with self._semaphore:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                yield self.client
+            finally:
+                self.in_flight -= 1
+
+    async def close(self):
+        await self.client.close()
+
+
+class OllamaPool:
+    """同步版本，供多线程调用方共享一个客户端"""
+
+    def __init__(self, host: Optional[str], max_in_flight: int, connect_timeout: float, request_timeout: float):
+        self.client = Client(host=host, **_client_options(max_in_flight, connect_timeout, request_timeout))
+        self.max_in_flight = max_in_flight
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+
+    @contextmanager
+    def slot(self) -> Iterator[Client]:
+        with self._semaphore:
+            yield self.client
+
+    def close(self):
+        self.client.close()
+
+
+# httpx 异步连接和 asyncio.Semaphore 都绑定在事件循环上，因此按事件循环分别保存，
+# 事件循环被回收后对应的连接池随之释放
+_async_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, AsyncOllamaPool]]" = (
+    weakref.WeakKeyDictionary()
+)
+_pools: Dict[tuple, OllamaPool] = {}
+_pools_lock = threading.Lock()
+
+
+def async_pool(
+    host: Optional[str], max_in_flight: int = 4, connect_timeout: float = 5.0, request_timeout: float = 120.0
+) -> AsyncOllamaPool:
+    """返回当前事件循环中与该配置对应的共享连接池，配置相同的包装器实例共用同一个"""
+    pools = _async_pools.setdefault(asyncio.get_running_loop(), {})
+    key = (host, max_in_flight, connect_timeout, request_timeout)
+    if key not in pools:
+        pools[key] = AsyncOllamaPool(host, max_in_flight, connect_timeout, request_timeout)
+    return pools[key]
+
+
+def sync_pool(
+    host: Optional[str], max_in_flight: int = 4, connect_timeout: float = 5.0, request_timeout: float = 120.0
+) -> OllamaPool:
+    """返回进程内与该配置对应的共享同步连接池"""
+    key = (host, max_in_flight, connect_timeout, request_timeout)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = OllamaPool(host, max_in_flight, connect_timeout, request_timeout)
+        return _pools[key]
+
+
+async def close_async_pools():
+    """关闭当前事件循环中的所有共享连接，在 asyncio.run 的主协程结束前调用"""
+    for pool in _async_pools.pop(asyncio.get_running_loop(), {}).values():
+        await pool.close()
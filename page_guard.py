@@ -0,0 +1,69 @@
+import asyncio
+import copy
+
+from browser_use.agent.views import ActionResult
+
+
+async def _page_key(browser_context) -> tuple:
+    """当前标签页的地址和标签页数量，任一变化都说明模型规划时看到的页面已不存在"""
+    session = await browser_context.get_session()
+    page = await browser_context.get_current_page()
+    return page.url, len(session.context.pages)
+
+
+def guard_page_changes(agent):
+    """一步中的多个动作按顺序执行，页面变化后放弃剩余的按编号操作元素的动作
+
+    browser-use 自带的检查只在出现新元素时中止；这里同时检查地址和标签页数量，
+    跳转或打开新标签页后，模型按旧页面给出的元素编号不再可靠。
+    需要在 instrumentation.instrument_agent 之前调用。
+    """
+    # 与 instrument_agent 相同，复制共享的默认 controller 后再替换
+    controller = agent.controller = copy.copy(agent.controller)
+
+    async def guarded_multi_act(
+        actions,
+        browser_context,
+        check_break_if_paused,
+        check_for_new_elements: bool = True,
+        page_extraction_llm=None,
+        sensitive_data=None,
+        available_file_paths=None,
+    ):
+        results = []
+        session = await browser_context.get_session()
+        cached_state = session.cached_state
+        cached_path_hashes = set(e.hash.branch_path_hash for e in cached_state.selector_map.values())
+        # 模型规划时看到的页面
+        planned_on = (cached_state.url, len(cached_state.tabs))
+        check_break_if_paused()
+        await browser_context.remove_highlights()
+
+        for i, action in enumerate(actions):
+            check_break_if_paused()
+            if action.get_index() is not None and i != 0:
+                page = await _page_key(browser_context)
+                message = None
+                if page != planned_on:
+                    message = f"页面已变化（{page[0]}），剩余 {len(actions) - i} 个动作未执行，请按新页面重新规划"
+                elif check_for_new_elements:
+                    new_state = await browser_context.get_state()
+                    new_path_hashes = set(e.hash.branch_path_hash for e in new_state.selector_map.values())
+                    if not new_path_hashes.issubset(cached_path_hashes):
+                        message = f"第 {i} 个动作后页面出现了新元素，剩余 {len(actions) - i} 个动作未执行"
+                if message:
+                    results.append(ActionResult(extracted_content=message, include_in_memory=True))
+                    break
+
+            check_break_if_paused()
+            results.append(
+                await controller.act(action, browser_context, page_extraction_llm, sensitive_data, available_file_paths)
+            )
+            if results[-1].is_done or results[-1].error or i == len(actions) - 1:
+                break
+            await asyncio.sleep(browser_context.config.wait_between_actions)
+
+        return results
+
+    controller.multi_act = guarded_multi_act
+    return agent
@@ -0,0 +1,373 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, AsyncIterator, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable
+from pydantic import Field, PrivateAttr
+
+from action_parser import THINK_OPEN, ReasoningSplitter, strip_reasoning
+from history_window import estimate_tokens
+from llm_utils import (
+    TEXT_ONLY_MODELS, check_tool_calls, evict_oldest, json_tool_call, model_name, plain_messages, tool_call_required,
+    tool_name, tools_key,
+)
+
+# browser-use 在下一步的页面状态中写入上一步动作的错误
+ERROR_MARKERS = ("Action error",)
+
+
+def strip_reasoning_history(messages: List[BaseMessage]) -> Tuple[List[BaseMessage], int]:
+    """去掉历史中模型回复的 <think> 推理段和 reasoning_content，返回 (新的消息列表, 少发送的估算 token 数)
+
+    reasoning_content 不会被发送给模型（DeepSeek API 要求不要回传），去掉它不计入节省。
+    """
+    stripped, saved = [], 0
+    for message in messages:
+        if isinstance(message, AIMessage):
+            content = message.content
+            if isinstance(content, str) and THINK_OPEN in content:
+                text = strip_reasoning(content)
+                saved += estimate_tokens(content) - estimate_tokens(text)
+                message = message.model_copy(update={"content": text})
+            if "reasoning_content" in message.additional_kwargs:
+                additional_kwargs = {k: v for k, v in message.additional_kwargs.items() if k != "reasoning_content"}
+                message = message.model_copy(update={"additional_kwargs": additional_kwargs})
+        stripped.append(message)
+    return stripped, saved
+
+
+def is_simple_step(messages: List[BaseMessage]) -> bool:
+    """默认的简单步骤判断：上一步的动作没有出错、模型也没有把更早的一步评估为失败，
+    这一步多半只是执行计划中的下一个操作（点击搜索框、输入文字等），不需要重新推理
+    """
+    last = max((i for i, message in enumerate(messages) if isinstance(message, AIMessage)), default=None)
+    if last is None:
+        return False
+    for message in messages[last + 1:]:
+        if isinstance(message, (HumanMessage, ToolMessage)) and any(marker in str(message.content) for marker in ERROR_MARKERS):
+            return False
+    for call in messages[last].tool_calls:
+        state = call["args"].get("current_state") if isinstance(call["args"], dict) else None
+        evaluation = str((state or {}).get("evaluation_previous_goal", ""))
+        if evaluation.lower().startswith("failed"):
+            return False
+    return True
+
+
+class _ReasoningMeter:
+    """合并流式回复并统计其中的推理 token，超出预算时停止
+
+    推理 token 按流式块计数（Ollama 与 DeepSeek API 每块约一个 token）：reasoning_content、<think> 段，
+    以及正文开始前没有任何内容的块——langchain-openai 0.3.1 会丢弃 DeepSeek 流式块中的 reasoning_content，
+    推理阶段只能看到空块。回复的用量中带有 reasoning token 数时以它为准。
+    """
+
+    def __init__(self, budget: Optional[int]):
+        self.budget = budget
+        self.tokens = 0
+        self.exceeded = False
+        self.answering = False
+        self.message: Optional[AIMessageChunk] = None
+        self._splitter = ReasoningSplitter()
+
+    def feed(self, chunk: AIMessageChunk) -> bool:
+        """返回 False 表示推理超出预算，应当停止生成"""
+        self.message = chunk if self.message is None else self.message + chunk
+        content = chunk.content if isinstance(chunk.content, str) else ""
+        reasoning, text = self._splitter.feed(content)
+        reasoning = chunk.additional_kwargs.get("reasoning_content") or reasoning
+        if text.strip() or chunk.tool_call_chunks:
+            self.answering = True
+        elif reasoning or not (self.answering or chunk.usage_metadata or chunk.response_metadata):
+            self.tokens += 1
+            if self.budget is not None and self.tokens > self.budget:
+                self.exceeded = True
+                return False
+        return True
+
+    def consume(self, stream: Iterator[AIMessageChunk]):
+        try:
+            for chunk in stream:
+                if not self.feed(chunk):
+                    break
+        finally:
+            stream.close()
+
+    async def aconsume(self, stream: AsyncIterator[AIMessageChunk]):
+        try:
+            async for chunk in stream:
+                if not self.feed(chunk):
+                    break
+        finally:
+            # 提前停止时断开流，服务端随之停止生成
+            await stream.aclose()
+
+    def result(self) -> AIMessage:
+        chunk = self.message or AIMessageChunk(content="")
+        usage = chunk.usage_metadata or {}
+        reported = (usage.get("output_token_details") or {}).get("reasoning")
+        if reported and not self.exceeded:
+            self.tokens = reported
+        return AIMessage(
+            content=chunk.content,
+            additional_kwargs=chunk.additional_kwargs,
+            response_metadata=chunk.response_metadata,
+            tool_calls=chunk.tool_calls,
+            usage_metadata=chunk.usage_metadata,
+        )
+
+
+class ReasoningBudget(BaseChatModel):
+    """给推理模型（deepseek-reasoner、本地 R1 蒸馏模型）加上每步的推理预算
+
+    - 发送前去掉历史回复中的 <think> 推理段和 reasoning_content（strip_history）；
+    - route_simple 时，is_simple 判断为简单的步骤（默认见 is_simple_step）交给不推理的 fast 模型，
+      每个任务的第一步、出错之后和连续 max_fast_steps 个快速步骤之后仍由推理模型重新规划；
+      快速模型没有给出合法的工具调用时改由推理模型回答；
+    - 推理模型流式输出的推理超过 max_reasoning_tokens 时立即停止生成，这一步改由快速模型回答。
+      快速模型已经失败过的步骤不限制推理。
+
+    每个 Agent 使用单独的实例，stats() 汇总推理 token 和节省的 token，task_stats() 按任务给出每一步的记录。
+    """
+
+    reasoner: Any
+    fast: Any
+    max_reasoning_tokens: Optional[int] = Field(default=1024, description="每步推理 token 上限，None 表示不限制")
+    strip_history: bool = True
+    route_simple: bool = True
+    max_fast_steps: int = Field(default=3, description="连续交给快速模型的步数上限")
+    is_simple: Callable[[List[BaseMessage]], bool] = is_simple_step
+    # browser-use 按 model_name 选择调用方式，这里不能是 deepseek-reasoner，统一走工具调用
+    model_name: str = "reasoning-budget"
+
+    _bound: Dict[tuple, Runnable] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    # 对话（按第一条用户消息区分）-> 连续快速步骤数，尚未调用过推理模型的对话不在其中
+    _streaks: Dict[str, int] = PrivateAttr(default_factory=dict)
+    # 对话 -> 每一步的记录（由哪个模型回答、推理 token 数、是否被推理上限截断、去掉的历史推理 token）
+    _steps: Dict[str, List[Dict[str, Any]]] = PrivateAttr(default_factory=dict)
+    _stats: Dict[str, int] = PrivateAttr(default_factory=lambda: dict.fromkeys((
+        "reasoner_calls", "fast_calls", "routed_steps", "fast_failures", "escalations", "budget_exceeded",
+        "reasoning_tokens", "capped_reasoning_tokens", "completed_reasoning_tokens", "completed_reasoner_calls",
+        "history_tokens_stripped",
+    ), 0))
+    _blocking_pool: ThreadPoolExecutor = PrivateAttr(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=4, thread_name_prefix="reasoning-budget")
+    )
+
+    @property
+    def _llm_type(self) -> str:
+        return "reasoning-budget"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "reasoner": model_name(self.reasoner),
+            "fast": model_name(self.fast),
+            "max_reasoning_tokens": self.max_reasoning_tokens,
+            "strip_history": self.strip_history,
+            "route_simple": self.route_simple,
+        }
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[Any] = None, **kwargs: Any) -> Runnable:
+        return self.bind(tools=list(tools), tool_choice=tool_choice, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """调用次数、推理 token 和节省的 token
+
+        routed_tokens_saved 按推理模型完整推理一步的平均 token 数，估算直接交给快速模型的 routed_steps 步少生成的推理，
+        history_tokens_stripped 为去掉历史推理段后少发送的提示词 token（每次请求分别计入）。
+        推理上限省下的是被截断后模型本来还会生成的推理，进程内无法得知，不计入 tokens_saved；
+        capped_reasoning_tokens 为被截断的步骤在截断前已生成的推理，需要与不设上限的运行逐步对比
+        （task_stats 的 step_log，见 bench_reasoning.py）才能得到截断节省的 token。
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        completed = stats.pop("completed_reasoner_calls")
+        average = stats.pop("completed_reasoning_tokens") / completed if completed else 0
+        stats["routed_tokens_saved"] = round(average * stats["routed_steps"])
+        stats["tokens_saved"] = stats["routed_tokens_saved"] + stats["history_tokens_stripped"]
+        return stats
+
+    def task_stats(self) -> Dict[str, Dict[str, Any]]:
+        """按任务（第一条用户消息）汇总每一步由哪个模型回答、推理 token 和被截断的步骤，step_log 为逐步记录"""
+        with self._lock:
+            steps = {task: list(log) for task, log in self._steps.items()}
+        return {
+            task: {
+                "steps": len(log),
+                "routed_steps": sum(1 for step in log if step["model"] == "fast"),
+                "capped_steps": sum(1 for step in log if step["capped"]),
+                "reasoning_tokens": sum(step["reasoning_tokens"] for step in log),
+                "capped_reasoning_tokens": sum(step["reasoning_tokens"] for step in log if step["capped"]),
+                "history_tokens_stripped": sum(step["history_tokens_stripped"] for step in log),
+                "step_log": log,
+            }
+            for task, log in steps.items()
+        }
+
+    def export_state(self) -> Dict[str, Any]:
+        """两个模型各自需要保存的状态（如 DeepseekToolWrapper 的历史窗口），供 agent_checkpoint.py 使用"""
+        return {
+            name: model.export_state()
+            for name, model in (("reasoner", self.reasoner), ("fast", self.fast))
+            if hasattr(model, "export_state")
+        }
+
+    def load_state(self, state: Dict[str, Any]):
+        for name, model in (("reasoner", self.reasoner), ("fast", self.fast)):
+            if state.get(name) and hasattr(model, "load_state"):
+                model.load_state(state[name])
+
+    def _count(self, **values: int):
+        with self._lock:
+            for name, value in values.items():
+                self._stats[name] += value
+
+    def _log_step(self, task: str, model: str, reasoning_tokens: int, capped: bool, history_tokens_stripped: int):
+        with self._lock:
+            log = self._steps.get(task)
+            if log is None:
+                evict_oldest(self._steps, 64)
+                log = self._steps[task] = []
+            log.append({
+                "model": model,
+                "reasoning_tokens": reasoning_tokens,
+                "capped": capped,
+                "history_tokens_stripped": history_tokens_stripped,
+            })
+
+    def _runnable(self, model: Any, tools: List[Any], tool_choice: Optional[Any]) -> Runnable:
+        # 按模型角色和工具内容缓存，browser-use 每步传入的新工具对象也能命中
+        key = ("fast" if model is self.fast else "reasoner", tools_key(tools), str(tool_choice))
+        with self._lock:
+            bound = self._bound.get(key)
+            if bound is None:
+                # 两个模型各自最多保留 8 组工具的绑定
+                evict_oldest(self._bound, 16)
+                bound = self._bound[key] = model.bind_tools(tools, tool_choice=tool_choice)
+        return bound
+
+    async def _call_model(
+        self,
+        model: Any,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]],
+        tools: Optional[List[Any]],
+        tool_choice: Optional[Any],
+        budget: Optional[int],
+        blocking: bool,
+        **kwargs: Any,
+    ) -> Tuple[AIMessage, _ReasoningMeter]:
+        """流式调用一个模型，返回合并后的回复和推理计数"""
+        text_only = bool(tools) and model_name(model) in TEXT_ONLY_MODELS
+        runnable = self._runnable(model, tools, tool_choice) if tools and not text_only else model
+        if text_only:
+            if len(tools) != 1:
+                raise ValueError(f"{model_name(model)} 不支持工具调用，只能按文本回复单个结构化输出")
+            messages = plain_messages(messages)
+        meter = _ReasoningMeter(budget)
+        if blocking:
+            stream = runnable.stream(messages, stop=stop, **kwargs)
+            await asyncio.get_running_loop().run_in_executor(self._blocking_pool, meter.consume, stream)
+        else:
+            await meter.aconsume(runnable.astream(messages, stop=stop, **kwargs))
+        message = meter.result()
+        if text_only and not meter.exceeded:
+            call = json_tool_call(message.content, tool_name(tools[0]))
+            message = AIMessage(content=message.content, tool_calls=[call] if call else [], usage_metadata=message.usage_metadata)
+        return message, meter
+
+    async def _fast(
+        self, call: Callable[..., Any], check: Callable[[AIMessage], None], raise_errors: bool
+    ) -> Optional[AIMessage]:
+        """由快速模型回答，回复不合法时返回 None（raise_errors 时抛出）"""
+        try:
+            message, meter = await call(self.fast, budget=None)
+            check(message)
+        except Exception:
+            self._count(fast_failures=1)
+            if raise_errors:
+                raise
+            return None
+        self._count(fast_calls=1, reasoning_tokens=meter.tokens)
+        return message
+
+    async def _respond(
+        self, messages: List[BaseMessage], stop: Optional[List[str]], blocking: bool, **kwargs: Any
+    ) -> ChatResult:
+        tools = kwargs.pop("tools", None)
+        tool_choice = kwargs.pop("tool_choice", None)
+        structured = kwargs.pop("ls_structured_output_format", None) is not None
+        # 只有强制调用工具时，不含工具调用的回复才算不合法
+        check = functools.partial(check_tool_calls, tools=tools, required=tool_call_required(tool_choice, structured))
+        saved = 0
+        if self.strip_history:
+            messages, saved = strip_reasoning_history(messages)
+            self._count(history_tokens_stripped=saved)
+
+        call = functools.partial(
+            self._call_model, messages=messages, stop=stop, tools=tools, tool_choice=tool_choice, blocking=blocking, **kwargs
+        )
+        key = str(next((message.content for message in messages if isinstance(message, HumanMessage)), ""))
+        with self._lock:
+            streak = self._streaks.get(key)
+        tried_fast = False
+        if self.route_simple and streak is not None and streak < self.max_fast_steps and self.is_simple(messages):
+            tried_fast = True
+            message = await self._fast(call, check, raise_errors=False)
+            if message is not None:
+                self._count(routed_steps=1)
+                self._log_step(key, "fast", 0, False, saved)
+                with self._lock:
+                    self._streaks[key] = streak + 1
+                return ChatResult(generations=[ChatGeneration(message=message)])
+            self._count(escalations=1)
+
+        message, meter = await call(self.reasoner, budget=None if tried_fast else self.max_reasoning_tokens)
+        self._count(reasoner_calls=1, reasoning_tokens=meter.tokens)
+        with self._lock:
+            self._streaks.pop(key, None)
+            while len(self._streaks) >= 64:
+                self._streaks.pop(next(iter(self._streaks)))
+            self._streaks[key] = 0
+        if meter.exceeded:
+            self._count(budget_exceeded=1, capped_reasoning_tokens=meter.tokens)
+            message = await self._fast(call, check, raise_errors=True)
+        else:
+            self._count(completed_reasoner_calls=1, completed_reasoning_tokens=meter.tokens)
+        self._log_step(key, "reasoner", meter.tokens, meter.exceeded, saved)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await self._respond(messages, stop, blocking=False, **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # 调用方可能已在事件循环中，在单独线程的事件循环中运行
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self._respond(messages, stop, blocking=True, **kwargs)).result()
+
+
+def create_reasoning_budget(reasoner: str, fast: str, fast_model: Optional[str] = None, **kwargs: Any) -> ReasoningBudget:
+    """按 backends.py 中的名称创建推理模型和快速模型，kwargs 传给 ReasoningBudget"""
+    from backends import create_llm
+
+    return ReasoningBudget(reasoner=create_llm(reasoner), fast=create_llm(fast, model=fast_model), **kwargs)
@@ -0,0 +1,410 @@
+import argparse
+import asyncio
+import copy
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from browser_use import Agent, Browser, BrowserConfig
+from browser_use.agent.views import ActionResult
+from browser_use.browser.views import BrowserState, TabInfo
+
+from backends import BACKENDS, create_llm
+from batch_runner import DEFAULT_AGENT_OPTIONS
+
+# 录制文件为 JSONL，按发生顺序追加：
+#   {"type": "meta", "task", "backend", "model"}
+#   {"type": "llm", "path", "request", "status", "content_type", "body"}   模型请求与原始响应
+#   {"type": "state", "state": {...}}                                    每步的页面快照
+#   {"type": "actions", "results": [...]}                                每步动作的执行结果
+#   {"type": "result", "final_result", "is_done", "steps"}
+
+# 每次运行都会变化、与提示词逻辑无关的内容，比较请求时忽略
+_VOLATILE = [
+    re.compile(r"Current date and time: \d{4}-\d{2}-\d{2} \d{2}:\d{2}"),
+    re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"),
+    re.compile(r"call_[0-9a-f]{24}"),
+    re.compile(r"127\.0\.0\.1:\d+"),
+]
+
+
+def normalize_request(body: Any) -> str:
+    """请求体规范化为字符串，去掉时间、随机 id 和本地端口"""
+    text = json.dumps(body, ensure_ascii=False, sort_keys=True)
+    for pattern in _VOLATILE:
+        text = pattern.sub("", text)
+    return text
+
+
+class Cassette:
+    """一次运行的录制内容，录制时逐条追加写入，回放时整体读入内存"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        cassette = cls(path)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    cassette.entries[entry["type"]].append(entry)
+        return cassette
+
+    def append(self, entry_type: str, **fields: Any):
+        entry = {"type": entry_type, **fields}
+        with self._lock:
+            self.entries[entry_type].append(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        return self.entries["meta"][0] if self.entries["meta"] else {}
+
+
+def _quiet_server(handler) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    # 客户端提前断开（包装器扫描到动作后取消生成）属于预期情况
+    server.handle_error = lambda request, client_address: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class RecordingProxy:
+    """转发到真实模型服务的本地代理，同时把每个 POST 请求和原始响应写入录制文件
+
+    Ollama 的流式响应逐行转发，客户端提前断开时只录制已收到的部分；
+    Authorization 等请求头只转发、不录制。
+    """
+
+    def __init__(self, upstream: str, cassette: Cassette):
+        self.upstream = upstream.rstrip("/")
+        self.cassette = cassette
+        self.server = _quiet_server(self._make_handler())
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._forward(None)
+
+            def do_POST(self):
+                self._forward(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+            def _forward(self, data: Optional[bytes]):
+                headers = {
+                    key: value for key, value in self.headers.items()
+                    if key.lower() in ("content-type", "accept", "authorization", "user-agent")
+                }
+                request = urllib.request.Request(
+                    proxy.upstream + self.path, data=data, headers=headers, method=self.command
+                )
+                try:
+                    response = urllib.request.urlopen(request)
+                except urllib.error.HTTPError as e:
+                    response = e
+                content_type = response.headers.get("Content-Type", "application/json")
+                streaming = "ndjson" in content_type or "event-stream" in content_type
+
+                self.send_response(response.status)
+                self.send_header("Content-Type", content_type)
+                received = []
+                try:
+                    if streaming:
+                        self.send_header("Transfer-Encoding", "chunked")
+                        self.end_headers()
+                        for line in iter(response.readline, b""):
+                            received.append(line)
+                            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                            self.wfile.flush()
+                        self.wfile.write(b"0\r\n\r\n")
+                    else:
+                        received.append(response.read())
+                        self.send_header("Content-Length", str(len(received[0])))
+                        self.end_headers()
+                        self.wfile.write(received[0])
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                finally:
+                    response.close()
+                    if data is not None:
+                        proxy.cassette.append(
+                            "llm",
+                            path=self.path,
+                            request=json.loads(data or b"{}"),
+                            status=response.status,
+                            content_type=content_type,
+                            body=b"".join(received).decode("utf-8"),
+                        )
+
+        return Handler
+
+
+class ReplayServer:
+    """按顺序回放录制的模型响应，不访问网络，也不模拟生成延迟
+
+    同一路径的请求依次取下一条录制；请求体与录制时不同（例如改动了提示词）时仍照常回放，
+    并记入 mismatches，便于回归检查提示词改动的影响。
+    """
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self.served: Dict[str, int] = defaultdict(int)
+        self.mismatches: List[Dict[str, Any]] = []
+        self._by_path: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for entry in cassette.entries["llm"]:
+            self._by_path[entry["path"]].append(entry)
+        self._lock = threading.Lock()
+        self.server = _quiet_server(self._make_handler())
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _next(self, path: str, body: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            recorded = self._by_path.get(path, [])
+            index = self.served[path]
+            if index >= len(recorded):
+                return None
+            self.served[path] += 1
+            entry = recorded[index]
+            if normalize_request(entry["request"]) != normalize_request(body):
+                self.mismatches.append({"path": path, "index": index})
+        return entry
+
+    def _make_handler(self):
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, content_type: str, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send(200, "application/json", b"{}")
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                entry = replay._next(self.path, body)
+                if entry is None:
+                    # 404 不在重试范围内，录制用完时立即报错
+                    error = json.dumps({"error": f"录制中 {self.path} 的响应已用完"}, ensure_ascii=False)
+                    self._send(404, "application/json", error.encode())
+                    return
+                self._send(entry["status"], entry["content_type"], entry["body"].encode("utf-8"))
+
+        return Handler
+
+
+def snapshot_state(state: BrowserState, include_attributes: List[str]) -> Dict[str, Any]:
+    """页面状态中提示词用到的部分：地址、标题、标签页和可交互元素文本"""
+    return {
+        "url": state.url,
+        "title": state.title,
+        "tabs": [tab.model_dump() for tab in state.tabs],
+        "elements": state.element_tree.clickable_elements_to_string(include_attributes=include_attributes),
+        "pixels_above": state.pixels_above,
+        "pixels_below": state.pixels_below,
+    }
+
+
+class RecordedElements:
+    """代替 DOM 树，只提供提示词需要的可交互元素文本"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def clickable_elements_to_string(self, include_attributes: Optional[List[str]] = None) -> str:
+        return self.text
+
+
+def restore_state(snapshot: Dict[str, Any]) -> BrowserState:
+    """由录制的快照重建 BrowserState，元素不可点击，只用于生成提示词"""
+    return BrowserState(
+        element_tree=RecordedElements(snapshot["elements"]),
+        selector_map={},
+        url=snapshot["url"],
+        title=snapshot["title"],
+        tabs=[TabInfo(**tab) for tab in snapshot["tabs"]],
+        pixels_above=snapshot.get("pixels_above", 0),
+        pixels_below=snapshot.get("pixels_below", 0),
+    )
+
+
+class ReplayBrowserContext:
+    """按顺序返回录制的页面快照，代替真实浏览器上下文，不需要安装浏览器"""
+
+    session = None
+
+    def __init__(self, cassette: Cassette):
+        self.states = cassette.entries["state"]
+        self.served = 0
+
+    async def get_state(self, *args, **kwargs) -> BrowserState:
+        snapshot = self.states[min(self.served, len(self.states) - 1)]["state"]
+        self.served += 1
+        return restore_state(snapshot)
+
+    async def close(self):
+        pass
+
+
+def record_agent(agent, cassette: Cassette):
+    """包装 Agent 的页面状态提取和动作执行，把快照和执行结果写入录制文件"""
+    browser_context = agent.browser_context
+    # 与 instrumentation.instrument_agent 相同，复制共享的默认 controller 后再包装
+    controller = agent.controller = copy.copy(agent.controller)
+    get_state = browser_context.get_state
+    multi_act = controller.multi_act
+
+    async def recorded_get_state(*args, **kwargs):
+        state = await get_state(*args, **kwargs)
+        cassette.append("state", state=snapshot_state(state, agent.include_attributes))
+        return state
+
+    async def recorded_multi_act(*args, **kwargs):
+        results = await multi_act(*args, **kwargs)
+        cassette.append("actions", results=[result.model_dump() for result in results])
+        return results
+
+    browser_context.get_state = recorded_get_state
+    controller.multi_act = recorded_multi_act
+    return agent
+
+
+def replay_agent(agent, cassette: Cassette):
+    """动作不真正执行，按顺序返回录制的执行结果"""
+    controller = agent.controller = copy.copy(agent.controller)
+    recorded = cassette.entries["actions"]
+    served = [0]
+
+    async def replayed_multi_act(*args, **kwargs):
+        if served[0] >= len(recorded):
+            return [ActionResult(error="录制中没有更多的动作结果", include_in_memory=True)]
+        results = recorded[served[0]]["results"]
+        served[0] += 1
+        return [ActionResult(**result) for result in results]
+
+    controller.multi_act = replayed_multi_act
+    return agent
+
+
+def default_upstream(backend: str) -> str:
+    if backend == "deepseek-api":
+        return "https://api.deepseek.com/v1"
+    return os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+
+
+async def record(task: str, backend: str, cassette_path: str, model: Optional[str], upstream: str, max_steps: int, headless: bool):
+    """连接真实模型和浏览器运行一次任务，录制全部模型流量和页面快照"""
+    if os.path.exists(cassette_path):
+        os.remove(cassette_path)
+    cassette = Cassette(cassette_path)
+    cassette.append("meta", task=task, backend=backend, model=model)
+    proxy = RecordingProxy(upstream, cassette)
+    browser = Browser(config=BrowserConfig(headless=headless))
+    try:
+        llm = create_llm(backend, model=model, base_url=proxy.url)
+        agent = record_agent(Agent(task=task, llm=llm, browser=browser, **DEFAULT_AGENT_OPTIONS), cassette)
+        history = await agent.run(max_steps=max_steps)
+    finally:
+        await browser.close()
+        proxy.close()
+    cassette.append("result", final_result=history.final_result(), is_done=history.is_done(), steps=len(history.history))
+    print(f"已录制 {len(cassette.entries['llm'])} 次模型请求、{len(cassette.entries['state'])} 个页面快照到 {cassette_path}")
+
+
+async def replay(cassette_path: str, max_steps: int) -> Dict[str, Any]:
+    """离线回放录制，返回本次结果与录制结果的对比"""
+    cassette = Cassette.load(cassette_path)
+    meta = cassette.meta
+    server = ReplayServer(cassette)
+    start = time.perf_counter()
+    try:
+        llm = create_llm(meta["backend"], model=meta.get("model"), base_url=server.url)
+        agent = Agent(task=meta["task"], llm=llm, browser_context=ReplayBrowserContext(cassette), **DEFAULT_AGENT_OPTIONS)
+        history = await replay_agent(agent, cassette).run(max_steps=max_steps)
+    finally:
+        server.close()
+    recorded = cassette.entries["result"][-1] if cassette.entries["result"] else {}
+    return {
+        "seconds": round(time.perf_counter() - start, 3),
+        "steps": len(history.history),
+        "final_result": history.final_result(),
+        "recorded_steps": recorded.get("steps"),
+        "recorded_final_result": recorded.get("final_result"),
+        "matches_recording": history.final_result() == recorded.get("final_result"),
+        "requests_changed": len(server.mismatches),
+        "requests_served": sum(server.served.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="录制一次 Agent 运行的模型与页面流量，之后离线回放")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="连接真实模型和浏览器运行并录制")
+    rec.add_argument("--task", required=True)
+    rec.add_argument("--backend", default="ollama", choices=list(BACKENDS))
+    rec.add_argument("--model", help="覆盖后端的默认模型")
+    rec.add_argument("--upstream", help="真实模型服务地址，默认 OLLAMA_HOST 或 DeepSeek API")
+    rec.add_argument("--headless", action="store_true")
+    rep = sub.add_parser("replay", help="离线回放录制，检查结果是否与录制一致")
+    for p in (rec, rep):
+        p.add_argument("--cassette", default="recordings/run.jsonl")
+        p.add_argument("--max-steps", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        upstream = args.upstream or default_upstream(args.backend)
+        asyncio.run(record(args.task, args.backend, args.cassette, args.model, upstream, args.max_steps, args.headless))
+        return
+
+    report = asyncio.run(replay(args.cassette, args.max_steps))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if not report["matches_recording"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,13 @@
 import os
 import asyncio
 from dotenv import load_dotenv
-from pathlib import Path
 from typing import Optional
 # 新增导入项
 from browser_use.agent.views import ActionResult
 from langchain_openai import ChatOpenAI
 from pydantic import SecretStr
-from browser_use import Agent, Browser, BrowserConfig
-from langchain_huggingface import HuggingFaceHub
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
+from browser_use import Agent
+from browser_launcher import configure_edge_browser
 
 # ---------------------------
 # 第一部分：环境配置
@@ -26,36 +23,7 @@ if not DEEPSEEK_API_KEY:
 # ---------------------------
 # 第二部分：浏览器配置
 # ---------------------------
-def configure_edge_browser() -> Browser:
-    """配置Edge浏览器实例"""
-    edge_path = None
-
-    # 自动检测常见安装路径（Windows）
-    possible_paths = [
-        # Windows 默认安装路径
-        r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe",
-        r"C:\Program Files\Microsoft\Edge\Application\msedge.exe",
-        # MacOS 路径（如有需要）
-        # "/Applications/Microsoft Edge.app/Contents/MacOS/Microsoft Edge",
-    ]
-
-    # 寻找存在的Edge可执行路径
-    for path in possible_paths:
-        if Path(path).exists():
-            edge_path = path
-            break
-
-    if not edge_path:
-        raise FileNotFoundError("未找到Microsoft Edge安装路径")
-
-    return Browser(
-        config=BrowserConfig(
-            chrome_instance_path=edge_path,  # 关键配置：指定Edge路径
-            headless=False,  # 显示浏览器界面
-            #slow_mo=500,     # 操作间隔500ms（方便观察）
-            timeout=30000,   # 超时30秒
-        )
-    )
+# Edge 的查找、缓存和预热浏览器连接见 browser_launcher.py
 
 # ---------------------------
 # 第三部分：登录凭证处理
@@ -97,7 +65,7 @@ async def handle_login(context, url: str) -> Optional[ActionResult]:
 # ---------------------------
 async def main():
     # 初始化配置好的Edge浏览器
-    edge_browser = configure_edge_browser()
+    edge_browser = configure_edge_browser(headless=False)  # 显示浏览器界面
 
     try:
         # 创建主Agent
@@ -121,30 +89,42 @@ async def main():
     finally:
         await edge_browser.close()  # 确保关闭浏览器
 
-# 设置你的 HF token
-os.environ["HUGGINGFACE_API_TOKEN"] = "你的_HF_TOKEN"
-
-# 初始化模型
-llm = HuggingFaceHub(
-    repo_id="google/flan-t5-xxl",  # 选择一个支持的模型
-    model_kwargs={
-        "temperature": 0.7,
-        "max_length": 512
-    }
-)
+# ---------------------------
+# 第五部分：HuggingFace 示例
+# ---------------------------
+def run_huggingface_demo():
+    """HuggingFaceHub 问答链示例，相关依赖只在调用时导入"""
+    from langchain_huggingface import HuggingFaceHub
+    from langchain.chains import LLMChain
+    from langchain.prompts import PromptTemplate
+
+    # 设置你的 HF token
+    os.environ.setdefault("HUGGINGFACE_API_TOKEN", "你的_HF_TOKEN")
+
+    # 初始化模型
+    llm = HuggingFaceHub(
+        repo_id="google/flan-t5-xxl",  # 选择一个支持的模型
+        model_kwargs={
+            "temperature": 0.7,
+            "max_length": 512
+        }
+    )
 
-# 创建提示模板
-prompt = PromptTemplate(
-    input_variables=["question"],
-    template="请回答下面的问题: {question}"
-)
+    # 创建提示模板
+    prompt = PromptTemplate(
+        input_variables=["question"],
+        template="请回答下面的问题: {question}"
+    )
 
-# 创建链
-chain = LLMChain(llm=llm, prompt=prompt)
+    # 创建链
+    chain = LLMChain(llm=llm, prompt=prompt)
 
-# 使用
-response = chain.run("什么是人工智能？")
-print(response)
+    # 使用
+    response = chain.run("什么是人工智能？")
+    print(response)
 
 if __name__ == "__main__":
+    # 设置 RUN_HF_DEMO=1 时先运行 HuggingFace 示例
+    if os.getenv("RUN_HF_DEMO"):
+        run_huggingface_demo()
     asyncio.run(main())
\ No newline at end of file
@@ -1,51 +1,57 @@
 import os
 import asyncio
-from pathlib import Path
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from pydantic import SecretStr
-from browser_use import Agent, Browser, BrowserConfig
+from browser_use import Agent
+from browser_launcher import configure_chrome_browser
+from llm_cache import SQLiteLLMCache
+from instrumentation import MetricsCallback, RunMetrics, instrument_agent
+from page_guard import guard_page_changes
+from trajectory_cache import TrajectoryCache
+from backends import create_llm
+from llm_router import LLMRouter
+from reasoning_budget import ReasoningBudget
+from ollama_pool import close_async_pools
 
 # 加载环境变量
 load_dotenv()
 
-def configure_chrome_browser() -> Browser:
-    """配置Chrome浏览器实例"""
-    chrome_path = None
-    possible_paths = [
-        # Windows 路径
-        r"C:\Program Files\Google\Chrome\Application\chrome.exe",
-        r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
-        # MacOS 路径
-        "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
-        # Linux 路径
-        "/usr/bin/google-chrome",
-        "/opt/google/chrome/chrome",
-    ]
-
-    # 检测有效路径
-    for path in possible_paths:
-        if Path(path).exists():
-            chrome_path = path
-            break
-
-    if not chrome_path:
-        raise FileNotFoundError(
-            "未找到Google Chrome安装路径，请确认：\n"
-            "1. 已安装最新版Chrome\n"
-            "2. 如果使用自定义安装路径，请手动指定"
-        )
-
-    return Browser(
-        config=BrowserConfig(
-            chrome_instance_path=chrome_path,  # 关键配置
-            
-        )
-    )
-
 async def main():
     # 初始化浏览器
     chrome_browser = configure_chrome_browser()
+    # 相同任务重复运行时，相同提示词直接读取缓存的响应
+    llm_cache = SQLiteLLMCache(os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"))
+    # 记录每步各阶段耗时、token 数和解析失败，运行结束打印 p50/p95 汇总
+    metrics = RunMetrics(os.getenv("METRICS_PATH", "metrics.jsonl"))
+    # 相同任务之前成功过时直接重放当时的动作，页面对不上时再交给模型
+    trajectories = TrajectoryCache()
+    llm = ChatOpenAI(
+        base_url="https://api.deepseek.com/v1",
+        model="deepseek-reasoner",
+        openai_api_key=SecretStr(os.getenv("DEEPSEEK_API_KEY")),
+        temperature=0.2,
+        cache=llm_cache,
+        callbacks=[MetricsCallback(metrics)]
+    )
+    # 设置 REASONING_BUDGET（每步推理 token 上限）后，简单步骤交给不推理的 deepseek-chat，
+    # 推理超出上限时停止生成并改由 deepseek-chat 回答，历史中的推理内容不再发送
+    budget = None
+    if os.getenv("REASONING_BUDGET"):
+        llm = budget = ReasoningBudget(
+            reasoner=llm,
+            fast=create_llm("deepseek-api", model="deepseek-chat", cache=llm_cache, callbacks=[MetricsCallback(metrics)]),
+            max_reasoning_tokens=int(os.getenv("REASONING_BUDGET")),
+        )
+    # 设置 ROUTER_FALLBACKS（如 "wrapper,ollama"）后，DeepSeek API 出错、超时或变慢时改用本地模型
+    fallbacks = [name for name in os.getenv("ROUTER_FALLBACKS", "").split(",") if name]
+    if fallbacks:
+        llm = LLMRouter(
+            backends=[llm] + [create_llm(name, callbacks=[MetricsCallback(metrics)]) for name in fallbacks],
+            names=["deepseek-api"] + fallbacks,
+            timeout=float(os.getenv("ROUTER_TIMEOUT", "120")),
+            hedge=os.getenv("ROUTER_HEDGE") == "1"
+        )
 
     try:
         # 创建智能体
@@ -59,24 +65,33 @@ async def main():
                 "5. 播放最新发布的视频\n"
                 "6. 等待15秒后返回视频标题和播放时长"
             ),
-            llm=ChatOpenAI(
-                base_url="https://api.deepseek.com/v1",
-                model="deepseek-reasoner",
-                openai_api_key=SecretStr(os.getenv("DEEPSEEK_API_KEY")),
-                temperature=0.2
-            ),
+            llm=llm,
             browser=chrome_browser,
             use_vision=False,
             max_failures=3,
-            max_actions_per_step=2
+            max_actions_per_step=4
         )
+        trajectories.attach(agent)
+        # 一步中的多个动作在页面跳转后不再继续执行
+        guard_page_changes(agent)
+        instrument_agent(agent, metrics)
 
         # 执行任务
-        result = await agent.run()
+        result = await trajectories.run(agent)
         print(f"\n执行结果：{result}")
 
     finally:
         await chrome_browser.close()
+        # 后端为包装器时关闭其共享的 Ollama 连接
+        await close_async_pools()
+        print(f"LLM 缓存统计：{llm_cache.stats()}")
+        print(trajectories.summary())
+        if budget is not None:
+            print(f"推理预算统计：{budget.stats()}")
+        if isinstance(llm, LLMRouter):
+            print(f"模型路由统计：{llm.stats()}")
+        print(metrics.summary())
+        metrics.write_prometheus(os.getenv("METRICS_PROM_PATH", "metrics.prom"))
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -1,4 +1,5 @@
 import dotenv
+import numpy as np
 from langchain.tools import tool
 from langchain.tools.render import render_text_description
 from langchain_core.output_parsers import JsonOutputParser
@@ -6,6 +7,7 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_openai import ChatOpenAI
 from langchain_ollama import ChatOllama
+from tool_executor import ToolExecutor
 
 # 加载环境变量
 dotenv.load_dotenv()
@@ -36,20 +38,21 @@ def exponentiate(base: int, exponent: int) -> int:
 tools = [multiply, add, exponentiate]
 
 
+# 三个工具的数组版本，批量执行时同一层的同类调用合并为一次运算
+vectorized_tools = {
+    "multiply": lambda first, second: np.multiply(first, second),
+    "add": lambda first, second: np.add(first, second),
+    "exponentiate": lambda base, exponent: np.power(base, exponent),
+}
+
+# 嵌套调用编译成依赖图：互不依赖的子调用同时执行，相同的子调用只算一次
+executor = ToolExecutor(tools, vectorized=vectorized_tools)
+
+
 # 根据输入链式调用工具的函数
 def tool_chain(input):
-    # 将工具名称映射到工具函数
-    tool_map = {tool.name: tool for tool in tools}
-    # 根据输入名称选择工具
-    choose_tool = tool_map[input["name"]]
-    # 拷贝输入参数
-    arguments = input["arguments"].copy()
-    for key, value in arguments.items():
-        # 如果值是字典，递归调用tool_chain
-        if isinstance(value, dict):
-            arguments[key] = tool_chain(value)
-    # 使用参数调用选定的工具
-    return choose_tool.invoke(arguments)
+    # 参数中的字典是子调用，先得到它们的结果再调用外层工具
+    return executor.run(input)
 
 
 # 渲染工具的文本描述
@@ -0,0 +1,235 @@
+import asyncio
+import functools
+import json
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.tools import BaseTool
+
+
+# 向量化结果中需要逐个重新执行的位置
+_FALLBACK = object()
+
+
+@dataclass(frozen=True)
+class NodeRef:
+    """参数值来自图中另一个节点的结果"""
+
+    index: int
+
+
+@dataclass(frozen=True)
+class ToolCallNode:
+    name: str
+    arguments: Tuple[Tuple[str, Any], ...]
+    # 到叶子的最长距离，深度相同的节点互不依赖
+    depth: int
+
+
+class ToolCallGraph:
+    """把模型给出的嵌套 {"name", "arguments"} 调用编译成有向无环图
+
+    参数值是字典时视为子调用。相同的子调用（工具名和参数都相同）只保留一个节点，
+    节点按后序加入，子节点总在父节点之前。
+    """
+
+    def __init__(self):
+        self.nodes: List[ToolCallNode] = []
+        self._index: Dict[str, int] = {}
+
+    def add(self, call: Dict[str, Any]) -> NodeRef:
+        if not isinstance(call, dict) or "name" not in call:
+            raise ValueError(f"工具调用需要包含 name 和 arguments：{call!r}")
+        arguments, depth = [], 0
+        for key, value in (call.get("arguments") or {}).items():
+            if isinstance(value, dict):
+                value = self.add(value)
+                depth = max(depth, self.nodes[value.index].depth + 1)
+            arguments.append((key, value))
+
+        key = _call_key(call["name"], arguments)
+        index = self._index.get(key)
+        if index is None:
+            index = self._index[key] = len(self.nodes)
+            self.nodes.append(ToolCallNode(call["name"], tuple(arguments), depth))
+        return NodeRef(index)
+
+    def levels(self) -> List[List[int]]:
+        """按深度分层，同一层的节点可以同时执行"""
+        levels = defaultdict(list)
+        for index, node in enumerate(self.nodes):
+            levels[node.depth].append(index)
+        return [levels[depth] for depth in sorted(levels)]
+
+
+def _call_key(name: str, arguments: Iterable[Tuple[str, Any]]) -> str:
+    encoded = [[key, {"$ref": value.index} if isinstance(value, NodeRef) else value] for key, value in arguments]
+    return json.dumps([name, sorted(encoded, key=lambda item: item[0])], ensure_ascii=False, default=str)
+
+
+class ToolExecutor:
+    """按依赖关系执行嵌套工具调用
+
+    - 互不依赖的子调用在线程池中同时执行，依赖的结果就绪后立即开始父调用；
+    - 同一次调用中相同的子调用只执行一次，不同调用之间按 (工具名, 参数) 缓存结果；
+    - run_batch 一次处理多个调用，同一层中同一工具的调用在提供了 vectorized 实现时
+      合并为一次 NumPy 运算，其余逐个执行。
+
+    只适用于没有副作用、相同参数总是返回相同结果的工具。
+    """
+
+    def __init__(
+        self,
+        tools: List[BaseTool],
+        vectorized: Optional[Dict[str, Callable[..., np.ndarray]]] = None,
+        max_workers: int = 8,
+        cache_size: int = 1024,
+    ):
+        self.tools = {tool.name: tool for tool in tools}
+        self.vectorized = dict(vectorized or {})
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool-call")
+        self.stats = {"calls": 0, "cache_hits": 0, "deduplicated": 0, "vectorized_calls": 0, "vectorized_items": 0}
+
+    def compile(self, calls: Iterable[Dict[str, Any]]) -> Tuple[ToolCallGraph, List[NodeRef]]:
+        graph = ToolCallGraph()
+        roots, total = [], 0
+        for call in calls:
+            roots.append(graph.add(call))
+            total += _count_calls(call)
+        unknown = {node.name for node in graph.nodes} - self.tools.keys()
+        if unknown:
+            raise ValueError(f"未知的工具：{', '.join(sorted(unknown))}")
+        self.stats["deduplicated"] += total - len(graph.nodes)
+        return graph, roots
+
+    @staticmethod
+    def _resolve(node: ToolCallNode, results: Dict[int, Any]) -> Dict[str, Any]:
+        return {key: results[value.index] if isinstance(value, NodeRef) else value for key, value in node.arguments}
+
+    async def _call(self, name: str, arguments: Dict[str, Any]) -> Any:
+        key = _call_key(name, arguments.items())
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return self._cache[key]
+        self.stats["calls"] += 1
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._pool, functools.partial(self.tools[name].invoke, arguments))
+        self._cache[key] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    async def arun(self, call: Dict[str, Any]) -> Any:
+        """执行一个嵌套调用，每个节点在它依赖的节点完成后立即开始"""
+        graph, (root,) = self.compile([call])
+        tasks: Dict[int, asyncio.Task] = {}
+
+        async def run_node(index: int):
+            node = graph.nodes[index]
+            dependencies = [tasks[value.index] for _, value in node.arguments if isinstance(value, NodeRef)]
+            if dependencies:
+                await asyncio.gather(*dependencies)
+            results = {value.index: tasks[value.index].result() for _, value in node.arguments if isinstance(value, NodeRef)}
+            return await self._call(node.name, self._resolve(node, results))
+
+        # 子节点先于父节点创建
+        for index in range(len(graph.nodes)):
+            tasks[index] = asyncio.ensure_future(run_node(index))
+        try:
+            return await tasks[root.index]
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def arun_batch(self, calls: Iterable[Dict[str, Any]]) -> List[Any]:
+        """逐层执行一批调用，返回与输入顺序一致的结果"""
+        graph, roots = self.compile(calls)
+        results: Dict[int, Any] = {}
+        for level in graph.levels():
+            by_tool = defaultdict(list)
+            for index in level:
+                by_tool[graph.nodes[index].name].append(index)
+            pending = []
+            for name, indices in by_tool.items():
+                arguments = [self._resolve(graph.nodes[index], results) for index in indices]
+                values = self._vectorized(name, arguments) if name in self.vectorized and len(indices) > 1 else None
+                if values is None:
+                    pending.extend(zip(indices, arguments))
+                    continue
+                for index, args, value in zip(indices, arguments, values):
+                    if value is _FALLBACK:
+                        pending.append((index, args))
+                    else:
+                        results[index] = value
+            outputs = await asyncio.gather(*(self._call(graph.nodes[index].name, args) for index, args in pending))
+            results.update(zip((index for index, _ in pending), outputs))
+        return [results[root.index] for root in roots]
+
+    def _validate(self, name: str, arguments: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """按工具的参数模型校验并转换参数，与 tool.invoke 一致（如 int 参数拒绝 2.5、接受 "3"），不合法时返回 None"""
+        schema = self.tools[name].args_schema
+        if not isinstance(schema, type):
+            return arguments
+        try:
+            model = schema.model_validate(arguments) if hasattr(schema, "model_validate") else schema.parse_obj(arguments)
+        except ValueError:
+            return None
+        # 只取参数模型中的字段：工具会忽略 schema 之外的参数，这里也一样
+        fields = getattr(type(model), "model_fields", None) or type(model).__fields__
+        return {key: getattr(model, key) for key in fields}
+
+    def _vectorized(self, name: str, arguments: List[Dict[str, Any]]) -> Optional[List[Any]]:
+        """同一工具的多组参数合并为数组调用一次
+
+        参数先按工具的参数模型校验，不合法的位置为 _FALLBACK，逐个执行时由工具报出同样的错误；
+        参数不是数字或运算出错时返回 None，整组改为逐个执行；整数结果可能溢出的位置同样为 _FALLBACK。
+        """
+        keys = arguments[0].keys()
+        if any(item.keys() != keys for item in arguments):
+            return None
+        validated = [self._validate(name, item) for item in arguments]
+        rows = [index for index, item in enumerate(validated) if item is not None]
+        if len(rows) < 2:
+            return None
+        arrays = {key: np.asarray([validated[index][key] for index in rows]) for key in validated[rows[0]]}
+        if any(array.dtype.kind not in "iuf" for array in arrays.values()):
+            return None
+        function = self.vectorized[name]
+        try:
+            with np.errstate(all="ignore"):
+                result = np.asarray(function(**arrays))
+                # int64 溢出时不报错，用浮点结果检查量级
+                overflow = None
+                if result.dtype.kind in "iu":
+                    approx = function(**{key: array.astype(float) for key, array in arrays.items()})
+                    overflow = ~(np.abs(approx) < 2.0 ** 62)
+        except (ArithmeticError, ValueError):
+            # 如整数的负指数，交给工具自己处理
+            return None
+        values = [_FALLBACK] * len(arguments)
+        for index, value in zip(rows, result.tolist()):
+            values[index] = value
+        if overflow is not None and overflow.any():
+            for index in np.flatnonzero(overflow):
+                values[rows[index]] = _FALLBACK
+        self.stats["vectorized_calls"] += 1
+        self.stats["vectorized_items"] += len(rows) - (int(overflow.sum()) if overflow is not None else 0)
+        return values
+
+    def run(self, call: Dict[str, Any]) -> Any:
+        return asyncio.run(self.arun(call))
+
+    def run_batch(self, calls: Iterable[Dict[str, Any]]) -> List[Any]:
+        return asyncio.run(self.arun_batch(calls))
+
+
+def _count_calls(call: Any) -> int:
+    if not isinstance(call, dict):
+        return 0
+    return 1 + sum(_count_calls(value) for value in (call.get("arguments") or {}).values())
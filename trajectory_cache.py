@@ -0,0 +1,248 @@
+import copy
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from browser_use.agent.views import AgentBrain, AgentHistoryList
+from browser_use.dom.history_tree_processor.service import HistoryTreeProcessor
+from browser_use.dom.history_tree_processor.view import DOMHistoryElement
+
+# 与 browser_launcher 的路径缓存放在一起，跨运行保留
+CACHE_FILE = Path(os.getenv("TRAJECTORY_CACHE_FILE", Path.home() / ".cache" / "browser_trajectories.json"))
+
+
+def normalize_task(task: str) -> str:
+    """合并空白、忽略大小写，排版不同的同一任务得到相同的键"""
+    return " ".join(task.split()).casefold()
+
+
+def _same_page(a: str, b: str) -> bool:
+    return a.split("#", 1)[0].rstrip("/") == b.split("#", 1)[0].rstrip("/")
+
+
+def _element_record(element) -> Dict[str, Any]:
+    """只保留 HistoryTreeProcessor 匹配元素用到的字段和选择器，不保存坐标"""
+    history = HistoryTreeProcessor.convert_dom_element_to_history_element(element)
+    return {
+        "tag_name": history.tag_name,
+        "xpath": history.xpath,
+        "entire_parent_branch_path": history.entire_parent_branch_path,
+        "attributes": history.attributes,
+        "css_selector": history.css_selector,
+    }
+
+
+def _history_element(record: Dict[str, Any]) -> DOMHistoryElement:
+    return DOMHistoryElement(
+        tag_name=record["tag_name"],
+        xpath=record["xpath"],
+        highlight_index=None,
+        entire_parent_branch_path=record["entire_parent_branch_path"],
+        attributes=record["attributes"],
+        css_selector=record.get("css_selector"),
+    )
+
+
+class _ReplaySteps:
+    """把重放的动作按正常步骤写入 Agent 的消息和历史
+
+    browser-use 没有对应的公开接口，这里用到的私有方法和属性（0.1.x）集中在这个类中，
+    创建时检查它们是否存在；不存在时 supported 为 False，TrajectoryCache 不重放，整个任务交给模型。
+    """
+
+    MANAGER_METHODS = ("add_state_message", "_remove_last_state_message", "add_model_output")
+    AGENT_METHODS = ("_make_history_item",)
+    AGENT_ATTRIBUTES = ("_last_result", "n_steps", "use_vision")
+
+    def __init__(self, agent):
+        self.agent = agent
+        manager = getattr(agent, "message_manager", None)
+        self.supported = (
+            all(callable(getattr(manager, name, None)) for name in self.MANAGER_METHODS)
+            and all(callable(getattr(agent, name, None)) for name in self.AGENT_METHODS)
+            and all(hasattr(agent, name) for name in self.AGENT_ATTRIBUTES)
+        )
+
+    def add_output(self, state, output):
+        """与正常步骤相同地写入消息：上一步的动作结果（写入后去掉页面状态）、本步的模型输出"""
+        agent = self.agent
+        agent.message_manager.add_state_message(state, agent._last_result, None, agent.use_vision)
+        agent.message_manager._remove_last_state_message()
+        agent.message_manager.add_model_output(output)
+
+    def finish(self, output, state, result):
+        """记录动作结果，作为下一步的输入，并写入 Agent 历史"""
+        agent = self.agent
+        agent._last_result = [result]
+        agent._make_history_item(output, state, [result])
+        agent.n_steps += 1
+
+
+class TrajectoryCache:
+    """按 (规范化的任务, 起始地址) 缓存成功运行的动作序列，重复任务直接重放
+
+    attach 记录 Agent 实际执行成功的每个动作、执行前的页面地址和所操作元素的特征
+    （标签、xpath、父路径、属性），run 在有缓存时逐个重放：执行前确认地址相同，
+    并在当前 DOM 中按特征找到同一元素（编号变化时改用新编号），任何一步对不上或执行出错，
+    剩余部分交给模型继续。重放的动作按正常步骤写入 Agent 的消息和历史，模型接手时能看到。
+    任务成功后用本次实际执行的序列更新缓存。
+    """
+
+    def __init__(self, path: Optional[str] = None, replay_done: bool = False):
+        self.path = Path(path) if path else CACHE_FILE
+        # 默认不重放最后的 done：答案通常从页面读取（如最新视频的标题），由模型根据当前页面回答；
+        # 结果固定不变的任务可开启，重复运行时完全不调用模型
+        self.replay_done = replay_done
+        self._entries: Dict[str, Dict[str, Any]] = self._read()
+        self._recorded: Dict[int, List[Dict[str, Any]]] = {}
+        self.stats = {"hits": 0, "misses": 0, "diverged": 0, "replayed_actions": 0}
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp = self.path.with_suffix(".tmp")
+            temp.write_text(json.dumps(self._entries, ensure_ascii=False, indent=1), encoding="utf-8")
+            os.replace(temp, self.path)
+        except OSError:
+            # 缓存写不进去不影响本次运行
+            pass
+
+    @staticmethod
+    def key(task: str, start_url: str) -> str:
+        return hashlib.sha1(f"{start_url}\n{normalize_task(task)}".encode("utf-8")).hexdigest()[:16]
+
+    def lookup(self, task: str, start_url: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(self.key(task, start_url))
+
+    def store(self, task: str, start_url: str, actions: List[Dict[str, Any]]):
+        self._entries[self.key(task, start_url)] = {
+            "task": task,
+            "start_url": start_url,
+            "actions": actions,
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self._write()
+
+    def attach(self, agent):
+        """记录 Agent 执行成功的动作，需要在 page_guard.guard_page_changes 和 instrument_agent 之前调用"""
+        # 复制共享的默认 controller；之后的包装再复制时会带上这里替换的 act
+        controller = agent.controller = copy.copy(agent.controller)
+        act = controller.act
+        recorded = self._recorded[id(agent)] = []
+
+        async def recorded_act(action, browser_context, *args, **kwargs):
+            page = await browser_context.get_current_page()
+            url = page.url
+            element = None
+            index = action.get_index()
+            if index is not None:
+                selector_map = await browser_context.get_selector_map()
+                if index in selector_map:
+                    element = _element_record(selector_map[index])
+            result = await act(action, browser_context, *args, **kwargs)
+            if not result.error:
+                recorded.append({"url": url, "action": action.model_dump(exclude_unset=True), "element": element})
+            return result
+
+        controller.act = recorded_act
+        return agent
+
+    async def _replay(self, steps: _ReplaySteps, actions: List[Dict[str, Any]]) -> int:
+        """逐个重放缓存的动作，返回成功重放的动作数"""
+        agent = steps.agent
+        replayed = 0
+        for step, item in enumerate(actions, 1):
+            name = next(iter(item["action"]))
+            state = await agent.browser_context.get_state()
+            if not _same_page(state.url, item["url"]):
+                break
+            action = agent.ActionModel(**item["action"])
+            if item["element"] is not None:
+                element = HistoryTreeProcessor.find_history_element_in_tree(
+                    _history_element(item["element"]), state.element_tree
+                )
+                if element is None or element.highlight_index is None:
+                    break
+                action.set_index(element.highlight_index)
+
+            brain = AgentBrain(
+                page_summary="",
+                evaluation_previous_goal="Success",
+                memory=f"按缓存的成功轨迹重放第 {step}/{len(actions)} 个动作",
+                next_goal=name,
+            )
+            output = agent.AgentOutput(current_state=brain, action=[action])
+            steps.add_output(state, output)
+            result = await agent.controller.act(
+                action,
+                agent.browser_context,
+                agent.page_extraction_llm,
+                agent.sensitive_data,
+                agent.available_file_paths,
+            )
+            steps.finish(output, state, result)
+            if result.error:
+                break
+            replayed += 1
+        return replayed
+
+    async def run(self, agent, max_steps: int = 100) -> AgentHistoryList:
+        """有缓存时先重放，未完成的部分由 agent.run 继续；返回完整历史
+
+        当前 browser-use 版本缺少重放所需的接口时按未命中处理。
+        """
+        recorded = self._recorded.get(id(agent))
+        if recorded is None:
+            raise ValueError("需要先调用 TrajectoryCache.attach(agent)")
+        page = await agent.browser_context.get_current_page()
+        start_url = page.url
+        entry = self.lookup(agent.task, start_url)
+
+        steps = _ReplaySteps(agent)
+        replayed = 0
+        if entry is None or not steps.supported:
+            self.stats["misses"] += 1
+        else:
+            self.stats["hits"] += 1
+            actions = entry["actions"]
+            if not self.replay_done and actions and "done" in actions[-1]["action"]:
+                actions = actions[:-1]
+            replayed = await self._replay(steps, actions)
+            self.stats["replayed_actions"] += replayed
+            if replayed < len(actions):
+                self.stats["diverged"] += 1
+
+        try:
+            if agent.history.is_done():
+                history = agent.history
+                # agent.run 不再执行，由这里关闭 Agent 自己创建的浏览器
+                if not agent.injected_browser_context:
+                    await agent.browser_context.close()
+                if not agent.injected_browser and agent.browser:
+                    await agent.browser.close()
+            else:
+                history = await agent.run(max_steps=max(max_steps - replayed, 1))
+        finally:
+            self._recorded.pop(id(agent), None)
+
+        result = history.history[-1].result[-1] if history.history and history.history[-1].result else None
+        if history.is_done() and result is not None and not result.error:
+            self.store(agent.task, start_url, recorded)
+        return history
+
+    def summary(self) -> str:
+        stats = self.stats
+        return (
+            f"轨迹缓存：命中 {stats['hits']} 次（其中 {stats['diverged']} 次中途交给模型），"
+            f"未命中 {stats['misses']} 次，重放动作 {stats['replayed_actions']} 个"
+        )
+